@@ -109,6 +109,8 @@ class Dashboard {
         const etaText = card.querySelector('.eta-text');
         if (patient.eta_minutes) {
             etaText.textContent = `${patient.eta_minutes} min`;
+        } else if (patient.eta_status === 'pending') {
+            etaText.textContent = 'Calculating...';
         } else {
             etaText.textContent = 'Unknown';
         }
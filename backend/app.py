@@ -2,14 +2,51 @@ from flask import Flask
 from config import Config
 from models import db
 from routes.intake import intake_bp
+from routes.dashboard import dashboard_bp
+from routes.monitoring import monitoring_bp
+from routes.facilities import facilities_bp
+from services.database import database_tuning
+from services.triage_cache import triage_cache
+from services.triage_ruleset import ruleset_store
+from services.ticket_allocator import ticket_allocator
+from services.shadow_triage import shadow_evaluator
+from services.geocode_cache import geocode_cache
+from services.gazetteer import gazetteer
+from services.nominatim_client import nominatim_client
+from services.facility_registry import facility_registry
+from services.road_router import road_router
+from services.eta_grid import eta_grid
+from services.eta_enrichment import eta_enricher
+from services.position_tracker import position_tracker
+from services.spatial_index import spatial_index
 from flask_cors import CORS
+import threading
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
 
+# Engine options must be set before the engine is created
+database_tuning.init_app(app)
 db.init_app(app)
+with app.app_context():
+    database_tuning.tune_engine(db.engine)
+triage_cache.init_app(app)
+ruleset_store.init_app(app)
+ticket_allocator.init_app(app)
+shadow_evaluator.init_app(app)
+geocode_cache.init_app(app)
+gazetteer.init_app(app)
+nominatim_client.init_app(app)
+facility_registry.init_app(app)
+road_router.init_app(app)
+eta_grid.init_app(app)
+eta_enricher.init_app(app)
+position_tracker.init_app(app)
 app.register_blueprint(intake_bp)
+app.register_blueprint(dashboard_bp)
+app.register_blueprint(monitoring_bp)
+app.register_blueprint(facilities_bp)
 
 @app.route("/")
 def home():
@@ -18,6 +55,18 @@ def home():
 # Create database tables if they don't exist
 with app.app_context():
     db.create_all()
+    # Index car positions for map queries (R*Tree on SQLite)
+    spatial_index.install()
+    # Finish ETAs that were still being geocoded when the backend last stopped
+    eta_enricher.resume_pending()
+
+# Precompute road travel times to every facility without delaying startup
+threading.Thread(
+    target=road_router.warm,
+    args=([(f.lat, f.lng) for f in facility_registry.facilities],),
+    name="road-router-warm",
+    daemon=True
+).start()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Fill the car_lat/car_lng columns of existing patients from their stored car_location,
+and build the spatial index over them.
+
+Adds the columns if the database predates them, parses the JSON in car_location
+in batches, and installs the R*Tree (SQLite) with the triggers that keep it in
+sync. Safe to run more than once: only rows without coordinates are read.
+
+Examples:
+    python backfill_coordinates.py                    # GPS locations only
+    python backfill_coordinates.py --geocode-offline  # also addresses the gazetteer or geocode cache knows
+    python backfill_coordinates.py --batch-size 5000
+"""
+
+import sys
+import json
+import argparse
+
+from sqlalchemy import inspect, text
+
+
+def add_columns(db, model):
+    """Add car_lat/car_lng to the table if missing"""
+    columns = {c["name"] for c in inspect(db.engine).get_columns(model.__tablename__)}
+    with db.engine.begin() as connection:
+        for name in ("car_lat", "car_lng"):
+            if name not in columns:
+                print(f"Adding column: {name}")
+                connection.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {name} FLOAT"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill car coordinates and build the spatial index")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows read and updated per transaction (default: 1000)")
+    parser.add_argument("--geocode-offline", action="store_true",
+                        help="Resolve text addresses through the gazetteer and geocode cache (never the network)")
+    args = parser.parse_args()
+
+    from app import app
+    from models import db, PatientIntake
+    from services.eta_engine import parse_coordinates
+    from services.eta_service import ETAService
+    from services.spatial_index import spatial_index
+
+    with app.app_context():
+        add_columns(db, PatientIntake)
+        eta_service = ETAService() if args.geocode_offline else None
+
+        last_id = 0
+        scanned = updated = 0
+        while True:
+            rows = PatientIntake.query.with_entities(PatientIntake.id, PatientIntake.car_location).filter(
+                PatientIntake.id > last_id,
+                PatientIntake.car_lat.is_(None),
+                PatientIntake.car_location.isnot(None)
+            ).order_by(PatientIntake.id).limit(args.batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            mappings = []
+            for intake_id, car_location in rows:
+                coordinates = parse_coordinates(car_location)
+                if coordinates is None and eta_service is not None:
+                    coordinates = _offline_coordinates(eta_service, car_location)
+                if coordinates is not None:
+                    mappings.append({"id": intake_id, "car_lat": coordinates[0], "car_lng": coordinates[1]})
+
+            if mappings:
+                db.session.bulk_update_mappings(PatientIntake, mappings)
+                db.session.commit()
+                updated += len(mappings)
+            print(f"Scanned {scanned} rows, filled {updated}")
+
+        if spatial_index.install():
+            print("R*Tree spatial index is up to date")
+        elif db.engine.dialect.name == "sqlite":
+            print(f"R*Tree not available ({spatial_index.error}); map queries will filter on the columns")
+
+    print(f"Backfill completed: {updated} of {scanned} rows have coordinates")
+    return 0
+
+
+def _offline_coordinates(eta_service, car_location):
+    try:
+        location = json.loads(car_location)
+    except (json.JSONDecodeError, TypeError):
+        location = {"address": car_location}
+    address = location.get("address") if isinstance(location, dict) else None
+    if not address or not address.strip():
+        return None
+    resolved, coordinates = eta_service.geocode_offline(address.strip())
+    return coordinates if resolved else None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
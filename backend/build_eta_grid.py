@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Precompute the ETA grid used by services/eta_grid.py.
+
+The service area is the bounding box of all facilities plus --radius-km, cut
+into square cells of --cell-degrees. For every facility and time-of-day band,
+the ETA from each cell centre is computed with ETAService.calculate_etas (over
+the road graph when one is built, otherwise the straight-line estimate) and
+stored as uint16 minutes in a .npy file that the backend memory-maps.
+
+Examples:
+    python build_eta_grid.py                                   # writes data/eta_grid.npy and .json
+    python build_eta_grid.py --cell-degrees 0.0025 --radius-km 30
+    python build_eta_grid.py --band peak_am:6-9:1.5 --band peak_pm:16-19:1.4
+
+Rebuild the grid whenever facilities, the road graph or AVERAGE_DRIVING_SPEED_KMH change.
+"""
+
+import sys
+import json
+import math
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from services.eta_grid import DEFAULT_GRID_PATH, NO_ETA, metadata_path
+
+
+def parse_band(value):
+    """A NAME:START-END:FACTOR time band, e.g. peak_am:6-9:1.5 (hours, server local time)"""
+    try:
+        name, hours, factor = value.split(":")
+        start, end = (int(hour) for hour in hours.split("-"))
+        factor = float(factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME:START-END:FACTOR, got {value!r}")
+    if not (0 <= start < 24 and 0 <= end <= 24) or factor <= 0:
+        raise argparse.ArgumentTypeError(f"invalid hours or factor in {value!r}")
+    return {"name": name, "start": start, "end": end, "factor": factor}
+
+
+def build_grid(eta_service, facilities, cell_degrees, radius_km, bands):
+    """
+    Compute the grid
+
+    Returns:
+        (uint16 array of shape (facilities, bands, rows, cols), metadata dict)
+    """
+    margin_lat = radius_km / 111.32
+    min_lat = min(f.lat for f in facilities) - margin_lat
+    max_lat = max(f.lat for f in facilities) + margin_lat
+    margin_lng = radius_km / (111.32 * max(0.1, math.cos(math.radians(max(abs(min_lat), abs(max_lat))))))
+    min_lng = min(f.lng for f in facilities) - margin_lng
+    max_lng = max(f.lng for f in facilities) + margin_lng
+
+    rows = int(math.ceil((max_lat - min_lat) / cell_degrees))
+    cols = int(math.ceil((max_lng - min_lng) / cell_degrees))
+    centre_lats = np.repeat(min_lat + (np.arange(rows) + 0.5) * cell_degrees, cols)
+    centre_lngs = np.tile(min_lng + (np.arange(cols) + 0.5) * cell_degrees, rows)
+
+    grid = np.full((len(facilities), len(bands), rows, cols), NO_ETA, dtype=np.uint16)
+    for index, facility in enumerate(facilities):
+        print(f"  {facility.code}: {rows * cols} cells")
+        minutes = eta_service.calculate_etas(centre_lats, centre_lngs, facility.lat, facility.lng)
+        for band_index, band in enumerate(bands):
+            scaled = np.clip(np.floor(minutes * band["factor"]), 1, 480)
+            grid[index, band_index] = scaled.reshape(rows, cols).astype(np.uint16)
+
+    meta = {
+        "min_lat": min_lat,
+        "min_lng": min_lng,
+        "cell_degrees": cell_degrees,
+        "rows": rows,
+        "cols": cols,
+        "facilities": [{"code": f.code, "lat": f.lat, "lng": f.lng} for f in facilities],
+        "bands": bands,
+        "average_speed_kmh": eta_service.average_speed,
+        "road_graph": bool(eta_service.router is not None and eta_service.router.available),
+        "built_at": datetime.utcnow().isoformat()
+    }
+    return grid, meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the ETA grid around the facilities")
+    parser.add_argument("--output", default=DEFAULT_GRID_PATH, help=f"Grid file to write (default: {DEFAULT_GRID_PATH})")
+    parser.add_argument("--cell-degrees", type=float, default=0.005, help="Cell size in degrees (default: 0.005, about 500 m)")
+    parser.add_argument("--radius-km", type=float, default=40, help="Service area around the facilities (default: 40 km)")
+    parser.add_argument("--band", action="append", type=parse_band, default=[],
+                        help="Time-of-day band NAME:START-END:FACTOR, repeatable (other hours use factor 1)")
+    args = parser.parse_args()
+
+    from app import app
+    from services.eta_service import ETAService
+    from services.facility_registry import facility_registry
+
+    with app.app_context():
+        facilities = facility_registry.facilities
+        if not facilities:
+            print("No facilities configured")
+            return 1
+        # Never read the grid being rebuilt
+        eta_service = ETAService(eta_grid=None)
+        if eta_service.router is not None and eta_service.router.available:
+            print("Routing over the road graph")
+            eta_service.router.warm([(f.lat, f.lng) for f in facilities])
+        else:
+            print("No road graph; using the straight-line estimate")
+
+        bands = [{"name": "default", "factor": 1.0}] + args.band
+        print(f"Building {len(facilities)} facilities x {len(bands)} time bands")
+        grid, meta = build_grid(eta_service, facilities, args.cell_degrees, args.radius_km, bands)
+
+    np.save(args.output, grid)
+    with open(metadata_path(args.output), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"Wrote {grid.shape} grid ({grid.nbytes / 1e6:.1f} MB) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
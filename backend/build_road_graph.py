@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Build the offline road graph used by services/road_router.py from an OSM XML extract.
+
+Download an extract of the area the hospitals serve (e.g. from
+https://download.geofabrik.de or the Overpass API), then:
+
+Examples:
+    python build_road_graph.py gauteng.osm                     # writes data/road_graph.npz
+    python build_road_graph.py gauteng.osm --output graph.npz --bbox -26.6 27.6 -25.6 28.6
+
+Only ways with a drivable highway tag are kept. Each way's speed comes from its
+maxspeed tag, or from the default for its highway type. Oneway tags and
+roundabouts are honoured. The graph is stored as CSR arrays (indptr, indices,
+travel_seconds) plus node coordinates in a compressed .npz file.
+"""
+
+import re
+import sys
+import argparse
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from services.road_router import DEFAULT_GRAPH_PATH, HIGHWAY_SPEEDS_KMH, haversine_km
+
+MPH_TO_KMH = 1.609344
+
+
+def parse_maxspeed(value, default):
+    """Speed in km/h from an OSM maxspeed tag ("60", "60 km/h", "40 mph"), or default"""
+    if not value:
+        return default
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", value)
+    if not match:
+        return default
+    speed = float(match.group(1)) * (MPH_TO_KMH if match.group(2) else 1)
+    return speed if speed > 0 else default
+
+
+def direction(tags):
+    """1 for oneway, -1 for oneway against the node order, 0 for both ways"""
+    oneway = tags.get("oneway", "")
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway == "no":
+        return 0
+    if tags.get("highway") in ("motorway", "motorway_link") or tags.get("junction") in ("roundabout", "circular"):
+        return 1
+    return 0
+
+
+def read_osm(path, bbox=None):
+    """
+    Stream an OSM XML file
+
+    Returns:
+        (node coordinates by OSM id, list of (node ids, speed km/h, direction) per drivable way)
+    """
+    coordinates = {}
+    ways = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            lat, lng = float(element.get("lat")), float(element.get("lon"))
+            if bbox is None or (bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]):
+                coordinates[int(element.get("id"))] = (lat, lng)
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            highway = tags.get("highway")
+            if highway in HIGHWAY_SPEEDS_KMH and tags.get("access") not in ("no", "private"):
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                speed = parse_maxspeed(tags.get("maxspeed"), HIGHWAY_SPEEDS_KMH[highway])
+                ways.append((refs, speed, direction(tags)))
+            element.clear()
+        elif element.tag == "relation":
+            element.clear()
+    return coordinates, ways
+
+
+def build_graph(coordinates, ways):
+    """
+    Turn ways into a CSR graph over the nodes they use
+
+    Returns:
+        Dict of arrays ready for np.savez_compressed
+    """
+    index = {}
+    sources, targets, seconds = [], [], []
+    max_speed = 0.0
+    for refs, speed, way_direction in ways:
+        max_speed = max(max_speed, speed)
+        for a, b in zip(refs, refs[1:]):
+            if a not in coordinates or b not in coordinates:
+                continue
+            u = index.setdefault(a, len(index))
+            v = index.setdefault(b, len(index))
+            travel = haversine_km(*coordinates[a], *coordinates[b]) / speed * 3600
+            if way_direction >= 0:
+                sources.append(u)
+                targets.append(v)
+                seconds.append(travel)
+            if way_direction <= 0:
+                sources.append(v)
+                targets.append(u)
+                seconds.append(travel)
+
+    n = len(index)
+    node_lat = np.empty(n, dtype=np.float64)
+    node_lng = np.empty(n, dtype=np.float64)
+    for osm_id, i in index.items():
+        node_lat[i], node_lng[i] = coordinates[osm_id]
+
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    seconds = np.asarray(seconds, dtype=np.float32)
+    # Sort edges by source (then target, then time) and keep the fastest of parallel edges
+    order = np.lexsort((seconds, targets, sources))
+    sources, targets, seconds = sources[order], targets[order], seconds[order]
+    if len(sources):
+        keep = np.ones(len(sources), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, seconds = sources[keep], targets[keep], seconds[keep]
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return {
+        "node_lat": node_lat,
+        "node_lng": node_lng,
+        "indptr": indptr,
+        "indices": targets,
+        "travel_seconds": seconds,
+        "max_speed_kmh": np.float64(max_speed or 130.0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline road graph from an OSM XML extract")
+    parser.add_argument("osm", help="OSM XML file (.osm)")
+    parser.add_argument("--output", default=DEFAULT_GRAPH_PATH, help=f"Graph file to write (default: {DEFAULT_GRAPH_PATH})")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LNG", "MAX_LAT", "MAX_LNG"),
+                        help="Only keep nodes inside this box")
+    args = parser.parse_args()
+
+    print(f"Reading {args.osm}...")
+    try:
+        coordinates, ways = read_osm(args.osm, args.bbox)
+    except (OSError, ET.ParseError) as e:
+        print(f"Could not read {args.osm}: {e}")
+        return 1
+    print(f"Found {len(ways)} drivable ways over {len(coordinates)} nodes")
+
+    graph = build_graph(coordinates, ways)
+    np.savez_compressed(args.output, **graph)
+    print(f"Wrote {len(graph['node_lat'])} nodes and {len(graph['indices'])} edges to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the eta_status column used by background ETA enrichment
+"""
+
+import sqlite3
+from pathlib import Path
+
+from config import Config
+from services.database import sqlite_path
+
+# What to do instead when DATABASE_URL points at a server database
+SERVER_HINT = "On a server database run: ALTER TABLE patient_intake ADD COLUMN eta_status VARCHAR(20)"
+
+def migrate_database():
+    """Add eta_status to the patient_intake table"""
+    
+    path = sqlite_path(Config.SQLALCHEMY_DATABASE_URI)
+    if path is None:
+        print(f"DATABASE_URL is not a SQLite file and this script only migrates SQLite. {SERVER_HINT}")
+        return
+    db_path = Path(path)
+    
+    if not db_path.exists():
+        print("Database doesn't exist yet. It will be created when you start the Flask app.")
+        return
+    
+    print(f"Migrating database: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(str(db_path))
+        cursor = conn.cursor()
+        
+        cursor.execute("PRAGMA table_info(patient_intake)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if "eta_status" not in columns:
+            print("Adding column: eta_status")
+            cursor.execute("ALTER TABLE patient_intake ADD COLUMN eta_status VARCHAR(20)")
+            # Existing ETAs were calculated synchronously at intake
+            cursor.execute("UPDATE patient_intake SET eta_status = 'calculated' WHERE eta_minutes IS NOT NULL")
+            print(f"Marked {cursor.rowcount} existing ETAs as calculated")
+        else:
+            print("Column eta_status already exists")
+        
+        conn.commit()
+        print("Migration completed successfully!")
+        
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the dashboard indexes declared in models.py to an existing database
+
+The backend can keep running: each index is built in its own short transaction,
+so intakes are only held up while one index is being built, and readers are
+never blocked in WAL mode. Indexes that already exist are skipped, so the script
+can be re-run after an interruption.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+
+from config import Config
+from models import PatientIntake, MoodEntry
+from services.database import sqlite_path
+
+# What to do instead when DATABASE_URL points at a server database
+SERVER_HINT = "On PostgreSQL create the indexes declared in models.py with CREATE INDEX CONCURRENTLY"
+
+# Wait this long for a concurrent write to finish before giving up on an index
+BUSY_TIMEOUT_SECONDS = 30
+
+def migrate_database():
+    """Create every index declared on PatientIntake and MoodEntry that is missing"""
+
+    path = sqlite_path(Config.SQLALCHEMY_DATABASE_URI)
+    if path is None:
+        print(f"DATABASE_URL is not a SQLite file and this script only migrates SQLite. {SERVER_HINT}")
+        return
+    db_path = Path(path)
+
+    if not db_path.exists():
+        print("Database doesn't exist yet. It will be created when you start the Flask app.")
+        return
+
+    print(f"Migrating database: {db_path}")
+
+    try:
+        conn = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        cursor = conn.cursor()
+
+        for model in (PatientIntake, MoodEntry):
+            table = model.__table__
+            cursor.execute(f"PRAGMA index_list({table.name})")
+            existing = {row[1] for row in cursor.fetchall()}
+            cursor.execute(f"PRAGMA table_info({table.name})")
+            columns_present = {row[1] for row in cursor.fetchall()}
+
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    print(f"Index {index.name} already exists")
+                    continue
+                missing = [column.name for column in index.columns if column.name not in columns_present]
+                if missing:
+                    print(f"Skipping {index.name}: column {missing[0]} is missing (run the other migrate_*.py scripts first)")
+                    continue
+                columns = ", ".join(column.name for column in index.columns)
+                print(f"Creating index: {index.name} ({columns})")
+                started = time.perf_counter()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=sqlite.dialect())))
+                cursor.execute("COMMIT")
+                print(f"  built in {time.perf_counter() - started:.2f}s")
+
+        print("Migration completed successfully!")
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Database migration script to add the position_at column that stops worker
+processes from writing an older GPS fix over a newer one
+"""
+
+import sqlite3
+from pathlib import Path
+
+from config import Config
+from services.database import sqlite_path
+
+# What to do instead when DATABASE_URL points at a server database
+SERVER_HINT = "On a server database run: ALTER TABLE patient_intake ADD COLUMN position_at TIMESTAMP"
+
+def migrate_database():
+    """Add position_at to the patient_intake table"""
+    
+    path = sqlite_path(Config.SQLALCHEMY_DATABASE_URI)
+    if path is None:
+        print(f"DATABASE_URL is not a SQLite file and this script only migrates SQLite. {SERVER_HINT}")
+        return
+    db_path = Path(path)
+    
+    if not db_path.exists():
+        print("Database doesn't exist yet. It will be created when you start the Flask app.")
+        return
+    
+    print(f"Migrating database: {db_path}")
+    
+    try:
+        conn = sqlite3.connect(str(db_path))
+        cursor = conn.cursor()
+        
+        cursor.execute("PRAGMA table_info(patient_intake)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if "position_at" not in columns:
+            # Existing positions have no fix time, so any new fix may replace them
+            print("Adding column: position_at")
+            cursor.execute("ALTER TABLE patient_intake ADD COLUMN position_at DATETIME")
+        else:
+            print("Column position_at already exists")
+        
+        conn.commit()
+        print("Migration completed successfully!")
+        
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+if __name__ == "__main__":
+    migrate_database()
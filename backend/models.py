@@ -13,7 +13,12 @@ class PatientIntake(db.Model):
     symptoms = db.Column(db.Text, nullable=False)
     arrival_mode = db.Column(db.String(50), nullable=False)
     car_location = db.Column(db.String(200))
+    car_lat = db.Column(db.Float)  # Car position (GPS or geocoded address), indexed by services/spatial_index.py
+    car_lng = db.Column(db.Float)
+    position_at = db.Column(db.DateTime)  # Time of the live GPS fix in car_lat/car_lng; older fixes are never written over it
     eta_minutes = db.Column(db.Integer)
+    eta_status = db.Column(db.String(20))  # pending (geocoding in the background), calculated or failed
+    facility_code = db.Column(db.String(20))  # Facility the patient was routed to (lowest ETA)
     
     # Pregnancy-specific fields
     is_pregnant = db.Column(db.Boolean, default=False)
@@ -36,6 +41,20 @@ class PatientIntake(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Indexes behind the dashboard filters and sorts (checked by test_query_plans.py;
+    # add them to existing databases with migrate_indexes.py)
+    __table_args__ = (
+        db.Index('ix_patient_intake_color_code_created_at', 'color_code', 'created_at'),
+        db.Index('ix_patient_intake_trimester_color_code', 'trimester', 'color_code'),
+        db.Index('ix_patient_intake_facility_code_created_at', 'facility_code', 'created_at'),
+        db.Index('ix_patient_intake_created_at', 'created_at'),
+        db.Index('ix_patient_intake_updated_at', 'updated_at'),
+        db.Index('ix_patient_intake_pregnancy_week', 'pregnancy_week'),
+        db.Index('ix_patient_intake_eta_minutes', 'eta_minutes'),
+        db.Index('ix_patient_intake_eta_status', 'eta_status'),
+        db.Index('ix_patient_intake_age', 'age'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -45,7 +64,11 @@ class PatientIntake(db.Model):
             'symptoms': self.symptoms,
             'arrival_mode': self.arrival_mode,
             'car_location': self.car_location,
+            'car_lat': self.car_lat,
+            'car_lng': self.car_lng,
             'eta_minutes': self.eta_minutes,
+            'eta_status': self.eta_status,
+            'facility_code': self.facility_code,
             'is_pregnant': self.is_pregnant,
             'pregnancy_week': self.pregnancy_week,
             'trimester': self.trimester,
@@ -78,6 +101,11 @@ class MoodEntry(db.Model):
     # Relationship
     patient = db.relationship('PatientIntake', backref=db.backref('mood_entries', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_mood_entries_date', 'date'),
+        db.Index('ix_mood_entries_patient_id_date', 'patient_id', 'date'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -89,3 +117,11 @@ class MoodEntry(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+class TicketSequence(db.Model):
+    __tablename__ = 'ticket_sequence'
+    
+    # One row per ticket prefix (R, Y, G, REG) per day; next_value is the first unreserved number
+    prefix = db.Column(db.String(5), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
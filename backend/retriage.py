@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Re-score every stored PatientIntake with the current (or a candidate) triage ruleset.
+
+Rows are streamed in fixed-size chunks, classified across a process pool and
+written back with one batched update per chunk. Progress is checkpointed after
+every committed chunk so an interrupted run can be resumed with --resume.
+
+Examples:
+    python retriage.py --dry-run                      # report tickets that would move
+    python retriage.py --ruleset candidate.json --dry-run --diff-output moves.jsonl
+    python retriage.py --workers 4 --chunk-size 1000  # re-score and write back
+    python retriage.py --resume                       # continue an interrupted run
+"""
+
+import os
+import sys
+import json
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retriage_checkpoint.json")
+
+# Per-process classifier, created once by the pool initializer
+_worker_classifier = None
+
+
+def _init_worker(ruleset_path):
+    """Compile the ruleset once per worker process"""
+    global _worker_classifier
+    from services.emergency_classifier import EmergencyClassifier
+    from services.triage_ruleset import TriageRuleset
+
+    _worker_classifier = EmergencyClassifier(ruleset=TriageRuleset.load(ruleset_path))
+
+
+def _classify_chunk(rows):
+    """
+    Classify one chunk of rows in a worker process
+
+    Args:
+        rows: List of (id, symptoms, age, pregnancy_week, trimester, risk_conditions) tuples
+
+    Returns:
+        List of (id, severity_level, color_code, ai_analysis_json) tuples
+    """
+    results = []
+    for intake_id, symptoms, age, pregnancy_week, trimester, risk_conditions in rows:
+        result = _worker_classifier.assess(symptoms or "", age or 0, risk_conditions, pregnancy_week, trimester)
+        results.append((intake_id, result.severity, result.color_code, result.to_json()))
+    return results
+
+
+def load_checkpoint(path):
+    """
+    Return (last committed intake id, ruleset version) from the checkpoint file,
+    or (0, None) when there is none
+    """
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        return int(checkpoint.get("last_id", 0)), checkpoint.get("ruleset_version")
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 0, None
+
+
+def save_checkpoint(path, last_id, ruleset_version):
+    """Atomically record progress so an interrupted run can resume after last_id"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": last_id, "ruleset_version": ruleset_version}, f)
+    os.replace(tmp_path, path)
+
+
+def _stored_risk_conditions(ai_analysis):
+    """Risk conditions recorded with the original triage, if any"""
+    if not ai_analysis:
+        return [], False
+    try:
+        analysis = json.loads(ai_analysis)
+    except (json.JSONDecodeError, TypeError):
+        return [], False
+    if not isinstance(analysis, dict):
+        return [], False
+    # Registration-only rows were never triaged and keep their placeholder classification
+    if analysis.get("form_type"):
+        return [], True
+    return analysis.get("risk_conditions") or [], False
+
+
+def retriage(app, ruleset_path, chunk_size=500, workers=None, dry_run=False,
+             checkpoint_path=DEFAULT_CHECKPOINT, resume=False, diff_output=None):
+    """
+    Re-score stored intakes and report (and unless dry_run, write back) the changes
+
+    Returns:
+        Counter of severity transitions such as "G->Y"
+
+    Raises:
+        ValueError: If resuming a run that was started with a different ruleset version
+    """
+    from models import db, PatientIntake
+    from services.triage_ruleset import TriageRuleset
+
+    ruleset = TriageRuleset.load(ruleset_path)
+    start_after, checkpoint_version = load_checkpoint(checkpoint_path) if resume else (0, None)
+    if start_after and checkpoint_version != ruleset.version:
+        # Finishing the run with other rules would leave it scored by two rulesets
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} was written with ruleset {checkpoint_version}, not {ruleset.version}; "
+            f"re-run without --resume to re-score everything with {ruleset.version}"
+        )
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+
+    transitions = Counter()
+    scanned = 0
+    diff_file = open(diff_output, "w") if diff_output else None
+
+    print(f"Re-triaging with ruleset {ruleset.version} from {ruleset_path}")
+    if start_after:
+        print(f"Resuming after intake id {start_after}")
+
+    with app.app_context():
+        columns = db.session.query(
+            PatientIntake.id, PatientIntake.symptoms, PatientIntake.age,
+            PatientIntake.pregnancy_week, PatientIntake.trimester,
+            PatientIntake.ticket_number, PatientIntake.severity_level,
+            PatientIntake.color_code, PatientIntake.ai_analysis
+        )
+
+        def stored_rows():
+            """
+            Every row after start_after in id order, read one page at a time
+
+            Each page is fetched in full before any chunk is committed, so no
+            cursor is left open across the write-back commits.
+            """
+            last_id = start_after
+            while True:
+                page = columns.filter(PatientIntake.id > last_id).order_by(PatientIntake.id).limit(chunk_size).all()
+                yield from page
+                if len(page) < chunk_size:
+                    return
+                last_id = page[-1].id
+
+        def apply(chunk_meta, results):
+            """Report and write back one classified chunk, in id order"""
+            nonlocal scanned
+            updates = []
+            for intake_id, severity_level, color_code, ai_analysis in results:
+                ticket_number, old_severity, old_color = chunk_meta[intake_id]
+                scanned += 1
+                if old_color != color_code:
+                    transitions[f"{old_color}->{color_code}"] += 1
+                    line = f"#{intake_id} {ticket_number}: {old_color} -> {color_code} ({old_severity} -> {severity_level})"
+                    if dry_run:
+                        print(line)
+                    if diff_file:
+                        diff_file.write(json.dumps({
+                            "id": intake_id, "ticket_number": ticket_number,
+                            "from": old_color, "to": color_code,
+                            "from_severity": old_severity, "to_severity": severity_level
+                        }) + "\n")
+                updates.append({
+                    "id": intake_id,
+                    "severity_level": severity_level,
+                    "color_code": color_code,
+                    "ai_analysis": ai_analysis
+                })
+
+            if not dry_run and updates:
+                db.session.bulk_update_mappings(PatientIntake, updates)
+                db.session.commit()
+                save_checkpoint(checkpoint_path, updates[-1]["id"], ruleset.version)
+
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ruleset_path,)) as pool:
+            rows, chunk_meta = [], {}
+            for row in stored_rows():
+                risk_conditions, registration_only = _stored_risk_conditions(row.ai_analysis)
+                if registration_only:
+                    continue
+                rows.append((row.id, row.symptoms, row.age, row.pregnancy_week, row.trimester, risk_conditions))
+                chunk_meta[row.id] = (row.ticket_number, row.severity_level, row.color_code)
+
+                if len(rows) >= chunk_size:
+                    pending.append((chunk_meta, pool.submit(_classify_chunk, rows)))
+                    rows, chunk_meta = [], {}
+                    # Keep a bounded number of chunks in flight so memory stays flat
+                    while len(pending) >= max_in_flight:
+                        meta, future = pending.popleft()
+                        apply(meta, future.result())
+
+            if rows:
+                pending.append((chunk_meta, pool.submit(_classify_chunk, rows)))
+            while pending:
+                meta, future = pending.popleft()
+                apply(meta, future.result())
+
+    if diff_file:
+        diff_file.close()
+
+    print(f"\nScanned {scanned} intakes, {sum(transitions.values())} would move" if dry_run
+          else f"\nRe-scored {scanned} intakes, {sum(transitions.values())} moved")
+    for transition, count in sorted(transitions.items()):
+        print(f"  {transition}: {count}")
+
+    if not dry_run and os.path.exists(checkpoint_path):
+        # A completed run starts from the beginning next time
+        os.remove(checkpoint_path)
+
+    return transitions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored intakes with a triage ruleset")
+    parser.add_argument("--ruleset", help="Ruleset file to score with (default: the configured ruleset)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Rows per chunk (default: 500)")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="Report tickets that would move without writing")
+    parser.add_argument("--diff-output", help="Write every moved ticket as JSON lines to this file")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file for resuming")
+    parser.add_argument("--resume", action="store_true", help="Continue after the last checkpointed id")
+    args = parser.parse_args(argv)
+
+    from app import app
+
+    try:
+        retriage(
+            app,
+            ruleset_path=args.ruleset or app.config["TRIAGE_RULESET_PATH"],
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            checkpoint_path=args.checkpoint,
+            resume=args.resume,
+            diff_output=args.diff_output
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
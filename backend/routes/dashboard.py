@@ -1,65 +1,38 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from models import db, PatientIntake
+from services.eta_engine import ETAEngine
+from services.position_tracker import position_tracker
+from services.spatial_index import spatial_index
+from services.dashboard_stats import DashboardStats
 from datetime import datetime, timedelta
 import json
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
+MAX_MAP_RESULTS = 1000
+
 # Get dashboard statistics
 @dashboard_bp.route("/dashboard/stats", methods=["GET"])
 def get_dashboard_stats():
     try:
-        # Get counts by severity level
-        critical_count = PatientIntake.query.filter_by(color_code='R').count()
-        urgent_count = PatientIntake.query.filter_by(color_code='Y').count()
-        normal_count = PatientIntake.query.filter_by(color_code='G').count()
-        total_count = PatientIntake.query.count()
-        
-        # Get recent patients (last 24 hours)
-        last_24_hours = datetime.utcnow() - timedelta(hours=24)
-        recent_count = PatientIntake.query.filter(PatientIntake.created_at >= last_24_hours).count()
-        
-        # Get patients with ETA information
-        eta_count = PatientIntake.query.filter(PatientIntake.eta_minutes.isnot(None)).count()
-        
-        # Pregnancy-specific metrics
-        first_trimester_count = PatientIntake.query.filter_by(trimester='First').count()
-        second_trimester_count = PatientIntake.query.filter_by(trimester='Second').count()
-        third_trimester_count = PatientIntake.query.filter_by(trimester='Third').count()
-        
-        # High-risk pregnancy indicators
-        high_risk_count = PatientIntake.query.filter(
-            db.or_(
-                PatientIntake.previous_pregnancies > 3,
-                PatientIntake.pregnancy_complications.isnot(None),
-                db.and_(PatientIntake.age < 18, PatientIntake.is_pregnant == True),
-                db.and_(PatientIntake.age > 35, PatientIntake.is_pregnant == True)
-            )
-        ).count()
-        
-        # Emergency cases by trimester
-        critical_first_trimester = PatientIntake.query.filter(
-            db.and_(PatientIntake.color_code == 'R', PatientIntake.trimester == 'First')
-        ).count()
-        critical_third_trimester = PatientIntake.query.filter(
-            db.and_(PatientIntake.color_code == 'R', PatientIntake.trimester == 'Third')
-        ).count()
+        # Every count in one pass over the table
+        counts = DashboardStats().counts()
         
         stats = {
-            "critical": critical_count,
-            "urgent": urgent_count,
-            "normal": normal_count,
-            "total": total_count,
-            "recent_24h": recent_count,
-            "with_eta": eta_count,
+            "critical": counts["critical"],
+            "urgent": counts["urgent"],
+            "normal": counts["normal"],
+            "total": counts["total"],
+            "recent_24h": counts["recent_24h"],
+            "with_eta": counts["with_eta"],
             # Pregnancy-specific metrics
             "pregnancy_stats": {
-                "first_trimester": first_trimester_count,
-                "second_trimester": second_trimester_count,
-                "third_trimester": third_trimester_count,
-                "high_risk_pregnancies": high_risk_count,
-                "critical_first_trimester": critical_first_trimester,
-                "critical_third_trimester": critical_third_trimester
+                "first_trimester": counts["first_trimester"],
+                "second_trimester": counts["second_trimester"],
+                "third_trimester": counts["third_trimester"],
+                "high_risk_pregnancies": counts["high_risk"],
+                "critical_first_trimester": counts["critical_first_trimester"],
+                "critical_third_trimester": counts["critical_third_trimester"]
             },
             "last_updated": datetime.utcnow().isoformat()
         }
@@ -75,6 +48,7 @@ def get_dashboard_patients():
     try:
         # Get query parameters
         severity = request.args.get('severity', 'all')
+        facility = request.args.get('facility')
         limit = request.args.get('limit', 50, type=int)
         offset = request.args.get('offset', 0, type=int)
         sort_by = request.args.get('sort_by', 'created_at')
@@ -92,6 +66,10 @@ def get_dashboard_patients():
             elif severity == 'normal':
                 query = query.filter_by(color_code='G')
         
+        # Filter by the facility patients were routed to
+        if facility:
+            query = query.filter_by(facility_code=facility)
+        
         # Apply sorting
         if sort_by == 'created_at':
             if sort_order == 'desc':
@@ -142,6 +120,8 @@ def get_dashboard_patients():
                 "arrival_mode": p.arrival_mode,
                 "car_location": car_location,
                 "eta_minutes": p.eta_minutes,
+                "eta_status": p.eta_status,
+                "facility_code": p.facility_code,
                 # Pregnancy-specific fields
                 "is_pregnant": p.is_pregnant,
                 "pregnancy_week": p.pregnancy_week,
@@ -202,6 +182,8 @@ def get_patient_details(patient_id):
             "arrival_mode": patient.arrival_mode,
             "car_location": car_location,
             "eta_minutes": patient.eta_minutes,
+            "eta_status": patient.eta_status,
+            "facility_code": patient.facility_code,
             # Pregnancy-specific fields
             "is_pregnant": patient.is_pregnant,
             "pregnancy_week": patient.pregnancy_week,
@@ -244,6 +226,66 @@ def update_patient_status(patient_id):
     except Exception as e:
         return jsonify({"error": f"Failed to update patient status: {str(e)}"}), 500
 
+# Recompute the ETA of every patient en route (e.g. after the driving speed changes)
+@dashboard_bp.route("/dashboard/etas/recompute", methods=["POST"])
+def recompute_etas():
+    try:
+        window_hours = current_app.config.get('EN_ROUTE_WINDOW_HOURS', 6)
+        # Patients with live pings keep the tracker's ETA
+        result = ETAEngine().recompute_en_route(window_hours, skip_ids=position_tracker.tracked_ids())
+        return jsonify({"message": "ETAs recomputed", **result}), 200
+    except Exception as e:
+        return jsonify({"error": f"Failed to recompute ETAs: {str(e)}"}), 500
+
+# Patients en route inside a map area: a bounding box (min_lat, min_lng, max_lat, max_lng)
+# or a circle (lat, lng, radius_km)
+@dashboard_bp.route("/dashboard/map", methods=["GET"])
+def get_map_patients():
+    try:
+        if "radius_km" in request.args:
+            lat = float(request.args["lat"])
+            lng = float(request.args["lng"])
+            radius_km = float(request.args["radius_km"])
+            if radius_km <= 0:
+                return jsonify({"error": "radius_km must be positive"}), 400
+            query = spatial_index.within_radius(lat, lng, radius_km)
+        else:
+            min_lat, min_lng, max_lat, max_lng = (
+                float(request.args[key]) for key in ("min_lat", "min_lng", "max_lat", "max_lng")
+            )
+            if min_lat > max_lat or min_lng > max_lng:
+                return jsonify({"error": "min_lat/min_lng must not exceed max_lat/max_lng"}), 400
+            query = spatial_index.within_box(min_lat, min_lng, max_lat, max_lng)
+        hours = float(request.args.get("hours", current_app.config.get('EN_ROUTE_WINDOW_HOURS', 6)))
+        limit = min(int(request.args.get("limit", MAX_MAP_RESULTS)), MAX_MAP_RESULTS)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Give min_lat, min_lng, max_lat and max_lng, or lat, lng and radius_km"}), 400
+
+    try:
+        since = datetime.utcnow() - timedelta(hours=hours)
+        patients = query.filter(PatientIntake.created_at >= since).order_by(
+            PatientIntake.eta_minutes.asc()
+        ).limit(limit).all()
+
+        result = []
+        for p in patients:
+            result.append({
+                "id": p.id,
+                "name": p.name,
+                "ticket_number": p.ticket_number,
+                "color_code": p.color_code,
+                "severity_level": p.severity_level,
+                "lat": p.car_lat,
+                "lng": p.car_lng,
+                "eta_minutes": p.eta_minutes,
+                "facility_code": p.facility_code
+            })
+
+        return jsonify({"patients": result, "count": len(result)}), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Failed to get map patients: {str(e)}"}), 500
+
 # Get real-time updates (for polling)
 @dashboard_bp.route("/dashboard/updates", methods=["GET"])
 def get_dashboard_updates():
@@ -258,10 +300,13 @@ def get_dashboard_updates():
         else:
             since_datetime = datetime.utcnow() - timedelta(minutes=5)
         
-        # Get patients created or updated since the timestamp
+        # Get patients created or updated (e.g. an ETA filled in later) since the timestamp.
+        # Sorted here: an ORDER BY would make SQLite walk the created_at index instead of
+        # combining the created_at and updated_at indexes for the OR.
         patients = PatientIntake.query.filter(
-            PatientIntake.created_at >= since_datetime
-        ).order_by(PatientIntake.created_at.desc()).all()
+            db.or_(PatientIntake.created_at >= since_datetime, PatientIntake.updated_at >= since_datetime)
+        ).all()
+        patients.sort(key=lambda p: p.created_at or datetime.min, reverse=True)
         
         result = []
         for p in patients:
@@ -271,7 +316,10 @@ def get_dashboard_updates():
                 "ticket_number": p.ticket_number,
                 "color_code": p.color_code,
                 "created_at": p.created_at.isoformat() if p.created_at else None,
-                "eta_minutes": p.eta_minutes
+                "updated_at": p.updated_at.isoformat() if p.updated_at else None,
+                "eta_minutes": p.eta_minutes,
+                "eta_status": p.eta_status,
+                "facility_code": p.facility_code
             })
         
         return jsonify({
@@ -288,24 +336,9 @@ def get_dashboard_updates():
 def get_dashboard_summary():
     try:
         now = datetime.utcnow()
-        last_hour = now - timedelta(hours=1)
-        last_24_hours = now - timedelta(hours=24)
-        
-        # Get counts
-        total_patients = PatientIntake.query.count()
-        critical_patients = PatientIntake.query.filter_by(color_code='R').count()
-        urgent_patients = PatientIntake.query.filter_by(color_code='Y').count()
-        normal_patients = PatientIntake.query.filter_by(color_code='G').count()
-        
-        # Get recent activity
-        recent_patients = PatientIntake.query.filter(
-            PatientIntake.created_at >= last_hour
-        ).count()
         
-        # Get patients with ETA
-        patients_with_eta = PatientIntake.query.filter(
-            PatientIntake.eta_minutes.isnot(None)
-        ).count()
+        # Get counts (the same single pass as /dashboard/stats)
+        counts = DashboardStats(now).counts()
         
         # Get latest patient
         latest_patient = PatientIntake.query.order_by(
@@ -324,12 +357,12 @@ def get_dashboard_summary():
         
         summary = {
             "stats": {
-                "total": total_patients,
-                "critical": critical_patients,
-                "urgent": urgent_patients,
-                "normal": normal_patients,
-                "recent_hour": recent_patients,
-                "with_eta": patients_with_eta
+                "total": counts["total"],
+                "critical": counts["critical"],
+                "urgent": counts["urgent"],
+                "normal": counts["normal"],
+                "recent_hour": counts["recent_hour"],
+                "with_eta": counts["with_eta"]
             },
             "latest_patient": latest_patient_data,
             "last_updated": now.isoformat()
@@ -344,40 +377,22 @@ def get_dashboard_summary():
 @dashboard_bp.route("/dashboard/pregnancy-analytics", methods=["GET"])
 def get_pregnancy_analytics():
     try:
+        dashboard_stats = DashboardStats()
+        
         # Get pregnancy week distribution
-        week_distribution = {}
-        for week in range(1, 41):
-            count = PatientIntake.query.filter_by(pregnancy_week=week).count()
-            if count > 0:
-                week_distribution[f"week_{week}"] = count
+        week_distribution = {
+            f"week_{week}": count for week, count in dashboard_stats.week_distribution().items()
+        }
         
         # Get trimester distribution with severity
-        trimester_stats = {}
-        for trimester in ['First', 'Second', 'Third']:
-            total = PatientIntake.query.filter_by(trimester=trimester).count()
-            critical = PatientIntake.query.filter(
-                db.and_(PatientIntake.trimester == trimester, PatientIntake.color_code == 'R')
-            ).count()
-            urgent = PatientIntake.query.filter(
-                db.and_(PatientIntake.trimester == trimester, PatientIntake.color_code == 'Y')
-            ).count()
-            normal = PatientIntake.query.filter(
-                db.and_(PatientIntake.trimester == trimester, PatientIntake.color_code == 'G')
-            ).count()
-            
-            trimester_stats[trimester.lower()] = {
-                "total": total,
-                "critical": critical,
-                "urgent": urgent,
-                "normal": normal
-            }
+        trimester_stats = {
+            trimester.lower(): stats for trimester, stats in dashboard_stats.trimester_severity().items()
+        }
         
         # Get age distribution of pregnant women
+        counts = dashboard_stats.counts()
         age_groups = {
-            "teenage": PatientIntake.query.filter(db.and_(PatientIntake.age < 18, PatientIntake.is_pregnant == True)).count(),
-            "young_adult": PatientIntake.query.filter(db.and_(db.and_(PatientIntake.age >= 18, PatientIntake.age < 25), PatientIntake.is_pregnant == True)).count(),
-            "adult": PatientIntake.query.filter(db.and_(db.and_(PatientIntake.age >= 25, PatientIntake.age < 35), PatientIntake.is_pregnant == True)).count(),
-            "advanced_maternal_age": PatientIntake.query.filter(db.and_(PatientIntake.age >= 35, PatientIntake.is_pregnant == True)).count()
+            group: counts[group] for group in ("teenage", "young_adult", "adult", "advanced_maternal_age")
         }
         
         # Get common pregnancy complications
@@ -395,17 +410,9 @@ def get_pregnancy_analytics():
                     complication_types[comp] = 1
         
         # Get emergency patterns by time of day
-        from datetime import datetime, time
-        emergency_by_hour = {}
-        for hour in range(24):
-            count = PatientIntake.query.filter(
-                db.and_(
-                    PatientIntake.color_code == 'R',
-                    db.extract('hour', PatientIntake.created_at) == hour
-                )
-            ).count()
-            if count > 0:
-                emergency_by_hour[f"hour_{hour}"] = count
+        emergency_by_hour = {
+            f"hour_{hour}": count for hour, count in dashboard_stats.critical_by_hour().items()
+        }
         
         analytics = {
             "pregnancy_week_distribution": week_distribution,
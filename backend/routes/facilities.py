@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from services.eta_service import ETAService
+from services.facility_registry import facility_registry
+
+facilities_bp = Blueprint("facilities", __name__)
+
+# Largest k accepted by the nearest-facility lookup
+MAX_NEAREST = 20
+
+# List the facilities patients can be routed to
+@facilities_bp.route("/facilities", methods=["GET"])
+def get_facilities():
+    facilities = [f._asdict() for f in facility_registry.facilities]
+    return jsonify({
+        "facilities": facilities,
+        "default": facility_registry.default.code if facility_registry.default else None,
+        "count": len(facilities)
+    }), 200
+
+# The k facilities nearest to a location, with their ETAs
+@facilities_bp.route("/facilities/nearest", methods=["GET"])
+def get_nearest_facilities():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    k = request.args.get('k', 3, type=int)
+
+    if lat is None or lng is None:
+        return jsonify({"error": "lat and lng are required numbers"}), 400
+    if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+        return jsonify({"error": "Invalid GPS coordinates"}), 400
+    if not 1 <= k <= MAX_NEAREST:
+        return jsonify({"error": f"k must be between 1 and {MAX_NEAREST}"}), 400
+
+    try:
+        eta_service = ETAService()
+        eta_minutes, facility = eta_service.route(lat, lng)
+        return jsonify({
+            "facilities": eta_service.nearest_facilities(lat, lng, k),
+            "routed_to": facility.code if facility else None,
+            "eta_minutes": eta_minutes
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Failed to find facilities: {str(e)}"}), 500
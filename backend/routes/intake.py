@@ -2,12 +2,55 @@ from flask import Blueprint, request, jsonify
 from models import db, PatientIntake, MoodEntry
 from services.eta_service import ETAService
 from services.emergency_classifier import EmergencyClassifier
+from services.ticket_allocator import ticket_allocator
+from services.shadow_triage import shadow_evaluator
+from services.eta_enrichment import eta_enricher, ETA_PENDING, ETA_CALCULATED, ETA_FAILED
+from services.position_tracker import position_tracker
 from datetime import datetime, date, timedelta
 import json
 import re
 
 intake_bp = Blueprint("intake", __name__)
 
+# Largest number of intakes accepted by a single batch request
+MAX_BATCH_SIZE = 1000
+
+
+def _extract_risk_conditions(data):
+    """Map the Yes/No risk answers of an intake form to classifier risk conditions"""
+    risk_conditions = []
+    if data.get("chronic") == "Yes":
+        risk_conditions.append("Chronic medication")
+    if data.get("conditions") == "Yes":
+        risk_conditions.append("Medical conditions")
+    if data.get("contactSick") == "Yes":
+        risk_conditions.append("Contact with sick person")
+    if data.get("multiple_pregnancy") == "Yes":
+        risk_conditions.append("Multiple pregnancy")
+    if data.get("previous_complications") == "Yes":
+        risk_conditions.append("Previous pregnancy complications")
+    return risk_conditions
+
+
+def _serialize_car_location(car_location):
+    """Convert car_location to a string for storage"""
+    if not car_location:
+        return None
+    if isinstance(car_location, dict):
+        # Store as JSON string for flexibility
+        return json.dumps(car_location)
+    return str(car_location)
+
+
+def _parse_optional_date(value):
+    """Parse a YYYY-MM-DD date, ignoring missing or malformed values"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (ValueError, TypeError):
+        return None
+
 # Create new intake
 @intake_bp.route("/intake", methods=["POST"])
 def create_intake():
@@ -19,14 +62,26 @@ def create_intake():
         if field not in data:
             return jsonify({"error": f"{field} is required"}), 400
 
-    # Calculate ETA if car_location is provided
+    # Calculate ETA if car_location is provided. Only what needs no network is done
+    # here; addresses that must be geocoded online are finished in the background.
+    # The patient is routed to the facility with the lowest ETA.
     eta_minutes = None
+    eta_status = None
+    facility = None
+    position = None
     car_location = data.get("car_location")
     
     if car_location:
         try:
             eta_service = ETAService()
-            eta_minutes = eta_service.get_eta_from_location(car_location)
+            route = eta_service.get_offline_route(car_location)
+            if route is None:
+                eta_status = ETA_PENDING
+            else:
+                eta_minutes, facility = route
+                position = eta_service.last_position
+                # An address cached as not found gets no ETA rather than a guess
+                eta_status = ETA_CALCULATED if eta_minutes is not None else ETA_FAILED
         except ValueError as e:
             return jsonify({"error": f"Invalid car location: {str(e)}"}), 400
         except Exception as e:
@@ -34,65 +89,38 @@ def create_intake():
 
     # AI Emergency Classification
     try:
-        classifier = EmergencyClassifier()
+        classifier = EmergencyClassifier(ticket_allocator=ticket_allocator)
         
         # Extract risk conditions from the data
-        risk_conditions = []
-        if data.get("chronic") == "Yes":
-            risk_conditions.append("Chronic medication")
-        if data.get("conditions") == "Yes":
-            risk_conditions.append("Medical conditions")
-        if data.get("contactSick") == "Yes":
-            risk_conditions.append("Contact with sick person")
-        if data.get("multiple_pregnancy") == "Yes":
-            risk_conditions.append("Multiple pregnancy")
-        if data.get("previous_complications") == "Yes":
-            risk_conditions.append("Previous pregnancy complications")
+        risk_conditions = _extract_risk_conditions(data)
         
         # Get pregnancy-specific data
         pregnancy_week = data.get("pregnancy_week")
         trimester = data.get("trimester")
         
-        # Classify emergency level with pregnancy data
-        severity_level, ticket_number, color_code = classifier.classify_emergency(
+        # Classify, ticket and analyze in a single pass with pregnancy data
+        triage_result = classifier.triage(
             symptoms=data["symptoms"],
             age=data["age"],
             risk_conditions=risk_conditions,
             pregnancy_week=pregnancy_week,
             trimester=trimester
         )
-        
-        # Get detailed analysis
-        ai_analysis = classifier.analyze_symptoms(data["symptoms"])
-        severity_explanation = classifier.get_severity_explanation(severity_level, data["symptoms"])
+        severity_level = triage_result.severity
+        ticket_number = triage_result.ticket_number
+        color_code = triage_result.color_code
+        ai_analysis = triage_result.to_analysis()
+        severity_explanation = triage_result.explanation
         
     except Exception as e:
         return jsonify({"error": f"AI classification failed: {str(e)}"}), 500
 
     # Convert car_location to string for storage if it's a dict
-    car_location_str = None
-    if car_location:
-        if isinstance(car_location, dict):
-            # Store as JSON string for flexibility
-            car_location_str = json.dumps(car_location)
-        else:
-            car_location_str = str(car_location)
+    car_location_str = _serialize_car_location(car_location)
 
     # Parse pregnancy dates
-    due_date = None
-    last_menstrual_period = None
-    
-    if data.get("due_date"):
-        try:
-            due_date = datetime.strptime(data["due_date"], "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            pass
-    
-    if data.get("last_menstrual_period"):
-        try:
-            last_menstrual_period = datetime.strptime(data["last_menstrual_period"], "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            pass
+    due_date = _parse_optional_date(data.get("due_date"))
+    last_menstrual_period = _parse_optional_date(data.get("last_menstrual_period"))
 
     new_patient = PatientIntake(
         name=data["name"],
@@ -101,7 +129,11 @@ def create_intake():
         symptoms=data["symptoms"],
         arrival_mode=data["arrival_mode"],
         car_location=car_location_str,
+        car_lat=position[0] if position else None,
+        car_lng=position[1] if position else None,
         eta_minutes=eta_minutes,
+        eta_status=eta_status,
+        facility_code=facility.code if facility else None,
         # Pregnancy-specific fields
         is_pregnant=True,  # All patients are pregnant women
         pregnancy_week=data.get("pregnancy_week"),
@@ -115,11 +147,18 @@ def create_intake():
         severity_level=severity_level,
         ticket_number=ticket_number,
         color_code=color_code,
-        ai_analysis=json.dumps(ai_analysis)
+        ai_analysis=triage_result.to_json()
     )
 
     db.session.add(new_patient)
     db.session.commit()
+
+    if eta_status == ETA_PENDING:
+        eta_enricher.submit(new_patient.id, car_location)
+
+    # Score with the candidate ruleset in the background (dropped if the queue is full)
+    shadow_evaluator.submit(new_patient.id, data["symptoms"], data["age"], risk_conditions,
+                            pregnancy_week, trimester, triage_result)
     
     response_data = {
         "message": "Patient intake created",
@@ -133,9 +172,230 @@ def create_intake():
     
     if eta_minutes is not None:
         response_data["eta_minutes"] = eta_minutes
+    if eta_status is not None:
+        response_data["eta_status"] = eta_status
+    if facility is not None:
+        response_data["facility"] = {"code": facility.code, "name": facility.name}
     
     return jsonify(response_data), 201
 
+# Create many intakes in one request (e.g. syncing paper forms after an outage)
+@intake_bp.route("/intake/batch", methods=["POST"])
+def create_intake_batch():
+    data = request.get_json()
+    intakes = data.get("intakes") if isinstance(data, dict) else data
+
+    if not isinstance(intakes, list) or not intakes:
+        return jsonify({"error": "intakes must be a non-empty list"}), 400
+    if len(intakes) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"A batch may contain at most {MAX_BATCH_SIZE} intakes"}), 400
+
+    required_fields = ["name", "age", "contact", "symptoms", "arrival_mode"]
+
+    # Validate every record up front so a bad record rejects the whole batch
+    errors = []
+    patients = []
+    for index, item in enumerate(intakes):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "intake must be an object"})
+            continue
+
+        missing = [field for field in required_fields if field not in item]
+        if missing:
+            errors.append({"index": index, "error": f"{missing[0]} is required"})
+            continue
+
+        try:
+            age = int(item["age"])
+            pregnancy_week = int(item["pregnancy_week"]) if item.get("pregnancy_week") not in (None, "") else None
+        except (ValueError, TypeError):
+            errors.append({"index": index, "error": "age and pregnancy_week must be numbers"})
+            continue
+
+        patients.append({
+            "symptoms": str(item["symptoms"]),
+            "age": age,
+            "risk_conditions": _extract_risk_conditions(item),
+            "pregnancy_week": pregnancy_week,
+            "trimester": item.get("trimester")
+        })
+
+    if errors:
+        return jsonify({"error": "Invalid intakes in batch", "errors": errors}), 400
+
+    # Calculate ETAs that need no network with a single service instance; the rest
+    # are geocoded in the background after the batch is saved
+    eta_values = [None] * len(intakes)
+    eta_statuses = [None] * len(intakes)
+    facility_codes = [None] * len(intakes)
+    positions = [None] * len(intakes)
+    if any(item.get("car_location") for item in intakes):
+        eta_service = ETAService()
+        for index, item in enumerate(intakes):
+            if not item.get("car_location"):
+                continue
+            try:
+                route = eta_service.get_offline_route(item["car_location"])
+                if route is None:
+                    eta_statuses[index] = ETA_PENDING
+                else:
+                    eta_values[index] = route[0]
+                    facility_codes[index] = route[1].code if route[1] else None
+                    positions[index] = eta_service.last_position
+                    eta_statuses[index] = ETA_CALCULATED if route[0] is not None else ETA_FAILED
+            except ValueError as e:
+                return jsonify({"error": f"Invalid car location at index {index}: {str(e)}"}), 400
+            except Exception as e:
+                return jsonify({"error": f"Failed to calculate ETA: {str(e)}"}), 500
+
+    # AI Emergency Classification for the whole batch
+    try:
+        classifier = EmergencyClassifier(ticket_allocator=ticket_allocator)
+        triage_results = classifier.triage_batch(patients)
+    except Exception as e:
+        return jsonify({"error": f"AI classification failed: {str(e)}"}), 500
+
+    mappings = []
+    for item, patient, triage_result, eta_minutes, eta_status, facility_code, position in zip(
+            intakes, patients, triage_results, eta_values, eta_statuses, facility_codes, positions):
+        mappings.append({
+            "name": item["name"],
+            "age": patient["age"],
+            "contact": item["contact"],
+            "symptoms": patient["symptoms"],
+            "arrival_mode": item["arrival_mode"],
+            "car_location": _serialize_car_location(item.get("car_location")),
+            "car_lat": position[0] if position else None,
+            "car_lng": position[1] if position else None,
+            "eta_minutes": eta_minutes,
+            "eta_status": eta_status,
+            "facility_code": facility_code,
+            # Pregnancy-specific fields
+            "is_pregnant": True,  # All patients are pregnant women
+            "pregnancy_week": patient["pregnancy_week"],
+            "trimester": patient["trimester"],
+            "due_date": _parse_optional_date(item.get("due_date")),
+            "pregnancy_complications": item.get("pregnancy_complications"),
+            "previous_pregnancies": item.get("previous_pregnancies", 0),
+            "blood_type": item.get("blood_type"),
+            "last_menstrual_period": _parse_optional_date(item.get("last_menstrual_period")),
+            # AI Classification fields
+            "severity_level": triage_result.severity,
+            "ticket_number": triage_result.ticket_number,
+            "color_code": triage_result.color_code,
+            "ai_analysis": triage_result.to_json()
+        })
+
+    # Insert the whole batch in one transaction
+    try:
+        db.session.bulk_insert_mappings(PatientIntake, mappings, return_defaults=True)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Failed to save intakes: {str(e)}"}), 500
+
+    created = []
+    for index, (item, mapping, patient, triage_result) in enumerate(zip(intakes, mappings, patients, triage_results)):
+        if mapping["eta_status"] == ETA_PENDING:
+            eta_enricher.submit(mapping.get("id"), item["car_location"])
+        shadow_evaluator.submit(mapping.get("id"), patient["symptoms"], patient["age"], patient["risk_conditions"],
+                                patient["pregnancy_week"], patient["trimester"], triage_result)
+        created.append({
+            "index": index,
+            "id": mapping.get("id"),
+            "ticket_number": triage_result.ticket_number,
+            "severity_level": triage_result.severity,
+            "color_code": triage_result.color_code,
+            "eta_minutes": mapping["eta_minutes"],
+            "eta_status": mapping["eta_status"],
+            "facility_code": mapping["facility_code"]
+        })
+
+    return jsonify({
+        "message": f"{len(created)} patient intakes created",
+        "count": len(created),
+        "intakes": created
+    }), 201
+
+# Store new GPS positions of patients on their way and update their ETAs
+@intake_bp.route("/intake/positions", methods=["POST"])
+def update_positions():
+    data = request.get_json()
+    positions = data.get("positions") if isinstance(data, dict) else data
+
+    if not isinstance(positions, list) or not positions:
+        return jsonify({"error": "positions must be a non-empty list"}), 400
+    if len(positions) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"A request may contain at most {MAX_BATCH_SIZE} positions"}), 400
+
+    errors = []
+    fixes = []
+    for index, item in enumerate(positions):
+        try:
+            fix = {"id": int(item["id"]), "lat": float(item["lat"]), "lng": float(item["lng"])}
+        except (KeyError, TypeError, ValueError):
+            errors.append({"index": index, "error": "id, lat and lng are required numbers"})
+            continue
+        if not (-90 <= fix["lat"] <= 90) or not (-180 <= fix["lng"] <= 180):
+            errors.append({"index": index, "error": "Invalid GPS coordinates"})
+            continue
+        fixes.append(fix)
+
+    if errors:
+        return jsonify({"error": "Invalid positions", "errors": errors}), 400
+
+    try:
+        results = position_tracker.apply_fixes(fixes)
+    except Exception as e:
+        return jsonify({"error": f"Failed to update ETAs: {str(e)}"}), 500
+
+    return jsonify({
+        "message": "Positions updated",
+        "count": sum(1 for result in results if result["eta_minutes"] is not None),
+        "positions": results
+    }), 200
+
+def _parse_ping_time(value):
+    """Unix time of a ping from epoch seconds or an ISO 8601 string (None for "now")"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return (parsed - datetime(1970, 1, 1)).total_seconds()
+    return parsed.timestamp()
+
+# Live GPS ping of a patient on their way; the ETA is updated in memory and persisted in batches
+@intake_bp.route("/intake/<int:id>/ping", methods=["POST"])
+def ping_position(id):
+    data = request.get_json(silent=True) or {}
+
+    try:
+        lat, lng = float(data["lat"]), float(data["lng"])
+        speed_kmh = float(data["speed_kmh"]) if data.get("speed_kmh") is not None else None
+        heading = float(data["heading"]) if data.get("heading") is not None else None
+        at = _parse_ping_time(data.get("timestamp"))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "lat and lng are required numbers; speed_kmh, heading and timestamp are optional"}), 400
+    if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+        return jsonify({"error": "Invalid GPS coordinates"}), 400
+    if speed_kmh is not None and speed_kmh < 0:
+        return jsonify({"error": "speed_kmh cannot be negative"}), 400
+
+    result = position_tracker.ping(id, lat, lng, at=at, speed_kmh=speed_kmh, heading=heading)
+    if result is None:
+        return jsonify({"error": "Intake not found"}), 404
+    return jsonify(result), 202
+
+# Recent GPS fixes of a tracked patient, oldest first
+@intake_bp.route("/intake/<int:id>/track", methods=["GET"])
+def get_position_track(id):
+    fixes = position_tracker.recent(id)
+    if fixes is None:
+        return jsonify({"error": "No live position for this intake"}), 404
+    return jsonify({"id": id, "fixes": fixes}), 200
+
 # Get all intakes
 @intake_bp.route("/intake", methods=["GET"])
 def get_intakes():
@@ -177,6 +437,8 @@ def get_intakes():
             "arrival_mode": p.arrival_mode,
             "car_location": car_location,
             "eta_minutes": p.eta_minutes,
+            "eta_status": p.eta_status,
+            "facility_code": p.facility_code,
             # Pregnancy-specific fields
             "is_pregnant": p.is_pregnant,
             "pregnancy_week": p.pregnancy_week,
@@ -236,6 +498,8 @@ def get_intake(id):
         "arrival_mode": p.arrival_mode,
         "car_location": car_location,
         "eta_minutes": p.eta_minutes,
+        "eta_status": p.eta_status,
+        "facility_code": p.facility_code,
         # Pregnancy-specific fields
         "is_pregnant": p.is_pregnant,
         "pregnancy_week": p.pregnancy_week,
@@ -350,7 +614,7 @@ def submit_pregnancy_form():
             next_of_kin=next_of_kin_json,
             # Set default values for AI classification (can be updated later)
             severity_level="Light",
-            ticket_number="REG001",  # Registration ticket
+            ticket_number=ticket_allocator.allocate("REG"),  # Registration ticket
             color_code="G",
             ai_analysis=json.dumps({"form_type": "pregnancy_registration", "status": "registered"})
         )
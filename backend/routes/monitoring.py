@@ -0,0 +1,82 @@
+from flask import Blueprint, jsonify
+from models import db
+from services.database import database_tuning
+from services.triage_cache import triage_cache
+from services.triage_ruleset import ruleset_store
+from services.shadow_triage import shadow_evaluator
+from services.geocode_cache import geocode_cache
+from services.gazetteer import gazetteer
+from services.nominatim_client import nominatim_client
+from services.road_router import road_router
+from services.eta_grid import eta_grid
+from services.eta_service import eta_fallbacks
+from services.eta_enrichment import eta_enricher
+from services.position_tracker import position_tracker
+from services.spatial_index import spatial_index
+
+monitoring_bp = Blueprint("monitoring", __name__)
+
+# Triage classification cache counters
+@monitoring_bp.route("/monitoring/triage-cache", methods=["GET"])
+def get_triage_cache_stats():
+    return jsonify(triage_cache.stats()), 200
+
+# Active triage ruleset version and reload status
+@monitoring_bp.route("/monitoring/triage-ruleset", methods=["GET"])
+def get_triage_ruleset_status():
+    return jsonify(ruleset_store.status()), 200
+
+# Candidate ruleset shadow evaluation: agreement and severity transitions
+@monitoring_bp.route("/monitoring/triage-shadow", methods=["GET"])
+def get_triage_shadow_stats():
+    return jsonify(shadow_evaluator.stats()), 200
+
+# Geocode cache counters (memory and persistent tiers)
+@monitoring_bp.route("/monitoring/geocode-cache", methods=["GET"])
+def get_geocode_cache_stats():
+    return jsonify(geocode_cache.stats()), 200
+
+# Offline gazetteer size and match counters
+@monitoring_bp.route("/monitoring/gazetteer", methods=["GET"])
+def get_gazetteer_stats():
+    return jsonify(gazetteer.stats()), 200
+
+# Nominatim request, coalescing and rate-limit counters, latency histogram and circuit breaker
+@monitoring_bp.route("/monitoring/nominatim", methods=["GET"])
+def get_nominatim_stats():
+    return jsonify(nominatim_client.stats()), 200
+
+# ETAs that fell back to a stale cache entry or the default estimate
+@monitoring_bp.route("/monitoring/eta-fallbacks", methods=["GET"])
+def get_eta_fallback_stats():
+    return jsonify(eta_fallbacks.stats()), 200
+
+# Offline road graph size and routing counters
+@monitoring_bp.route("/monitoring/road-router", methods=["GET"])
+def get_road_router_stats():
+    return jsonify(road_router.stats()), 200
+
+# Precomputed ETA grid description and lookup counters
+@monitoring_bp.route("/monitoring/eta-grid", methods=["GET"])
+def get_eta_grid_stats():
+    return jsonify(eta_grid.stats()), 200
+
+# Background ETA enrichment progress
+@monitoring_bp.route("/monitoring/eta-enrichment", methods=["GET"])
+def get_eta_enrichment_stats():
+    return jsonify(eta_enricher.stats()), 200
+
+# Live GPS tracking: patients tracked, pings received and batched writes
+@monitoring_bp.route("/monitoring/position-tracker", methods=["GET"])
+def get_position_tracker_stats():
+    return jsonify(position_tracker.stats()), 200
+
+# Spatial index state (R*Tree or plain columns) and map query counters
+@monitoring_bp.route("/monitoring/spatial-index", methods=["GET"])
+def get_spatial_index_stats():
+    return jsonify(spatial_index.stats()), 200
+
+# Database backend, connection pool and SQLite pragmas in effect
+@monitoring_bp.route("/monitoring/database", methods=["GET"])
+def get_database_stats():
+    return jsonify(database_tuning.stats(db.engine)), 200
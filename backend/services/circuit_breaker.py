@@ -0,0 +1,98 @@
+import time
+import threading
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream service for a while.
+
+    The breaker starts closed. After `failure_threshold` consecutive failures it
+    opens, and callers skip the upstream call for `reset_timeout` seconds. Then it
+    is half-open and lets one trial call through. If the trial succeeds, the breaker
+    closes again. If it fails, the breaker opens for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """State after applying the reset timeout (called with the lock held)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_progress = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (counts the call as rejected if not)"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Report a successful upstream call"""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        """Report a failed upstream call"""
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_progress = False
+                self.times_opened += 1
+
+    def reset(self):
+        """Close the breaker and forget past failures"""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_progress = False
+
+    def stats(self) -> Dict:
+        """Breaker state for monitoring"""
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1)
+                if state == OPEN else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from models import db, PatientIntake
+
+TRIMESTERS = ['First', 'Second', 'Third']
+
+
+class DashboardStats:
+    """
+    Dashboard counts computed in as few passes over patient_intake as possible.
+
+    `counts` evaluates every severity, trimester, ETA, recency, risk and age
+    count in one SELECT of conditional aggregates (SUM(CASE WHEN ... THEN 1
+    ELSE 0 END)). That is a single table scan instead of one COUNT query per
+    number, which matters because every nursing station polls the dashboard.
+    The pregnancy analytics distributions are GROUP BY queries answered from the
+    dashboard indexes. Must be used inside a Flask app context.
+    """
+
+    def __init__(self, now: Optional[datetime] = None):
+        """
+        Args:
+            now: Reference time for the recency counts (default: now, UTC)
+        """
+        self.now = now or datetime.utcnow()
+
+    def _conditions(self) -> Dict:
+        """Named row conditions, each counted by counts()"""
+        p = PatientIntake
+        pregnant = p.is_pregnant == True
+        return {
+            # Severity
+            "critical": p.color_code == 'R',
+            "urgent": p.color_code == 'Y',
+            "normal": p.color_code == 'G',
+            # Recency and ETAs
+            "recent_hour": p.created_at >= self.now - timedelta(hours=1),
+            "recent_24h": p.created_at >= self.now - timedelta(hours=24),
+            "with_eta": p.eta_minutes.isnot(None),
+            # Trimesters
+            "first_trimester": p.trimester == 'First',
+            "second_trimester": p.trimester == 'Second',
+            "third_trimester": p.trimester == 'Third',
+            "critical_first_trimester": db.and_(p.color_code == 'R', p.trimester == 'First'),
+            "critical_third_trimester": db.and_(p.color_code == 'R', p.trimester == 'Third'),
+            # High-risk pregnancy indicators
+            "high_risk": db.or_(
+                p.previous_pregnancies > 3,
+                p.pregnancy_complications.isnot(None),
+                db.and_(p.age < 18, pregnant),
+                db.and_(p.age > 35, pregnant)
+            ),
+            # Age groups of pregnant women
+            "teenage": db.and_(p.age < 18, pregnant),
+            "young_adult": db.and_(p.age >= 18, p.age < 25, pregnant),
+            "adult": db.and_(p.age >= 25, p.age < 35, pregnant),
+            "advanced_maternal_age": db.and_(p.age >= 35, pregnant)
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Every dashboard count in one query
+
+        Returns:
+            Dict with "total" plus one count per condition in _conditions()
+        """
+        conditions = self._conditions()
+        row = db.session.query(
+            db.func.count().label("total"),
+            *(db.func.sum(db.case((condition, 1), else_=0)).label(name) for name, condition in conditions.items())
+        ).select_from(PatientIntake).one()
+        # SUM is NULL on an empty table
+        return {name: int(value or 0) for name, value in row._mapping.items()}
+
+    def week_distribution(self) -> Dict[int, int]:
+        """Patients per pregnancy week (1-40), weeks without patients omitted"""
+        week = PatientIntake.pregnancy_week
+        rows = db.session.query(week, db.func.count()).filter(week.between(1, 40)) \
+            .group_by(week).order_by(week).all()
+        return {int(w): count for w, count in rows}
+
+    def trimester_severity(self) -> Dict[str, Dict[str, int]]:
+        """Total, critical, urgent and normal patients per trimester"""
+        rows = db.session.query(PatientIntake.trimester, PatientIntake.color_code, db.func.count()) \
+            .filter(PatientIntake.trimester.in_(TRIMESTERS)) \
+            .group_by(PatientIntake.trimester, PatientIntake.color_code).all()
+        result = {trimester: {"total": 0, "critical": 0, "urgent": 0, "normal": 0} for trimester in TRIMESTERS}
+        severity_names = {'R': "critical", 'Y': "urgent", 'G': "normal"}
+        for trimester, color_code, count in rows:
+            result[trimester]["total"] += count
+            if color_code in severity_names:
+                result[trimester][severity_names[color_code]] += count
+        return result
+
+    def critical_by_hour(self) -> Dict[int, int]:
+        """Critical (R) patients per hour of day they registered, hours without any omitted"""
+        hour = db.extract('hour', PatientIntake.created_at)
+        rows = db.session.query(hour, db.func.count()).filter(PatientIntake.color_code == 'R') \
+            .group_by(hour).order_by(hour).all()
+        return {int(h): count for h, count in rows if h is not None}
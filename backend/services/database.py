@@ -0,0 +1,132 @@
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+class DatabaseTuning:
+    """
+    Engine options and per-connection settings for the configured database.
+
+    `init_app` must run before `db.init_app`, because it fills in
+    SQLALCHEMY_ENGINE_OPTIONS, which Flask-SQLAlchemy reads when it creates the
+    engine. `tune_engine` then runs on the engine that was created, before its
+    first connection, and only touches that engine.
+
+    On SQLite, every new connection gets the following pragmas:
+    - WAL journal, so dashboard reads do not wait for intake writes.
+    - A busy timeout, so concurrent writers queue instead of failing with
+      "database is locked".
+    - synchronous=NORMAL, which is durable with WAL and only syncs at checkpoints.
+    - A larger page cache and memory-mapped I/O.
+
+    Server databases such as PostgreSQL get a connection pool sized by the
+    DB_POOL_* settings. It uses pre-ping, so connections dropped by the server
+    are replaced, and LIFO reuse, so idle connections can time out.
+    DB_ENGINE_OPTIONS (JSON) overrides any option.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.pragmas: List[Tuple[str, object]] = []
+        self.engine_options: Dict = {}
+        self._lock = threading.Lock()
+        self.connections = 0
+
+    def init_app(self, app):
+        """Set the engine options for the configured database URI (call before db.init_app)"""
+        self.backend = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).get_backend_name()
+        if self.backend == "sqlite":
+            options = {}
+            self.pragmas = self._sqlite_pragmas(app.config)
+        else:
+            options = {
+                "pool_size": app.config.get('DB_POOL_SIZE', 10),
+                "max_overflow": app.config.get('DB_MAX_OVERFLOW', 20),
+                "pool_timeout": app.config.get('DB_POOL_TIMEOUT', 10),
+                "pool_recycle": app.config.get('DB_POOL_RECYCLE', 1800),
+                "pool_pre_ping": True,
+                "pool_use_lifo": True
+            }
+            self.pragmas = []
+
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        extra = app.config.get('DB_ENGINE_OPTIONS')
+        if extra:
+            options.update(json.loads(extra) if isinstance(extra, str) else extra)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        self.engine_options = options
+
+    def tune_engine(self, engine: Engine):
+        """Apply the per-connection settings to new connections of this engine (call after db.init_app)"""
+        with self._lock:
+            if not event.contains(engine, "connect", self._on_connect):
+                event.listen(engine, "connect", self._on_connect)
+
+    @staticmethod
+    def _sqlite_pragmas(config) -> List[Tuple[str, object]]:
+        """PRAGMA statements for new SQLite connections, in the order they are applied"""
+        journal_mode = str(config.get('SQLITE_JOURNAL_MODE', 'WAL')).upper()
+        synchronous = str(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {sorted(JOURNAL_MODES)}")
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {sorted(SYNCHRONOUS_MODES)}")
+        return [
+            # First, so switching the journal mode waits for other connections instead of failing
+            ("busy_timeout", int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+            ("journal_mode", journal_mode),
+            ("synchronous", synchronous),
+            # Negative cache_size is in KiB
+            ("cache_size", -int(config.get('SQLITE_CACHE_SIZE_KB', 65536))),
+            ("mmap_size", int(config.get('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024)
+        ]
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        if not self.pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+        with self._lock:
+            self.connections += 1
+
+    def stats(self, engine) -> Dict:
+        """
+        Backend, pool state and the settings in effect on a live connection
+
+        Must be called inside a Flask app context.
+        """
+        result = {
+            "backend": self.backend,
+            "pool": engine.pool.status(),
+            "engine_options": {key: value for key, value in self.engine_options.items() if key != "connect_args"},
+            "tuned_connections": self.connections
+        }
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as connection:
+                result["pragmas"] = {
+                    name: connection.execute(text(f"PRAGMA {name}")).scalar() for name, _ in self.pragmas
+                }
+        return result
+
+
+def sqlite_path(database_uri: str) -> Optional[str]:
+    """File of a SQLite database URI, or None for server databases and in-memory SQLite"""
+    url = make_url(database_uri)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+
+# Shared by the app's engine
+database_tuning = DatabaseTuning()
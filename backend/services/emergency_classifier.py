@@ -1,6 +1,72 @@
 import re
+import json
 import random
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.triage_cache import TriageCache, triage_cache
+from services.triage_ruleset import TriageRuleset, ruleset_store
+
+
+class TriageResult:
+    """
+    Outcome of a single triage pass: classification, ticket and detailed analysis.
+    Slotted to keep per-intake allocations small.
+    """
+    
+    __slots__ = (
+        'severity', 'color_code', 'ticket_number', 'score', 'detected_keywords',
+        'severity_indicators', 'pregnancy_concerns', 'recommendations', 'explanation',
+        'ruleset_version', 'risk_conditions'
+    )
+    
+    def __init__(self, severity: str, color_code: str, score: int, detected_keywords: List[str],
+                 severity_indicators: List[str], pregnancy_concerns: List[str],
+                 recommendations: List[str], explanation: str, ticket_number: str = None,
+                 ruleset_version: str = None, risk_conditions: List[str] = None):
+        self.severity = severity
+        self.color_code = color_code
+        self.ticket_number = ticket_number
+        self.score = score
+        self.detected_keywords = detected_keywords
+        self.severity_indicators = severity_indicators
+        self.pregnancy_concerns = pregnancy_concerns
+        self.recommendations = recommendations
+        self.explanation = explanation
+        self.ruleset_version = ruleset_version
+        self.risk_conditions = risk_conditions or []
+    
+    def with_ticket(self, ticket_number: str) -> 'TriageResult':
+        """Return a copy of this result carrying the given ticket number"""
+        return TriageResult(
+            self.severity, self.color_code, self.score, self.detected_keywords,
+            self.severity_indicators, self.pregnancy_concerns, self.recommendations,
+            self.explanation, ticket_number, self.ruleset_version, self.risk_conditions
+        )
+    
+    def with_risk_conditions(self, risk_conditions: List[str]) -> 'TriageResult':
+        """Return a copy of this result carrying the given patient's risk conditions"""
+        return TriageResult(
+            self.severity, self.color_code, self.score, self.detected_keywords,
+            self.severity_indicators, self.pregnancy_concerns, self.recommendations,
+            self.explanation, self.ticket_number, self.ruleset_version, list(risk_conditions)
+        )
+    
+    def to_analysis(self) -> Dict[str, any]:
+        """Detailed analysis in the shape stored in the `ai_analysis` column"""
+        return {
+            "detected_keywords": self.detected_keywords,
+            "severity_indicators": self.severity_indicators,
+            "recommendations": self.recommendations,
+            "pregnancy_concerns": self.pregnancy_concerns,
+            "ruleset_version": self.ruleset_version,
+            "risk_conditions": self.risk_conditions
+        }
+    
+    def to_json(self) -> str:
+        """Serialize the detailed analysis for the `ai_analysis` column"""
+        return json.dumps(self.to_analysis())
 
 
 class EmergencyClassifier:
@@ -9,45 +75,54 @@ class EmergencyClassifier:
     Classifies pregnant patients into Red (Critical), Yellow (Urgent), or Green (Light) categories
     """
     
-    def __init__(self):
-        # Critical pregnancy symptoms that require immediate attention
-        self.critical_keywords = [
-            'severe bleeding', 'heavy vaginal bleeding', 'placenta previa', 'placental abruption',
-            'preterm labor', 'labor contractions', 'water breaking', 'ruptured membranes',
-            'severe preeclampsia', 'eclampsia', 'seizure during pregnancy', 'unconscious',
-            'severe abdominal pain', 'severe headache with vision changes', 'difficulty breathing',
-            'chest pain', 'heart palpitations', 'severe dizziness', 'fainting',
-            'high fever', 'severe dehydration', 'emergency', 'urgent', 'critical'
-        ]
-        
-        # Urgent pregnancy symptoms that need attention within hours
-        self.urgent_keywords = [
-            'moderate bleeding', 'spotting', 'cramping', 'abdominal pain', 'back pain',
-            'nausea and vomiting', 'severe morning sickness', 'dehydration',
-            'fever', 'infection symptoms', 'urinary tract infection', 'yeast infection',
-            'swelling', 'high blood pressure', 'headache', 'vision changes',
-            'decreased fetal movement', 'baby not moving', 'contractions',
-            'pelvic pressure', 'pressure in pelvis', 'leaking fluid'
-        ]
-        
-        # Light pregnancy symptoms for routine care
-        self.light_keywords = [
-            'mild nausea', 'morning sickness', 'mild cramping', 'round ligament pain',
-            'mild back pain', 'fatigue', 'mild swelling', 'mild headache',
-            'heartburn', 'constipation', 'mild mood changes', 'checkup',
-            'routine visit', 'follow-up', 'prenatal care', 'ultrasound appointment',
-            'blood work', 'glucose test', 'mild discomfort', 'normal pregnancy symptoms'
-        ]
-        
-        # Pregnancy-specific risk factors that increase severity
-        self.risk_factors = [
-            'gestational diabetes', 'preeclampsia', 'high blood pressure', 'pregnancy hypertension',
-            'multiple pregnancy', 'twins', 'triplets', 'previous preterm birth',
-            'previous miscarriage', 'previous pregnancy complications', 'advanced maternal age',
-            'teenage pregnancy', 'first pregnancy', 'high risk pregnancy',
-            'placenta issues', 'cervical incompetence', 'chronic conditions',
-            'diabetes', 'heart condition', 'asthma', 'autoimmune disease'
-        ]
+    def __init__(self, ruleset: Optional[TriageRuleset] = None, cache: Optional[TriageCache] = triage_cache,
+                 ticket_allocator=None):
+        """
+        Args:
+            ruleset: Compiled ruleset to classify with; defaults to the active ruleset
+                (keyword lists and score weights live in rulesets/triage_ruleset.json)
+            cache: LRU cache of assessments shared across classifiers, or None to disable caching
+            ticket_allocator: Sequence allocator issuing collision-free ticket numbers
+                (services.ticket_allocator); without one, random numbers are used
+        """
+        self.ruleset = ruleset or ruleset_store.current()
+        self.cache = cache
+        self.ticket_allocator = ticket_allocator
+    
+    @property
+    def critical_keywords(self) -> Tuple[str, ...]:
+        """Critical pregnancy symptoms that require immediate attention"""
+        return self.ruleset.critical_keywords
+    
+    @property
+    def urgent_keywords(self) -> Tuple[str, ...]:
+        """Urgent pregnancy symptoms that need attention within hours"""
+        return self.ruleset.urgent_keywords
+    
+    @property
+    def light_keywords(self) -> Tuple[str, ...]:
+        """Light pregnancy symptoms for routine care"""
+        return self.ruleset.light_keywords
+    
+    @property
+    def risk_factors(self) -> Tuple[str, ...]:
+        """Pregnancy-specific risk factors that increase severity"""
+        return self.ruleset.risk_factors
+    
+    def _match_symptoms(self, symptoms_lower: str) -> Dict[str, Set[str]]:
+        """
+        Single pass over lowercased symptoms returning every keyword hit by category
+
+        Misspelled keywords ("bleding", "contractons") are corrected through the
+        ruleset's fuzzy index and the corrected text is matched as well.
+        """
+        matcher = self.ruleset.symptom_matcher
+        hits = matcher.match(symptoms_lower)
+        corrected = self.ruleset.fuzzy_index.correct_text(symptoms_lower)
+        if corrected is not None:
+            for category, keywords in matcher.match(corrected).items():
+                hits.setdefault(category, set()).update(keywords)
+        return hits
     
     def classify_emergency(self, symptoms: str, age: int, risk_conditions: List[str] = None, pregnancy_week: int = None, trimester: str = None) -> Tuple[str, str, str]:
         """
@@ -63,103 +138,229 @@ class EmergencyClassifier:
         Returns:
             Tuple of (severity, ticket_number, color_code)
         """
+        result = self.triage(symptoms, age, risk_conditions, pregnancy_week, trimester)
+        return result.severity, result.ticket_number, result.color_code
+    
+    def triage(self, symptoms: str, age: int, risk_conditions: List[str] = None, pregnancy_week: int = None, trimester: str = None) -> TriageResult:
+        """
+        Classify, ticket and analyze a pregnant patient from a single pass over the symptoms
+        
+        Args:
+            symptoms: Patient symptoms description
+            age: Patient age
+            risk_conditions: List of risk factors/conditions
+            pregnancy_week: Current pregnancy week (1-40)
+            trimester: Current trimester (First, Second, Third)
+            
+        Returns:
+            TriageResult with severity, color code, ticket number, analysis and explanation
+        """
+        result = self.assess(symptoms, age, risk_conditions, pregnancy_week, trimester)
+        return result.with_ticket(self._generate_ticket_number(result.color_code))
+    
+    def assess(self, symptoms: str, age: int, risk_conditions: List[str] = None, pregnancy_week: int = None, trimester: str = None) -> TriageResult:
+        """
+        Same as `triage` but without issuing a ticket number
+        
+        Results may come from the shared LRU cache and are shared between callers,
+        so they must not be modified. The cache key ignores the order and case of
+        `risk_conditions`, so a cache hit is copied with this caller's own list.
+        """
         if not risk_conditions:
             risk_conditions = []
         
-        # Convert to lowercase for matching
         symptoms_lower = symptoms.lower()
-        risk_lower = [condition.lower() for condition in risk_conditions]
-        
-        # Calculate severity score
-        severity_score = self._calculate_severity_score(symptoms_lower, age, risk_lower, pregnancy_week, trimester)
-        
-        # Determine classification
-        if severity_score >= 6:
-            severity = "Critical"
-            color_code = "R"
-        elif severity_score >= 3:
-            severity = "Urgent"
-            color_code = "Y"
-        else:
-            severity = "Light"
-            color_code = "G"
-        
-        # Generate ticket number
-        ticket_number = self._generate_ticket_number(color_code)
         
-        return severity, ticket_number, color_code
+        cache_key = None
+        if self.cache is not None:
+            # Cached results are tied to the ruleset they were computed with
+            vocabulary = self.ruleset
+            cache_key = self.cache.make_key(symptoms_lower, age, risk_conditions, pregnancy_week, trimester,
+                                            self.ruleset.limits)
+            if cache_key is not None:
+                cached = self.cache.get(vocabulary, cache_key)
+                if cached is not None:
+                    if cached.risk_conditions != risk_conditions:
+                        return cached.with_risk_conditions(risk_conditions)
+                    return cached
+        
+        # Scan once; scoring and analysis share the hits
+        hits = self._match_symptoms(symptoms_lower)
+        score = self._score_hits(hits, age, [condition.lower() for condition in risk_conditions], pregnancy_week, trimester)
+        severity, color_code = self._classify_score(score)
+        analysis = self._analyze_hits(hits)
+        
+        result = TriageResult(
+            severity=severity,
+            color_code=color_code,
+            score=score,
+            detected_keywords=analysis["detected_keywords"],
+            severity_indicators=analysis["severity_indicators"],
+            pregnancy_concerns=analysis["pregnancy_concerns"],
+            recommendations=analysis["recommendations"],
+            explanation=self.get_severity_explanation(severity, symptoms),
+            ruleset_version=self.ruleset.version,
+            risk_conditions=list(risk_conditions)
+        )
+        
+        if cache_key is not None:
+            self.cache.put(vocabulary, cache_key, result)
+        return result
+    
+    def _classify_score(self, severity_score: int) -> Tuple[str, str]:
+        """Map a severity score to (severity, color_code)"""
+        if severity_score >= self.ruleset.critical_threshold:
+            return "Critical", "R"
+        elif severity_score >= self.ruleset.urgent_threshold:
+            return "Urgent", "Y"
+        return "Light", "G"
     
     def _calculate_severity_score(self, symptoms: str, age: int, risk_conditions: List[str], pregnancy_week: int = None, trimester: str = None) -> int:
         """Calculate severity score based on pregnancy symptoms, age, and risk factors"""
+        return self._score_hits(self._match_symptoms(symptoms), age, risk_conditions, pregnancy_week, trimester)
+    
+    def _score_hits(self, hits: Dict[str, Set[str]], age: int, risk_conditions: List[str], pregnancy_week: int = None, trimester: str = None) -> int:
+        """Calculate severity score from the keyword hits of a single matcher pass"""
+        score = self._keyword_points(hits, risk_conditions) + self._patient_points(age, pregnancy_week, trimester)
+        return min(score, self.ruleset.max_score)
+    
+    def _keyword_points(self, hits: Dict[str, Set[str]], risk_conditions: List[str]) -> int:
+        """Points contributed by symptom keywords, modifiers and risk factors"""
+        points = self.ruleset.points
         score = 0
         
-        # Check for critical pregnancy symptoms
-        critical_found = False
-        for keyword in self.critical_keywords:
-            if keyword in symptoms:
-                score += 3
-                critical_found = True
-                break  # Only count the highest severity match
-        
-        # Check for urgent pregnancy symptoms
-        if not critical_found:  # Only if no critical symptoms found
-            for keyword in self.urgent_keywords:
-                if keyword in symptoms:
-                    score += 2
-                    break
-        
-        # Check for light pregnancy symptoms (only if no higher severity)
-        if score == 0:
-            for keyword in self.light_keywords:
-                if keyword in symptoms:
-                    score += 1
-                    break
+        # Only count the highest severity tier that matched
+        if 'critical' in hits:
+            score += points['critical']
+        elif 'urgent' in hits:
+            score += points['urgent']
+        elif 'light' in hits:
+            score += points['light']
+        
+        # Risk factor adjustments
+        risk_matcher = self.ruleset.risk_matcher
+        for risk in risk_conditions:
+            if risk_matcher.find_pattern_ids(risk.lower()):
+                score += points['risk_factor']
+                break  # Only add once for risk factors
+        
+        # Severity modifiers, e.g. "severe" or any bleeding/labor mention during pregnancy
+        for name, modifier_points in self.ruleset.modifier_points.items():
+            if f"modifier:{name}" in hits:
+                score += modifier_points
+        
+        return score
+    
+    def _patient_points(self, age: int, pregnancy_week: int = None, trimester: str = None) -> int:
+        """Points contributed by age, pregnancy week and trimester"""
+        points = self.ruleset.points
+        limits = self.ruleset.limits
+        score = 0
         
         # Age-based adjustments for pregnant women
-        if age < 18:  # Teenage pregnancy
-            score += 1
-        elif age > 35:  # Advanced maternal age
-            score += 1
+        if age < limits['teen_age_below']:  # Teenage pregnancy
+            score += points['teen_age']
+        elif age > limits['advanced_age_above']:  # Advanced maternal age
+            score += points['advanced_age']
         
         # Pregnancy week adjustments
         if pregnancy_week:
-            if pregnancy_week < 12:  # First trimester
-                score += 1  # Higher risk in early pregnancy
-            elif pregnancy_week > 36:  # Late pregnancy
-                score += 1  # Higher risk in late pregnancy
+            if pregnancy_week < limits['early_week_below']:  # Higher risk in early pregnancy
+                score += points['early_week']
+            elif pregnancy_week > limits['late_week_above']:  # Higher risk in late pregnancy
+                score += points['late_week']
         
-        # Trimester-specific adjustments
+        # Trimester-specific adjustments (higher monitoring in first and third trimesters)
         if trimester:
             if trimester.lower() == 'first':
-                score += 1  # Higher monitoring needed in first trimester
+                score += points['first_trimester']
             elif trimester.lower() == 'third':
-                score += 1  # Higher monitoring needed in third trimester
-        
-        # Risk factor adjustments
-        for risk in risk_conditions:
-            risk_lower = risk.lower()
-            if any(rf in risk_lower for rf in self.risk_factors):
-                score += 1
-                break  # Only add once for risk factors
+                score += points['third_trimester']
         
-        # Additional severity indicators for pregnancy
-        if any(word in symptoms for word in ['severe', 'severe pain', 'can\'t breathe', 'can\'t walk']):
-            score += 2
-        
-        if any(word in symptoms for word in ['sudden', 'acute', 'rapid onset']):
-            score += 1
-        
-        # Pregnancy-specific severity indicators
-        if any(word in symptoms for word in ['bleeding', 'blood', 'spotting']):
-            score += 2  # Any bleeding during pregnancy is concerning
+        return score
+    
+    def _patient_points_batch(self, ages: List[int], pregnancy_weeks: List[int], trimesters: List[str]) -> np.ndarray:
+        """Vectorized `_patient_points` over a batch of patients"""
+        points = self.ruleset.points
+        limits = self.ruleset.limits
+        age = np.asarray(ages, dtype=np.int64)
+        week = np.asarray([w or 0 for w in pregnancy_weeks], dtype=np.int64)
+        trimester = np.asarray([(t or '').lower() for t in trimesters])
+        
+        teen = age < limits['teen_age_below']
+        advanced = ~teen & (age > limits['advanced_age_above'])
+        early = (week != 0) & (week < limits['early_week_below'])
+        late = (week != 0) & ~early & (week > limits['late_week_above'])
+        
+        return (
+            teen * points['teen_age'] + advanced * points['advanced_age']
+            + early * points['early_week'] + late * points['late_week']
+            + (trimester == 'first') * points['first_trimester']
+            + (trimester == 'third') * points['third_trimester']
+        ).astype(np.int64)
+    
+    def triage_batch(self, patients: List[Dict]) -> List[TriageResult]:
+        """
+        Triage many patients at once
         
-        if any(word in symptoms for word in ['contractions', 'labor', 'birth']):
-            score += 2  # Labor-related symptoms are critical
+        Keyword matching is done per patient; the age, pregnancy week and trimester
+        adjustments, the score cap and the severity thresholds are applied as arrays.
         
-        return min(score, 10)  # Cap at 10
+        Args:
+            patients: List of dicts with 'symptoms', 'age' and optional
+                'risk_conditions', 'pregnancy_week' and 'trimester' keys
+                
+        Returns:
+            List of TriageResult in the same order, each with a ticket number
+        """
+        if not patients:
+            return []
+        
+        hits_list = []
+        keyword_points = np.empty(len(patients), dtype=np.int64)
+        for i, patient in enumerate(patients):
+            hits = self._match_symptoms(patient['symptoms'].lower())
+            risk_lower = [condition.lower() for condition in patient.get('risk_conditions') or []]
+            hits_list.append(hits)
+            keyword_points[i] = self._keyword_points(hits, risk_lower)
+        
+        patient_points = self._patient_points_batch(
+            [patient['age'] for patient in patients],
+            [patient.get('pregnancy_week') for patient in patients],
+            [patient.get('trimester') for patient in patients]
+        )
+        scores = np.minimum(keyword_points + patient_points, self.ruleset.max_score)
+        tiers = np.select(
+            [scores >= self.ruleset.critical_threshold, scores >= self.ruleset.urgent_threshold],
+            [0, 1], default=2
+        )
+        
+        tier_labels = [("Critical", "R"), ("Urgent", "Y"), ("Light", "G")]
+        results = []
+        for patient, hits, score, tier in zip(patients, hits_list, scores.tolist(), tiers.tolist()):
+            severity, color_code = tier_labels[tier]
+            analysis = self._analyze_hits(hits)
+            results.append(TriageResult(
+                severity=severity,
+                color_code=color_code,
+                score=score,
+                detected_keywords=analysis["detected_keywords"],
+                severity_indicators=analysis["severity_indicators"],
+                pregnancy_concerns=analysis["pregnancy_concerns"],
+                recommendations=analysis["recommendations"],
+                explanation=self.get_severity_explanation(severity, patient['symptoms']),
+                ticket_number=self._generate_ticket_number(color_code),
+                ruleset_version=self.ruleset.version,
+                risk_conditions=list(patient.get('risk_conditions') or [])
+            ))
+        
+        return results
     
     def _generate_ticket_number(self, color_code: str) -> str:
         """Generate a unique ticket number with color prefix"""
+        if self.ticket_allocator is not None:
+            return self.ticket_allocator.allocate(color_code)
+        
         # Generate 3 random digits
         random_number = random.randint(100, 999)
         return f"{color_code}{random_number}"
@@ -186,8 +387,10 @@ class EmergencyClassifier:
     
     def analyze_symptoms(self, symptoms: str) -> Dict[str, any]:
         """Detailed analysis of pregnancy symptoms for better classification"""
-        symptoms_lower = symptoms.lower()
-        
+        return self._analyze_hits(self._match_symptoms(symptoms.lower()))
+    
+    def _analyze_hits(self, hits: Dict[str, Set[str]]) -> Dict[str, any]:
+        """Build the detailed symptom analysis from the keyword hits of a single matcher pass"""
         analysis = {
             "detected_keywords": [],
             "severity_indicators": [],
@@ -195,36 +398,35 @@ class EmergencyClassifier:
             "pregnancy_concerns": []
         }
         
-        # Find detected keywords
-        all_keywords = self.critical_keywords + self.urgent_keywords + self.light_keywords
-        for keyword in all_keywords:
-            if keyword in symptoms_lower:
-                analysis["detected_keywords"].append(keyword)
+        # Report detected keywords in vocabulary order
+        found = hits.get('critical', set()) | hits.get('urgent', set()) | hits.get('light', set())
+        if found:
+            analysis["detected_keywords"] = [keyword for keyword in self.ruleset.all_keywords if keyword in found]
         
         # Check for severity indicators
-        if any(word in symptoms_lower for word in ['severe', 'acute', 'sudden']):
+        if 'indicator:high_severity' in hits:
             analysis["severity_indicators"].append("High severity indicators present")
         
-        if any(word in symptoms_lower for word in ['mild', 'slight', 'minor']):
+        if 'indicator:low_severity' in hits:
             analysis["severity_indicators"].append("Low severity indicators present")
         
         # Check for pregnancy-specific concerns
-        if any(word in symptoms_lower for word in ['bleeding', 'blood', 'spotting']):
+        if 'modifier:bleeding' in hits:
             analysis["pregnancy_concerns"].append("Vaginal bleeding detected - requires immediate evaluation")
         
-        if any(word in symptoms_lower for word in ['contractions', 'labor', 'birth']):
+        if 'modifier:labor' in hits:
             analysis["pregnancy_concerns"].append("Labor symptoms detected - immediate assessment needed")
         
-        if any(word in symptoms_lower for word in ['water breaking', 'leaking fluid']):
+        if 'indicator:membranes' in hits:
             analysis["pregnancy_concerns"].append("Possible rupture of membranes - urgent evaluation required")
         
-        if any(word in symptoms_lower for word in ['decreased movement', 'baby not moving']):
+        if 'indicator:fetal_movement' in hits:
             analysis["pregnancy_concerns"].append("Decreased fetal movement - needs immediate assessment")
         
         # Generate recommendations
-        if any(keyword in symptoms_lower for keyword in self.critical_keywords):
+        if 'critical' in hits:
             analysis["recommendations"].append("Immediate obstetric emergency care required")
-        elif any(keyword in symptoms_lower for keyword in self.urgent_keywords):
+        elif 'urgent' in hits:
             analysis["recommendations"].append("Urgent pregnancy care recommended")
         else:
             analysis["recommendations"].append("Routine prenatal care appropriate")
@@ -0,0 +1,226 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, or_, update
+
+from models import db, PatientIntake
+from services.eta_service import ETAService
+from services.eta_enrichment import ETA_CALCULATED
+
+
+def parse_coordinates(car_location: Optional[str]) -> Optional[Tuple[float, float]]:
+    """GPS coordinates of a stored car_location, or None for text addresses"""
+    if not car_location:
+        return None
+    try:
+        location = json.loads(car_location)
+        return float(location["lat"]), float(location["lng"])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def write_positions(mappings: List[Dict]) -> int:
+    """
+    Write live position fixes in one batched UPDATE, skipping rows that already
+    hold a newer fix (written by another worker process); the caller commits
+
+    Args:
+        mappings: Dicts with 'id', 'car_location', 'car_lat', 'car_lng',
+            'position_at' (UTC time of the fix) and 'eta_minutes'
+
+    Returns:
+        Number of rows written (rows sent where the database cannot count them)
+    """
+    if not mappings:
+        return 0
+    table = PatientIntake.__table__
+    statement = update(table).where(
+        table.c.id == bindparam("_id"),
+        or_(table.c.position_at.is_(None), table.c.position_at < bindparam("_position_at"))
+    ).values(
+        car_location=bindparam("_car_location"), car_lat=bindparam("_car_lat"), car_lng=bindparam("_car_lng"),
+        position_at=bindparam("_position_at"), eta_minutes=bindparam("_eta_minutes"),
+        eta_status=ETA_CALCULATED, updated_at=bindparam("_updated_at")
+    )
+    now = datetime.utcnow()
+    result = db.session.execute(statement, [{
+        "_id": m["id"], "_car_location": m["car_location"], "_car_lat": m["car_lat"], "_car_lng": m["car_lng"],
+        "_position_at": m["position_at"], "_eta_minutes": m["eta_minutes"], "_updated_at": now
+    } for m in mappings])
+    return result.rowcount if db.engine.dialect.supports_sane_multi_rowcount else len(mappings)
+
+
+class ETAEngine:
+    """
+    Recomputes ETAs for many patients at once.
+
+    Coordinates are gathered into NumPy arrays, the ETAs are computed by
+    `ETAService.calculate_etas` in one array operation (each to the facility the
+    patient was routed to), and the new values are written back with a single
+    batched UPDATE. Position fixes are only written over older ones
+    (see `write_positions`), and recomputed ETAs only where the position has
+    not changed since it was read, so several worker processes can share the
+    work. Must be used inside a Flask app context.
+    """
+
+    def __init__(self, eta_service: ETAService = None):
+        """
+        Args:
+            eta_service: Service holding the hospital location and driving speed
+        """
+        self.eta_service = eta_service or ETAService()
+
+    def apply_position_fixes(self, fixes: List[Dict]) -> List[Dict]:
+        """
+        Store new GPS positions of patients on their way and update their ETAs
+
+        Args:
+            fixes: Validated dicts with 'id', 'lat' and 'lng'
+
+        Returns:
+            One {"id", "eta_minutes"} dict per fix, in input order; eta_minutes is
+            None for an unknown patient id
+        """
+        if not fixes:
+            return []
+        ids = [fix["id"] for fix in fixes]
+        stored = {
+            intake_id: (car_location, facility_code)
+            for intake_id, car_location, facility_code in PatientIntake.query.with_entities(
+                PatientIntake.id, PatientIntake.car_location, PatientIntake.facility_code
+            ).filter(PatientIntake.id.in_(set(ids))).all()
+        }
+
+        lats = np.fromiter((fix["lat"] for fix in fixes), dtype=np.float64, count=len(fixes))
+        lngs = np.fromiter((fix["lng"] for fix in fixes), dtype=np.float64, count=len(fixes))
+        dest_lats, dest_lngs = self._destinations([stored.get(intake_id, (None, None))[1] for intake_id in ids])
+        etas = self.eta_service.calculate_etas(lats, lngs, dest_lats, dest_lngs).tolist()
+
+        # With several fixes for one patient the last one wins
+        received_at = datetime.utcnow()
+        latest: Dict[int, Dict] = {}
+        for fix, eta_minutes in zip(fixes, etas):
+            if fix["id"] not in stored:
+                continue
+            latest[fix["id"]] = {
+                "id": fix["id"],
+                "car_location": self._with_position(stored[fix["id"]][0], fix["lat"], fix["lng"]),
+                "car_lat": fix["lat"],
+                "car_lng": fix["lng"],
+                "position_at": received_at,
+                "eta_minutes": eta_minutes
+            }
+        try:
+            write_positions(list(latest.values()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return [{"id": fix["id"], "eta_minutes": eta_minutes if fix["id"] in stored else None}
+                for fix, eta_minutes in zip(fixes, etas)]
+
+    def recompute_en_route(self, window_hours: float = 6, skip_ids: Iterable[int] = ()) -> Dict:
+        """
+        Recompute the ETA of every patient en route: registered within the last
+        window_hours with an ETA and a GPS car location
+
+        Args:
+            window_hours: How far back registrations count as en route
+            skip_ids: Patients whose ETA is kept up to date elsewhere (the live
+                position tracker), left untouched
+
+        Returns:
+            Counts of patients checked, ETAs changed and patients skipped
+        """
+        since = datetime.utcnow() - timedelta(hours=window_hours)
+        rows = PatientIntake.query.with_entities(
+            PatientIntake.id, PatientIntake.car_location, PatientIntake.eta_minutes, PatientIntake.facility_code,
+            PatientIntake.position_at
+        ).filter(
+            PatientIntake.created_at >= since,
+            PatientIntake.eta_minutes.isnot(None),
+            PatientIntake.car_location.like('%"lat"%')
+        ).all()
+
+        skip_ids = set(skip_ids)
+        skipped = 0
+        ids, lats, lngs, current, facility_codes, position_times = [], [], [], [], [], []
+        for intake_id, car_location, eta_minutes, facility_code, position_at in rows:
+            if intake_id in skip_ids:
+                skipped += 1
+                continue
+            coordinates = parse_coordinates(car_location)
+            if coordinates is None:
+                continue
+            ids.append(intake_id)
+            lats.append(coordinates[0])
+            lngs.append(coordinates[1])
+            current.append(eta_minutes)
+            facility_codes.append(facility_code)
+            position_times.append(position_at)
+
+        if not ids:
+            return {"en_route": 0, "updated": 0, "skipped": skipped}
+
+        dest_lats, dest_lngs = self._destinations(facility_codes)
+        etas = self.eta_service.calculate_etas(np.asarray(lats), np.asarray(lngs), dest_lats, dest_lngs)
+        changed = np.flatnonzero(etas != np.asarray(current, dtype=np.int64))
+        updated = self._write_etas([{"id": ids[i], "position_at": position_times[i], "eta_minutes": int(etas[i])}
+                                    for i in changed])
+        return {"en_route": len(ids), "updated": updated, "skipped": skipped}
+
+    def _destinations(self, facility_codes: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Coordinates of each patient's facility (the configured hospital when unknown)"""
+        registry = self.eta_service.facilities
+        hospital = (self.eta_service.hospital_lat, self.eta_service.hospital_lng)
+        coordinates = {}
+        for code in set(facility_codes):
+            facility = registry.get(code) if registry else None
+            coordinates[code] = (facility.lat, facility.lng) if facility else hospital
+        dest_lats = np.fromiter((coordinates[code][0] for code in facility_codes), dtype=np.float64, count=len(facility_codes))
+        dest_lngs = np.fromiter((coordinates[code][1] for code in facility_codes), dtype=np.float64, count=len(facility_codes))
+        return dest_lats, dest_lngs
+
+    @staticmethod
+    def _with_position(car_location: Optional[str], lat: float, lng: float) -> str:
+        """The stored car_location with its coordinates replaced, keeping any address"""
+        try:
+            location = json.loads(car_location) if car_location else {}
+        except (json.JSONDecodeError, TypeError):
+            location = {}
+        if not isinstance(location, dict):
+            location = {"address": car_location}
+        location["lat"] = lat
+        location["lng"] = lng
+        return json.dumps(location)
+
+    @staticmethod
+    def _write_etas(mappings: List[Dict]) -> int:
+        """
+        Write new ETAs in one batched UPDATE, skipping rows whose position changed
+        since 'position_at' was read (a newer fix brought its own ETA)
+
+        Returns:
+            Number of rows written (rows sent where the database cannot count them)
+        """
+        if not mappings:
+            return 0
+        table = PatientIntake.__table__
+        statement = update(table).where(
+            table.c.id == bindparam("_id"),
+            table.c.position_at.is_not_distinct_from(bindparam("_position_at"))
+        ).values(eta_minutes=bindparam("_eta_minutes"), eta_status=ETA_CALCULATED, updated_at=bindparam("_updated_at"))
+        now = datetime.utcnow()
+        try:
+            result = db.session.execute(statement, [
+                {"_id": m["id"], "_position_at": m["position_at"], "_eta_minutes": m["eta_minutes"], "_updated_at": now}
+                for m in mappings
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result.rowcount if db.engine.dialect.supports_sane_multi_rowcount else len(mappings)
@@ -0,0 +1,204 @@
+import json
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from sqlalchemy.exc import OperationalError
+
+from models import db, PatientIntake
+from services.eta_service import ETAService
+
+# PatientIntake.eta_status values
+ETA_PENDING = "pending"
+ETA_CALCULATED = "calculated"
+ETA_FAILED = "failed"
+
+
+class ETAEnricher:
+    """
+    Fills in the ETA of intakes whose address must be geocoded online.
+
+    Intake stores the row with `eta_status = "pending"` and returns the ticket
+    straight away; a background thread pool then geocodes the address, computes
+    the ETA and updates the row (bumping `updated_at`, which the dashboard polls).
+    An address that cannot be geocoded is stored as `failed` with no ETA rather
+    than with the default city-wide estimate, so the dashboard never shows a
+    guess as calculated.
+
+    While Nominatim is unavailable (circuit breaker open, no answer in time,
+    network or server error) the row stays `pending` and the address is retried
+    after `retry_base` seconds, doubling up to `retry_max`, for up to
+    `max_attempts` attempts. Rows still pending after a restart are picked up
+    again by `resume_pending`.
+    """
+
+    def __init__(self, workers: int = 4, retry_base: float = 5.0, retry_max: float = 300.0, max_attempts: int = 10):
+        """
+        Args:
+            workers: Background threads geocoding addresses
+            retry_base: Seconds before the first retry while Nominatim is unavailable
+            retry_max: Longest wait between retries
+            max_attempts: Attempts before an intake is marked failed
+        """
+        self.workers = workers
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self._app = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Heap of (due time, sequence, intake id, car location, attempt) waiting to be retried
+        self._retries: List[Tuple[float, int, int, Dict, int]] = []
+        self._retry_sequence = itertools.count()
+        self._retry_wakeup = threading.Condition(self._lock)
+        self._retrier: Optional[threading.Thread] = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def init_app(self, app):
+        """Bind the enricher to the Flask app whose database it updates"""
+        with self._lock:
+            self._app = app
+            self.workers = app.config.get('ETA_ENRICHMENT_WORKERS', self.workers)
+            self.retry_base = app.config.get('ETA_RETRY_BASE_SECONDS', self.retry_base)
+            self.retry_max = app.config.get('ETA_RETRY_MAX_SECONDS', self.retry_max)
+            self.max_attempts = app.config.get('ETA_RETRY_ATTEMPTS', self.max_attempts)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="eta-enrichment")
+            return self._executor
+
+    def submit(self, intake_id: int, car_location: Dict):
+        """Queue one committed intake for ETA calculation"""
+        if self._app is None:
+            raise RuntimeError("ETAEnricher is not bound to an app; call init_app first")
+        with self._lock:
+            self.submitted += 1
+        self._pool().submit(self._enrich, intake_id, car_location, 1)
+
+    def _schedule_retry(self, intake_id: int, car_location: Dict, attempt: int) -> float:
+        """Queue another attempt after an exponential backoff and return the delay"""
+        delay = min(self.retry_base * 2 ** (attempt - 2), self.retry_max)
+        with self._lock:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._retry_sequence),
+                                           intake_id, car_location, attempt))
+            self.retried += 1
+            if self._retrier is None or not self._retrier.is_alive():
+                self._retrier = threading.Thread(target=self._run_retries, name="eta-retry", daemon=True)
+                self._retrier.start()
+            self._retry_wakeup.notify()
+        return delay
+
+    def _run_retries(self):
+        """Hand retries to the worker pool as they fall due"""
+        while True:
+            with self._lock:
+                while not self._retries or self._retries[0][0] > time.monotonic():
+                    self._retry_wakeup.wait(self._retries[0][0] - time.monotonic() if self._retries else None)
+                _, _, intake_id, car_location, attempt = heapq.heappop(self._retries)
+            self._pool().submit(self._enrich, intake_id, car_location, attempt)
+
+    def resume_pending(self) -> int:
+        """
+        Re-queue intakes left pending by a previous process
+
+        Must be called inside a Flask app context.
+
+        Returns:
+            Number of intakes queued
+        """
+        try:
+            pending = PatientIntake.query.with_entities(PatientIntake.id, PatientIntake.car_location) \
+                .filter(PatientIntake.eta_status == ETA_PENDING).all()
+        except OperationalError as e:
+            db.session.rollback()
+            print(f"Could not look for pending ETAs (run migrate_eta_status.py on older databases): {e}")
+            return 0
+        for intake_id, car_location in pending:
+            try:
+                location = json.loads(car_location) if car_location else None
+            except (json.JSONDecodeError, TypeError):
+                location = None
+            if not isinstance(location, dict):
+                # Plain-text locations were stored as-is
+                location = {"address": car_location} if car_location else None
+            if location:
+                self.submit(intake_id, location)
+        return len(pending)
+
+    def _enrich(self, intake_id: int, car_location: Dict, attempt: int):
+        with self._app.app_context():
+            try:
+                eta_service = ETAService()
+                # Nobody is waiting on this thread, so the lookup may take up to the full HTTP
+                # timeout rather than the latency budget; if it runs longer the row is retried,
+                # and the late answer is in the geocode cache by then
+                eta_minutes, facility = eta_service.get_route_from_location(
+                    car_location, fallback=False, geocode_timeout=eta_service.nominatim.timeout
+                )
+                position = eta_service.last_position
+                status = ETA_CALCULATED
+            except requests.RequestException as e:
+                # Nominatim unavailable: the address may still be found later, so the row stays pending
+                if attempt < self.max_attempts:
+                    delay = self._schedule_retry(intake_id, car_location, attempt + 1)
+                    print(f"ETA enrichment for intake {intake_id} retrying in {delay:g}s: {e}")
+                    db.session.remove()
+                    return
+                print(f"ETA enrichment failed for intake {intake_id} after {attempt} attempts: {e}")
+                eta_minutes, facility, position = None, None, None
+                status = ETA_FAILED
+            except Exception as e:
+                print(f"ETA enrichment failed for intake {intake_id}: {e}")
+                eta_minutes, facility, position = None, None, None
+                status = ETA_FAILED
+
+            try:
+                # A live GPS fix that arrived meanwhile already brought its own position and ETA
+                PatientIntake.query.filter_by(id=intake_id).filter(PatientIntake.position_at.is_(None)).update({
+                    "eta_minutes": eta_minutes,
+                    "eta_status": status,
+                    "facility_code": facility.code if facility else None,
+                    "car_lat": position[0] if position else None,
+                    "car_lng": position[1] if position else None,
+                    "updated_at": datetime.utcnow()
+                })
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                status = ETA_FAILED
+                print(f"Could not save ETA for intake {intake_id}: {e}")
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            if status == ETA_CALCULATED:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> Dict:
+        """Enrichment counters for monitoring"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "in_progress": self.submitted - self.completed - self.failed,
+                "retried": self.retried,
+                "waiting_retry": len(self._retries)
+            }
+
+
+# Shared by every request in the process
+eta_enricher = ETAEnricher()
@@ -0,0 +1,186 @@
+import os
+import json
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_GRID_PATH = os.path.join(BASE_DIR, "data", "eta_grid.npy")
+
+# Stored for cells without an ETA
+NO_ETA = np.iinfo(np.uint16).max
+
+
+def metadata_path(grid_path: str) -> str:
+    """JSON file describing a grid file (bounding box, cell size, facilities, time bands)"""
+    return os.path.splitext(grid_path)[0] + ".json"
+
+
+def _coordinate_key(lat: float, lng: float) -> Tuple[float, float]:
+    return round(float(lat), 6), round(float(lng), 6)
+
+
+class ETAGrid:
+    """
+    Precomputed ETAs to each facility over a regular lat/lng grid.
+
+    `build_eta_grid.py` computes the ETA from the centre of every cell of the
+    service area to every facility, for each time-of-day band, and writes a
+    uint16 array of shape (facilities, bands, rows, cols) as a .npy file with a
+    JSON description next to it. The array is opened with `mmap_mode="r"`, so it
+    is loaded lazily and all worker processes share the same page-cache pages.
+    A lookup is one array index. Points outside the grid, and destinations that
+    are not one of its facilities, return None so the caller computes the ETA.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_GRID_PATH):
+        """
+        Args:
+            path: .npy grid written by build_eta_grid.py (None disables the grid)
+        """
+        self.path = path
+        self._grid: Optional[np.ndarray] = None
+        self._meta: Optional[Dict] = None
+        self._destinations: Dict[Tuple[float, float], int] = {}
+        self._load_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Apply grid settings from the Flask app config (the file is mapped on first use)"""
+        with self._lock:
+            self.path = app.config.get('ETA_GRID_PATH', self.path)
+            self._grid = None
+            self._meta = None
+            self._load_error = None
+
+    @property
+    def available(self) -> bool:
+        """Whether a grid file is mapped (mapping it now if needed)"""
+        return self._get_grid() is not None
+
+    def _get_grid(self) -> Optional[np.ndarray]:
+        if self._grid is not None or self._load_error is not None or not self.path:
+            return self._grid
+        with self._lock:
+            if self._grid is None and self._load_error is None:
+                if not os.path.exists(self.path):
+                    self._load_error = f"{self.path} not found"
+                else:
+                    try:
+                        with open(metadata_path(self.path), encoding="utf-8") as f:
+                            meta = json.load(f)
+                        grid = np.load(self.path, mmap_mode="r")
+                        expected = (len(meta["facilities"]), len(meta["bands"]), meta["rows"], meta["cols"])
+                        if grid.shape != expected:
+                            raise ValueError(f"grid shape {grid.shape} does not match its metadata {expected}")
+                        self._destinations = {
+                            _coordinate_key(f["lat"], f["lng"]): i for i, f in enumerate(meta["facilities"])
+                        }
+                        self._meta = meta
+                        self._grid = grid
+                    except (OSError, KeyError, TypeError, ValueError) as e:
+                        self._load_error = str(e)
+                        print(f"ETA grid not loaded from {self.path}: {e}")
+        return self._grid
+
+    def band(self, when: Optional[datetime] = None) -> int:
+        """Index of the time-of-day band for a moment (default: now, server local time)"""
+        hour = (when or datetime.now()).hour
+        for index, band in enumerate(self._meta["bands"]):
+            start, end = band.get("start"), band.get("end")
+            if start is None:
+                continue
+            if (start <= hour < end) if start < end else (hour >= start or hour < end):
+                return index
+        return 0
+
+    def _cell(self, lat: float, lng: float) -> Optional[Tuple[int, int]]:
+        meta = self._meta
+        row = math.floor((lat - meta["min_lat"]) / meta["cell_degrees"])
+        col = math.floor((lng - meta["min_lng"]) / meta["cell_degrees"])
+        if 0 <= row < meta["rows"] and 0 <= col < meta["cols"]:
+            return row, col
+        return None
+
+    def lookup(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float,
+               when: Optional[datetime] = None) -> Optional[int]:
+        """
+        ETA in minutes from the grid cell containing the origin to a facility
+
+        Returns:
+            Minutes, or None if the origin is outside the grid or the destination is not a grid facility
+        """
+        grid = self._get_grid()
+        if grid is None:
+            return None
+        facility = self._destinations.get(_coordinate_key(dest_lat, dest_lng))
+        cell = self._cell(origin_lat, origin_lng) if facility is not None else None
+        if cell is None:
+            self.misses += 1
+            return None
+        minutes = int(grid[facility, self.band(when), cell[0], cell[1]])
+        if minutes == NO_ETA:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return minutes
+
+    def lookup_many(self, origin_lats: np.ndarray, origin_lngs: np.ndarray, dest_lats, dest_lngs,
+                    when: Optional[datetime] = None) -> np.ndarray:
+        """
+        Vectorized lookup
+
+        Returns:
+            Integer array of minutes, -1 where the grid has no answer
+        """
+        origin_lats = np.asarray(origin_lats, dtype=np.float64)
+        origin_lngs = np.asarray(origin_lngs, dtype=np.float64)
+        result = np.full(len(origin_lats), -1, dtype=np.int64)
+        grid = self._get_grid()
+        if grid is None or not len(origin_lats):
+            return result
+
+        meta = self._meta
+        dest_lats = np.broadcast_to(np.asarray(dest_lats, dtype=np.float64), origin_lats.shape)
+        dest_lngs = np.broadcast_to(np.asarray(dest_lngs, dtype=np.float64), origin_lats.shape)
+        facilities = np.fromiter(
+            (self._destinations.get(_coordinate_key(lat, lng), -1) for lat, lng in zip(dest_lats.tolist(), dest_lngs.tolist())),
+            dtype=np.int64, count=len(origin_lats)
+        )
+        rows = np.floor((origin_lats - meta["min_lat"]) / meta["cell_degrees"]).astype(np.int64)
+        cols = np.floor((origin_lngs - meta["min_lng"]) / meta["cell_degrees"]).astype(np.int64)
+        inside = (facilities >= 0) & (rows >= 0) & (rows < meta["rows"]) & (cols >= 0) & (cols < meta["cols"])
+
+        minutes = grid[facilities[inside], self.band(when), rows[inside], cols[inside]].astype(np.int64)
+        minutes[minutes == NO_ETA] = -1
+        result[inside] = minutes
+        answered = int((result >= 0).sum())
+        self.hits += answered
+        self.misses += len(result) - answered
+        return result
+
+    def stats(self) -> Dict:
+        """Grid description and lookup counters for monitoring"""
+        grid = self._get_grid()
+        meta = self._meta or {}
+        return {
+            "path": self.path,
+            "loaded": grid is not None,
+            "load_error": self._load_error,
+            "shape": list(grid.shape) if grid is not None else None,
+            "cell_degrees": meta.get("cell_degrees"),
+            "facilities": [f["code"] for f in meta.get("facilities", [])],
+            "bands": [band["name"] for band in meta.get("bands", [])],
+            "built_at": meta.get("built_at"),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Shared by every ETAService in the process
+eta_grid = ETAGrid()
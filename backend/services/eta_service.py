@@ -1,27 +1,85 @@
 import requests
 import json
 import math
+import threading
+import numpy as np
+from collections import Counter
 from flask import current_app
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+from services.geocode_cache import geocode_cache as shared_geocode_cache
+from services.gazetteer import gazetteer as shared_gazetteer
+from services.nominatim_client import AddressNotFound, GeocoderUnavailable, nominatim_client as shared_nominatim_client
+from services.facility_registry import Facility, facility_registry as shared_facility_registry
+from services.road_router import road_router as shared_road_router
+from services.eta_grid import eta_grid as shared_eta_grid
+
+
+class ETAFallbacks:
+    """Counts of ETAs that could not use a fresh geocoding result, by fallback tier and reason"""
+
+    def __init__(self):
+        self._tiers = Counter()
+        self._reasons = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, tier: str, reason: str):
+        with self._lock:
+            self._tiers[tier] += 1
+            self._reasons[reason] += 1
+
+    def stats(self) -> Dict:
+        """Fallback counters for monitoring"""
+        with self._lock:
+            return {"tiers": dict(self._tiers), "reasons": dict(self._reasons)}
+
+
+# Shared by every ETAService in the process
+eta_fallbacks = ETAFallbacks()
 
 
 class ETAService:
     """Service for calculating ETA using OpenStreetMap/Nominatim APIs"""
     
-    def __init__(self):
+    def __init__(self, geocode_cache=shared_geocode_cache, gazetteer=shared_gazetteer,
+                 nominatim=shared_nominatim_client, facilities=shared_facility_registry,
+                 router=shared_road_router, eta_grid=shared_eta_grid):
+        """
+        Args:
+            geocode_cache: Cache of geocoding results (None to always query Nominatim)
+            gazetteer: Offline place-name geocoder tried before anything else (None to skip)
+            nominatim: Rate-limited Nominatim client used for everything else
+            facilities: Registry of facilities patients are routed to (None for the configured hospital only)
+            router: Offline road-network router (None, or no graph file, for the straight-line estimate)
+            eta_grid: Precomputed ETA grid answering GPS ETAs to facilities (None to always compute)
+        """
+        self.geocode_cache = geocode_cache
+        self.gazetteer = gazetteer
+        self.nominatim = nominatim
+        self.facilities = facilities
+        self.router = router
+        self.eta_grid = eta_grid
+        self.facility_candidates = current_app.config.get('FACILITY_CANDIDATES', 3)
         self.hospital_lat = current_app.config.get('HOSPITAL_LAT')
         self.hospital_lng = current_app.config.get('HOSPITAL_LNG')
         self.average_speed = current_app.config.get('AVERAGE_DRIVING_SPEED_KMH', 50)
+        self.fallback_minutes = current_app.config.get('ETA_FALLBACK_MINUTES', 30)
+        # Coordinates the last get_route_from_location call routed from (None after a fallback)
+        self.last_position: Optional[Tuple[float, float]] = None
         
         if not self.hospital_lat or not self.hospital_lng:
             raise ValueError("Hospital coordinates not configured")
     
-    def geocode_address(self, address: str) -> Tuple[float, float]:
+    def geocode_address(self, address: str, timeout: Optional[float] = None) -> Tuple[float, float]:
         """
-        Convert text address to GPS coordinates using Nominatim (OpenStreetMap)
+        Convert text address to GPS coordinates: from the offline gazetteer, the geocode
+        cache or, failing both, Nominatim (OpenStreetMap). If Nominatim is unavailable
+        (breaker open, latency budget exceeded or request failed), an expired cache
+        entry is used when there is one.
         
         Args:
             address: Text address to geocode
+            timeout: Longest total wait for Nominatim in seconds, rate-limit queue
+                included (default: the latency budget)
             
         Returns:
             Tuple of (latitude, longitude)
@@ -30,32 +88,77 @@ class ETAService:
             ValueError: If address cannot be geocoded
             requests.RequestException: If API request fails
         """
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': address,
-            'format': 'json',
-            'limit': 1,
-            'addressdetails': 1
-        }
-        headers = {
-            'User-Agent': 'HospitalIntakeSystem/1.0'  # Required by Nominatim
-        }
-        
+        resolved, coordinates = self.geocode_offline(address)
+        if resolved:
+            if coordinates is None:
+                raise AddressNotFound("Invalid geocoding response: Address not found (cached)")
+            return coordinates
+
+        if self.geocode_cache is None:
+            return self._nominatim_geocode(address, timeout)
+
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data:
-                raise ValueError("Address not found")
-            
-            location = data[0]
-            return float(location['lat']), float(location['lon'])
-            
-        except requests.RequestException as e:
-            raise requests.RequestException(f"Geocoding API request failed: {str(e)}")
-        except (KeyError, ValueError, TypeError, IndexError) as e:
-            raise ValueError(f"Invalid geocoding response: {str(e)}")
+            coordinates = self._nominatim_geocode(address, timeout)
+        except AddressNotFound:
+            # Remember misses too so a bad address is not looked up on every intake
+            self.geocode_cache.put(address, None)
+            raise
+        except (requests.RequestException, ValueError) as e:
+            if isinstance(e, GeocoderUnavailable) and e.pending is not None:
+                # Cache the answer when it arrives so the next intake gets it straight away
+                e.pending.add_done_callback(lambda future: self._cache_late_result(address, future))
+            hit, stale = self.geocode_cache.get(address, allow_stale=True)
+            if hit and stale is not None:
+                eta_fallbacks.record("stale_cache", self._fallback_reason(e))
+                return stale
+            raise
+        self.geocode_cache.put(address, coordinates)
+        return coordinates
+    
+    def _cache_late_result(self, address: str, future):
+        """Store the result of a lookup that finished after its caller gave up"""
+        error = future.exception()
+        if error is None:
+            self.geocode_cache.put(address, future.result())
+        elif isinstance(error, AddressNotFound):
+            self.geocode_cache.put(address, None)
+    
+    @staticmethod
+    def _fallback_reason(error: Exception) -> str:
+        if isinstance(error, GeocoderUnavailable):
+            return "circuit_open" if error.pending is None else "budget_exceeded"
+        if isinstance(error, AddressNotFound):
+            return "not_found"
+        return "upstream_error"
+    
+    def geocode_offline(self, address: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """
+        Geocode an address without any network call, from the gazetteer or the geocode cache
+        
+        Returns:
+            (resolved, coordinates). When resolved is False the address needs Nominatim;
+            when resolved is True and coordinates is None the address is known not to exist.
+        """
+        if self.gazetteer is not None:
+            place = self.gazetteer.lookup(address)
+            if place is not None:
+                return True, (place.lat, place.lng)
+        
+        if self.geocode_cache is not None:
+            return self.geocode_cache.get(address)
+        return False, None
+    
+    def _nominatim_geocode(self, address: str, timeout: Optional[float] = None) -> Tuple[float, float]:
+        """
+        Geocode an address with the Nominatim search API, waiting at most timeout
+        seconds in total (default: the latency budget)
+        
+        Raises:
+            AddressNotFound: If Nominatim has no match for the address
+            ValueError: If the response cannot be parsed
+            requests.RequestException: If API request fails
+        """
+        return self.nominatim.search(address, timeout)
     
     def haversine_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """
@@ -81,13 +184,81 @@ class ETAService:
         r = 6371
         return c * r
     
-    def calculate_eta(self, origin_lat: float, origin_lng: float) -> int:
+    def haversine_distances(self, lats: np.ndarray, lngs: np.ndarray,
+                            dest_lats=None, dest_lngs=None) -> np.ndarray:
+        """
+        Vectorized haversine_distance from many points to the hospital (or to
+        per-point destinations)
+        
+        Args:
+            lats, lngs: Arrays of coordinates in decimal degrees
+            dest_lats, dest_lngs: Destination coordinates, scalars or arrays (default: the hospital)
+            
+        Returns:
+            Array of distances in kilometers
+        """
+        lat1 = np.radians(np.asarray(lats, dtype=np.float64))
+        lon1 = np.radians(np.asarray(lngs, dtype=np.float64))
+        lat2 = np.radians(np.asarray(self.hospital_lat if dest_lats is None else dest_lats, dtype=np.float64))
+        lon2 = np.radians(np.asarray(self.hospital_lng if dest_lngs is None else dest_lngs, dtype=np.float64))
+        
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+        c = 2 * np.arcsin(np.sqrt(a))
+        return c * 6371
+    
+    def calculate_etas(self, origin_lats: np.ndarray, origin_lngs: np.ndarray,
+                       dest_lats=None, dest_lngs=None) -> np.ndarray:
         """
-        Calculate ETA in minutes from origin to hospital using haversine distance
+        Vectorized calculate_eta: ETAs for many origins in one array operation
+        
+        Args:
+            origin_lats, origin_lngs: Arrays of origin coordinates
+            dest_lats, dest_lngs: Destination coordinates, scalars or arrays (default: the hospital)
+            
+        Returns:
+            Integer array of ETAs in minutes, clipped to 1-480 like calculate_eta
+        """
+        if self.eta_grid is not None and self.eta_grid.available:
+            origin_lats = np.asarray(origin_lats, dtype=np.float64)
+            origin_lngs = np.asarray(origin_lngs, dtype=np.float64)
+            dest_lats = np.broadcast_to(np.asarray(self.hospital_lat if dest_lats is None else dest_lats, dtype=np.float64), origin_lats.shape)
+            dest_lngs = np.broadcast_to(np.asarray(self.hospital_lng if dest_lngs is None else dest_lngs, dtype=np.float64), origin_lats.shape)
+            eta_minutes = self.eta_grid.lookup_many(origin_lats, origin_lngs, dest_lats, dest_lngs)
+            missing = np.flatnonzero(eta_minutes < 0)
+            if len(missing):
+                eta_minutes[missing] = self._compute_etas(origin_lats[missing], origin_lngs[missing],
+                                                          dest_lats[missing], dest_lngs[missing])
+            return eta_minutes
+        return self._compute_etas(origin_lats, origin_lngs, dest_lats, dest_lngs)
+    
+    def _compute_etas(self, origin_lats: np.ndarray, origin_lngs: np.ndarray,
+                      dest_lats=None, dest_lngs=None) -> np.ndarray:
+        """calculate_etas without the precomputed grid"""
+        road_distance_km = self.haversine_distances(origin_lats, origin_lngs, dest_lats, dest_lngs) * 1.4
+        eta_minutes = (road_distance_km / self.average_speed * 60).astype(np.int64)
+        
+        if self.router is not None and self.router.available:
+            seconds = self.router.travel_times(
+                origin_lats, origin_lngs,
+                self.hospital_lat if dest_lats is None else dest_lats,
+                self.hospital_lng if dest_lngs is None else dest_lngs
+            )
+            routed = ~np.isnan(seconds)
+            eta_minutes[routed] = (seconds[routed] / 60).astype(np.int64)
+        return np.clip(eta_minutes, 1, 480)
+    
+    def calculate_eta(self, origin_lat: float, origin_lng: float, destination: Optional[Facility] = None) -> int:
+        """
+        Calculate ETA in minutes from origin to hospital: from the precomputed ETA grid,
+        else the shortest driving time over the offline road graph when one is loaded,
+        otherwise from the haversine distance
         
         Args:
             origin_lat: Origin latitude
             origin_lng: Origin longitude
+            destination: Facility to drive to (default: the configured hospital)
             
         Returns:
             ETA in minutes (estimated)
@@ -96,9 +267,22 @@ class ETAService:
             ValueError: If coordinates are invalid
         """
         # Calculate straight-line distance
+        dest_lat, dest_lng = (destination.lat, destination.lng) if destination else (self.hospital_lat, self.hospital_lng)
+        
+        if self.eta_grid is not None and self.eta_grid.available:
+            eta_minutes = self.eta_grid.lookup(origin_lat, origin_lng, dest_lat, dest_lng)
+            if eta_minutes is not None:
+                return eta_minutes
+        
+        if self.router is not None and self.router.available:
+            seconds = self.router.travel_time(origin_lat, origin_lng, dest_lat, dest_lng)
+            if seconds is not None:
+                return max(1, min(int(seconds / 60), 480))
+        
+        # No road graph, or the point is off it: straight-line estimate
         distance_km = self.haversine_distance(
             origin_lat, origin_lng, 
-            self.hospital_lat, self.hospital_lng
+            dest_lat, dest_lng
         )
         
         # Estimate driving time (straight-line distance * factor for roads)
@@ -112,6 +296,38 @@ class ETAService:
         # Ensure reasonable range (1 minute to 8 hours)
         return max(1, min(eta_minutes, 480))
     
+    def route(self, origin_lat: float, origin_lng: float) -> Tuple[int, Optional[Facility]]:
+        """
+        Pick the facility a patient should drive to: the one with the lowest ETA among
+        the nearest FACILITY_CANDIDATES facilities
+        
+        Returns:
+            (ETA in minutes, facility). The facility is None when no registry is used,
+            and the ETA is then to the configured hospital.
+        """
+        candidates = self.facilities.nearest(origin_lat, origin_lng, self.facility_candidates) if self.facilities else []
+        if not candidates:
+            return self.calculate_eta(origin_lat, origin_lng), None
+        # Nearest first, so ties go to the closer facility
+        return min(((self.calculate_eta(origin_lat, origin_lng, facility), facility) for facility, _ in candidates),
+                   key=lambda option: option[0])
+    
+    def nearest_facilities(self, origin_lat: float, origin_lng: float, k: int = 3) -> List[Dict]:
+        """
+        The k nearest facilities with their distance and ETA
+        
+        Returns:
+            List of {"code", "name", "distance_km", "eta_minutes"} dicts, nearest first
+        """
+        if not self.facilities:
+            return []
+        return [{
+            "code": facility.code,
+            "name": facility.name,
+            "distance_km": round(distance_km, 2),
+            "eta_minutes": self.calculate_eta(origin_lat, origin_lng, facility)
+        } for facility, distance_km in self.facilities.nearest(origin_lat, origin_lng, k)]
+    
     def get_eta_from_location(self, car_location: Dict) -> int:
         """
         Calculate ETA from car location to hospital
@@ -128,6 +344,28 @@ class ETAService:
             ValueError: If location is invalid or ETA cannot be calculated
             requests.RequestException: If API request fails
         """
+        return self.get_route_from_location(car_location)[0]
+    
+    def get_route_from_location(self, car_location: Dict, fallback: bool = True,
+                                geocode_timeout: Optional[float] = None) -> Tuple[int, Optional[Facility]]:
+        """
+        Calculate ETA from car location to the facility the patient is routed to
+        
+        Args:
+            car_location: Same as for get_eta_from_location
+            fallback: Answer an address that cannot be geocoded with the default
+                city-wide estimate; if False the geocoding error is raised instead
+            geocode_timeout: Longest total wait for Nominatim in seconds (default: the latency budget)
+                
+        Returns:
+            (ETA in minutes, facility); with fallback, (ETA_FALLBACK_MINUTES, default
+            facility) when the address cannot be geocoded
+            
+        Raises:
+            ValueError: If location is invalid or ETA cannot be calculated
+            requests.RequestException: If API request fails
+        """
+        self.last_position = None
         if not car_location:
             raise ValueError("Car location is required")
         
@@ -141,7 +379,8 @@ class ETAService:
                 if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
                     raise ValueError("Invalid GPS coordinates")
                 
-                return self.calculate_eta(lat, lng)
+                self.last_position = (lat, lng)
+                return self.route(lat, lng)
                 
             except (ValueError, TypeError):
                 raise ValueError("Invalid GPS coordinates format")
@@ -154,14 +393,63 @@ class ETAService:
             
             try:
                 # Geocode the address first
-                lat, lng = self.geocode_address(address)
-                return self.calculate_eta(lat, lng)
+                lat, lng = self.geocode_address(address, geocode_timeout)
+                self.last_position = (lat, lng)
+                return self.route(lat, lng)
             except (requests.RequestException, ValueError) as e:
+                if not fallback:
+                    raise
                 # If geocoding fails, provide a reasonable default estimate
                 # This assumes the address is somewhere in the same city
                 print(f"Geocoding failed for '{address}': {e}")
-                print("Using default city-wide estimate of 30 minutes")
-                return 30
+                print(f"Using default city-wide estimate of {self.fallback_minutes} minutes")
+                eta_fallbacks.record("default", self._fallback_reason(e))
+                return self.fallback_minutes, self.facilities.default if self.facilities else None
         
         else:
             raise ValueError("Car location must contain either 'lat'/'lng' or 'address'")
+    
+    def get_offline_eta(self, car_location: Dict) -> Optional[int]:
+        """
+        Calculate ETA only if it needs no network call (GPS coordinates, or an address
+        the gazetteer or geocode cache can resolve)
+        
+        Args:
+            car_location: Same as for get_eta_from_location
+            
+        Returns:
+            ETA in minutes, or None when the address has to be geocoded online or is
+            known not to exist
+            
+        Raises:
+            ValueError: If location is invalid
+        """
+        route = self.get_offline_route(car_location)
+        return route[0] if route is not None else None
+    
+    def get_offline_route(self, car_location: Dict) -> Optional[Tuple[int, Optional[Facility]]]:
+        """
+        Like get_route_from_location, but only if it needs no network call, and
+        never with the default city-wide estimate
+        
+        Returns:
+            (ETA in minutes, facility); (None, None) when the address is known not to
+            exist (cached as not found); None when the address has to be geocoded online
+            
+        Raises:
+            ValueError: If location is invalid
+        """
+        if car_location and 'address' in car_location and not ('lat' in car_location and 'lng' in car_location):
+            self.last_position = None
+            address = car_location['address'].strip()
+            if not address:
+                raise ValueError("Address cannot be empty")
+            resolved, coordinates = self.geocode_offline(address)
+            if not resolved:
+                return None
+            if coordinates is None:
+                return None, None
+            self.last_position = coordinates
+            return self.route(*coordinates)
+        
+        return self.get_route_from_location(car_location)
@@ -0,0 +1,179 @@
+import os
+import csv
+import math
+import heapq
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_FACILITIES_PATH = os.path.join(BASE_DIR, "data", "facilities.csv")
+
+EARTH_RADIUS_KM = 6371
+
+
+class Facility(NamedTuple):
+    code: str
+    name: str
+    lat: float
+    lng: float
+
+
+def _unit_vector(lat: float, lng: float) -> Tuple[float, float, float]:
+    """Point on the unit sphere; straight-line (chord) distance between these orders points like great-circle distance"""
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class _Node(NamedTuple):
+    index: int
+    axis: int
+    left: Optional["_Node"]
+    right: Optional["_Node"]
+
+
+class FacilityRegistry:
+    """
+    The group's facilities, indexed for nearest-facility lookups.
+
+    Facilities are loaded from a CSV file (code, name, lat, lng); the first row is
+    the default facility used when a patient's location is unknown. Without a
+    file, the registry holds the single hospital from HOSPITAL_LAT/HOSPITAL_LNG.
+    Locations are indexed in a KD-tree over points on the unit sphere, so the k
+    nearest facilities are found in O(log n) without any special case near the
+    antimeridian.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_FACILITIES_PATH):
+        """
+        Args:
+            path: CSV file with code, name, lat, lng columns (None for the configured hospital only)
+        """
+        self.path = path
+        self._facilities: List[Facility] = []
+        self._by_code: Dict[str, Facility] = {}
+        self._points: List[Tuple[float, float, float]] = []
+        self._root: Optional[_Node] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Load the facilities named in the Flask app config"""
+        hospital = None
+        if app.config.get('HOSPITAL_LAT') is not None and app.config.get('HOSPITAL_LNG') is not None:
+            hospital = Facility("MAIN", app.config.get('HOSPITAL_NAME', "Main Hospital"),
+                                float(app.config['HOSPITAL_LAT']), float(app.config['HOSPITAL_LNG']))
+        with self._lock:
+            self.path = app.config.get('FACILITIES_PATH', self.path)
+            facilities = self._read(self.path) if self.path else []
+            if not facilities and hospital is not None:
+                facilities = [hospital]
+            self._index(facilities)
+
+    def load(self, facilities: List[Facility]):
+        """Replace the registry with the given facilities"""
+        with self._lock:
+            self._index(facilities)
+
+    @staticmethod
+    def _read(path: str) -> List[Facility]:
+        facilities = []
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        facilities.append(Facility(row["code"].strip(), row["name"].strip(),
+                                                   float(row["lat"]), float(row["lng"])))
+                    except (KeyError, TypeError, ValueError, AttributeError):
+                        continue
+        except OSError as e:
+            print(f"Facilities not loaded from {path}: {e}")
+        return facilities
+
+    def _index(self, facilities: List[Facility]):
+        """Build the KD-tree (called with the lock held)"""
+        points = [_unit_vector(f.lat, f.lng) for f in facilities]
+
+        def build(indices: List[int], depth: int) -> Optional[_Node]:
+            if not indices:
+                return None
+            axis = depth % 3
+            indices.sort(key=lambda i: points[i][axis])
+            middle = len(indices) // 2
+            return _Node(indices[middle], axis,
+                         build(indices[:middle], depth + 1),
+                         build(indices[middle + 1:], depth + 1))
+
+        self._facilities = list(facilities)
+        self._by_code = {f.code: f for f in facilities}
+        self._points = points
+        self._root = build(list(range(len(facilities))), 0)
+
+    def __len__(self) -> int:
+        return len(self._facilities)
+
+    @property
+    def facilities(self) -> List[Facility]:
+        return list(self._facilities)
+
+    @property
+    def default(self) -> Optional[Facility]:
+        """Facility used when a patient's location is unknown"""
+        return self._facilities[0] if self._facilities else None
+
+    def get(self, code: Optional[str]) -> Optional[Facility]:
+        return self._by_code.get(code) if code else None
+
+    def nearest(self, lat: float, lng: float, k: int = 3) -> List[Tuple[Facility, float]]:
+        """
+        The k facilities closest to a point
+
+        Args:
+            lat, lng: Patient location in decimal degrees
+            k: Number of facilities to return
+
+        Returns:
+            (facility, great-circle distance in km) pairs, nearest first
+        """
+        root, points, facilities = self._root, self._points, self._facilities
+        if root is None or k <= 0:
+            return []
+        target = _unit_vector(lat, lng)
+        # Max-heap of the best k so far as (-squared distance, index)
+        best: List[Tuple[float, int]] = []
+
+        def search(node: Optional[_Node]):
+            if node is None:
+                return
+            point = points[node.index]
+            distance = sum((point[i] - target[i]) ** 2 for i in range(3))
+            if len(best) < k:
+                heapq.heappush(best, (-distance, node.index))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, node.index))
+
+            delta = target[node.axis] - point[node.axis]
+            near, far = (node.left, node.right) if delta < 0 else (node.right, node.left)
+            search(near)
+            # The other side can only hold closer points if the splitting plane is closer
+            if len(best) < k or delta * delta < -best[0][0]:
+                search(far)
+
+        search(root)
+        return [(facilities[index], _chord_to_km(math.sqrt(-distance)))
+                for distance, index in sorted(best, reverse=True)]
+
+    def stats(self) -> Dict:
+        """Registry contents for monitoring"""
+        return {
+            "path": self.path,
+            "facilities": [f._asdict() for f in self._facilities],
+            "default": self.default.code if self.default else None
+        }
+
+
+# Shared by every ETAService in the process
+facility_registry = FacilityRegistry()
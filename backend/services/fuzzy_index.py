@@ -0,0 +1,179 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+# Words, including letters with accents and inner apostrophes ("can't")
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Every string obtained by deleting up to max_distance characters from word"""
+    found = {word}
+    frontier = [(word, 0)]
+    for _ in range(max_distance):
+        next_frontier = []
+        for candidate, first in frontier:
+            # Deleting positions in increasing order visits each combination once
+            for i in range(first, len(candidate)):
+                variant = candidate[:i] + candidate[i + 1:]
+                if variant:
+                    found.add(variant)
+                    next_frontier.append((variant, i))
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions and
+    adjacent transpositions), or limit + 1 as soon as it is known to exceed limit
+
+    Shared prefixes and suffixes are skipped and only the diagonal band of
+    width 2 * limit + 1 is computed, so a typical typo costs a few dozen steps.
+    """
+    too_far = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return too_far
+
+    # A typo usually leaves most of the word intact on both sides
+    start = 0
+    shortest = min(len(a), len(b))
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    # Keep one matching character of context so transpositions at the edge are seen
+    if start:
+        start -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    n, m = len(a), len(b)
+    if not n or not m:
+        return max(n, m) if max(n, m) <= limit else too_far
+
+    previous_previous = None
+    previous = [j if j <= limit else too_far for j in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [too_far] * (m + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        char_a = a[i - 1]
+        for j in range(max(1, i - limit), min(m, i + limit) + 1):
+            char_b = b[j - 1]
+            value = previous[j - 1] if char_a == char_b else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (previous_previous is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b
+                    and previous_previous[j - 2] + 1 < value):
+                value = previous_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return too_far
+        previous_previous, previous = previous, current
+    return previous[m] if previous[m] <= limit else too_far
+
+
+class SymSpellIndex:
+    """
+    Typo-tolerant word lookup over a fixed vocabulary using a SymSpell deletion index.
+
+    Every vocabulary word is stored under all of its variants with up to
+    `max_distance` characters deleted. A misspelled token only needs its own few
+    deletion variants looked up in that dictionary, so finding the closest word costs
+    a handful of hash lookups instead of an edit-distance scan over the vocabulary.
+
+    To keep ordinary words from being "corrected" into symptoms, only tokens of at
+    least `min_length` characters are corrected, short tokens allow a single edit,
+    and a correction must keep the token's first letter (typos rarely change it).
+    """
+
+    def __init__(self, words: Iterable[str], max_distance: int = 2, min_length: int = 5,
+                 long_word_length: int = 9, cache_size: int = 8192):
+        """
+        Args:
+            words: Vocabulary to correct towards
+            max_distance: Largest edit distance ever corrected
+            min_length: Shorter tokens are never corrected
+            long_word_length: Tokens at least this long may be up to max_distance
+                edits away; shorter ones only one edit
+            cache_size: Per-token lookups remembered (free text repeats words a lot)
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.long_word_length = long_word_length
+        self.words: Set[str] = {word for word in words if len(word) >= min_length}
+
+        self._deletes: Dict[str, List[str]] = {}
+        for word in sorted(self.words):
+            for variant in _deletes(word, max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+
+        self.cache_size = cache_size
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+        # Only letter runs long enough to be corrected are worth tokenizing
+        self._candidate_pattern = re.compile(r"[^\W\d_]{%d,}" % min_length)
+        # Ordinary words seen before that have no correction, skipped with one set difference
+        self._uncorrectable: Set[str] = set()
+
+    @classmethod
+    def from_phrases(cls, phrases: Iterable[str], **kwargs) -> 'SymSpellIndex':
+        """Build an index over every word appearing in the given phrases"""
+        words = set()
+        for phrase in phrases:
+            words.update(TOKEN_PATTERN.findall(phrase.lower()))
+        return cls(words, **kwargs)
+
+    def _allowed_distance(self, token: str) -> int:
+        return self.max_distance if len(token) >= self.long_word_length else min(1, self.max_distance)
+
+    def _lookup(self, token: str) -> Optional[str]:
+        """Closest vocabulary word within the allowed distance, or None"""
+        if token in self.words or len(token) < self.min_length:
+            return None
+
+        limit = self._allowed_distance(token)
+        first_letter = token[0]
+        candidates = set()
+        for variant in _deletes(token, limit):
+            for word in self._deletes.get(variant, ()):
+                if word[0] == first_letter:
+                    candidates.add(word)
+
+        best = None
+        best_distance = limit + 1
+        for word in sorted(candidates):
+            distance = edit_distance(token, word, min(limit, best_distance))
+            if distance < best_distance:
+                best, best_distance = word, distance
+        return best if best_distance <= limit else None
+
+    def correct_text(self, text: str) -> Optional[str]:
+        """
+        Replace misspelled vocabulary words in already-lowercased text
+
+        Returns:
+            The corrected text, or None when nothing needed correcting
+        """
+        unknown = set(self._candidate_pattern.findall(text))
+        unknown -= self.words
+        unknown -= self._uncorrectable
+        if not unknown:
+            return None
+
+        corrections = {}
+        for token in unknown:
+            replacement = self.lookup(token)
+            if replacement is not None:
+                corrections[token] = replacement
+            elif len(self._uncorrectable) < self.cache_size:
+                self._uncorrectable.add(token)
+
+        if not corrections:
+            return None
+        return self._candidate_pattern.sub(lambda match: corrections.get(match.group(), match.group()), text)
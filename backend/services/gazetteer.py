@@ -0,0 +1,242 @@
+import os
+import csv
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from services.geocode_cache import GeocodeCache
+from services.fuzzy_index import edit_distance
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_GAZETTEER_PATH = os.path.join(BASE_DIR, "data", "gazetteer.csv")
+
+# When several names match, the more specific kind of place wins
+KIND_PRIORITY = {"landmark": 0, "suburb": 1, "township": 1, "city": 2}
+
+# Address parts that are a street line rather than a place: they hold a number or one of these words
+STREET_WORDS = frozenset({
+    "st", "street", "rd", "road", "ave", "avenue", "dr", "drive", "ln", "lane", "cres", "crescent",
+    "cl", "close", "way", "blvd", "boulevard", "hwy", "highway", "cnr", "corner", "ext", "extension",
+    "unit", "flat", "block", "erf", "stand", "section", "zone"
+})
+
+# Address parts naming the region the gazetteer covers, which add nothing to the location
+REGION_NAMES = frozenset({"gauteng", "south africa", "rsa", "za"})
+
+# Match kinds, best first
+EXACT, PREFIX, FUZZY = 0, 1, 2
+
+
+class Place(NamedTuple):
+    name: str
+    kind: str
+    lat: float
+    lng: float
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """
+    Offline geocoder over a local extract of place names (suburbs, townships, landmarks).
+
+    Names and aliases are normalized like geocode cache keys and indexed three ways:
+    a dict for exact lookups, a sorted list for prefix lookups (bisect) and a
+    trigram index for misspellings. Each comma-separated part of an address must
+    be a whole place name (or the start of one, or a name with a small typo), a
+    street line, or the region; if any part is none of these, the address lies
+    outside the gazetteer and the lookup gives up rather than guess. All of it is
+    in memory, so it answers in microseconds and needs no network.
+    """
+
+    def __init__(self, path: str = DEFAULT_GAZETTEER_PATH, min_similarity: float = 0.6):
+        """
+        Args:
+            path: CSV file with name, aliases (";"-separated), kind, lat, lng columns
+            min_similarity: Smallest trigram similarity (Dice coefficient) accepted as a fuzzy match
+        """
+        self.path = path
+        self.min_similarity = min_similarity
+        self._places: Dict[str, Place] = {}
+        self._sorted_names: List[str] = []
+        self._trigram_index: Dict[str, List[str]] = {}
+        self._trigram_counts: Dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.prefix_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Apply gazetteer settings from the Flask app config and load the place list"""
+        with self._lock:
+            self.path = app.config.get('GAZETTEER_PATH', self.path)
+            self.min_similarity = app.config.get('GAZETTEER_MIN_SIMILARITY', self.min_similarity)
+            self._loaded = False
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        """Read the place list and build the indexes (called with the lock held)"""
+        places: Dict[str, Place] = {}
+        try:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        place = Place(row["name"].strip(), (row.get("kind") or "").strip(),
+                                      float(row["lat"]), float(row["lng"]))
+                    except (KeyError, TypeError, ValueError, AttributeError):
+                        continue
+                    for name in [place.name] + (row.get("aliases") or "").split(";"):
+                        key = GeocodeCache.normalize(name)
+                        if key and key not in places:
+                            places[key] = place
+        except OSError as e:
+            print(f"Gazetteer not loaded from {self.path}: {e}")
+
+        trigram_index = defaultdict(list)
+        trigram_counts = {}
+        for key in places:
+            trigrams = _trigrams(key)
+            trigram_counts[key] = len(trigrams)
+            for trigram in trigrams:
+                trigram_index[trigram].append(key)
+
+        self._places = places
+        self._sorted_names = sorted(places)
+        self._trigram_index = dict(trigram_index)
+        self._trigram_counts = trigram_counts
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._places)
+
+    def lookup(self, address: str) -> Optional[Place]:
+        """
+        Find the place an address refers to
+
+        Args:
+            address: Free-text address, e.g. "12 Vilakazi St, Orlando West, Soweto"
+
+        Returns:
+            The matching place, or None when any part of the address is unknown
+            (so "Orange Farm, Bloemfontein" is left to Nominatim)
+        """
+        self._ensure_loaded()
+        parts = [part for part in (GeocodeCache.normalize(part) for part in address.split(",")) if part]
+        if not parts or not self._places:
+            return None
+
+        best = None
+        best_rank = None
+        for index, part in enumerate(parts):
+            match = self._match_part(part)
+            if match is None:
+                if part in REGION_NAMES or self._is_street(part):
+                    continue
+                self.misses += 1
+                return None
+            kind, place = match
+            rank = (kind, KIND_PRIORITY.get(place.kind, 1), index)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = place, rank
+
+        if best is None:
+            self.misses += 1
+        elif best_rank[0] == EXACT:
+            self.exact_hits += 1
+        elif best_rank[0] == PREFIX:
+            self.prefix_hits += 1
+        else:
+            self.fuzzy_hits += 1
+        return best
+
+    def _match_part(self, part: str) -> Optional[Tuple[int, Place]]:
+        """(match kind, place) for a whole address part, or None"""
+        place = self._places.get(part)
+        if place is not None:
+            return EXACT, place
+        if part in REGION_NAMES or self._is_street(part):
+            return None
+        place = self._find_prefix(part)
+        if place is not None:
+            return PREFIX, place
+        place = self._find_fuzzy(part)
+        if place is not None:
+            return FUZZY, place
+        return None
+
+    @staticmethod
+    def _is_street(part: str) -> bool:
+        """Whether an address part is a street line ("12 vilakazi st", "hospital road")"""
+        return any(char.isdigit() for char in part) or any(word in STREET_WORDS for word in part.split())
+
+    def _find_prefix(self, part: str) -> Optional[Place]:
+        """The shortest place name starting with part ("sandton ci" -> Sandton City)"""
+        if len(part) < 4:
+            return None
+        index = bisect_left(self._sorted_names, part)
+        best = None
+        while index < len(self._sorted_names) and self._sorted_names[index].startswith(part):
+            name = self._sorted_names[index]
+            if best is None or len(name) < len(best):
+                best = name
+            index += 1
+        return self._places[best] if best is not None else None
+
+    def _find_fuzzy(self, part: str) -> Optional[Place]:
+        """
+        The place name closest to part, if it is one edit away (two for long names)
+
+        Trigram overlap picks the candidates: those similar enough, and those
+        sharing every trigram a typo can leave intact (short names share few
+        trigrams even with a single typo, as in "tembsia"). A shared ending alone
+        is not enough, so "bloemfontein" does not become Braamfontein.
+        """
+        if len(part) < 4:
+            return None
+        trigrams = _trigrams(part)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in trigrams:
+            for name in self._trigram_index.get(trigram, ()):
+                shared[name] += 1
+
+        limit = 2 if len(part) >= 9 else 1
+        # An edit destroys at most three trigrams (four for a transposition), so closer
+        # names must share the rest
+        min_shared = len(trigrams) - 4 * limit
+        scores = {name: 2 * count / (len(trigrams) + self._trigram_counts[name]) for name, count in shared.items()}
+        candidates = [name for name, count in shared.items()
+                      if abs(len(name) - len(part)) <= limit
+                      and (scores[name] >= self.min_similarity or count >= min_shared)]
+        for name in sorted(candidates, key=lambda candidate: (-scores[candidate], candidate))[:10]:
+            if edit_distance(part, name, limit) <= limit:
+                return self._places[name]
+        return None
+
+    def stats(self) -> Dict:
+        """Lookup counters for monitoring"""
+        return {
+            "path": self.path,
+            "places": len(self),
+            "exact_hits": self.exact_hits,
+            "prefix_hits": self.prefix_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses
+        }
+
+
+# Shared by every ETAService in the process
+gazetteer = Gazetteer()
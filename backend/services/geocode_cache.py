@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "geocode_cache.db")
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class GeocodeCache:
+    """
+    Two-tier cache of geocoding results keyed by normalized address.
+
+    The first tier is an in-process LRU, the second a small SQLite file that
+    survives restarts and is shared by every worker process. Addresses that could
+    not be found are cached too (with a shorter TTL), so a mistyped address does
+    not hit Nominatim again on every intake. Network failures are never cached.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, maxsize: int = 2048,
+                 ttl: float = 30 * 24 * 3600, negative_ttl: float = 24 * 3600):
+        """
+        Args:
+            path: SQLite file for the persistent tier (None keeps the cache in memory only)
+            maxsize: Entries kept in the in-process LRU
+            ttl: Seconds a found address stays valid
+            negative_ttl: Seconds an address that was not found stays cached
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # key -> (coordinates or None for "not found", expires_at)
+        self._entries: "OrderedDict[str, Tuple[Optional[Tuple[float, float]], float]]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    def init_app(self, app):
+        """Apply cache settings from the Flask app config"""
+        with self._lock:
+            self.path = app.config.get('GEOCODE_CACHE_PATH', self.path)
+            self.maxsize = app.config.get('GEOCODE_CACHE_SIZE', self.maxsize)
+            self.ttl = app.config.get('GEOCODE_CACHE_TTL_DAYS', self.ttl / 86400) * 86400
+            self.negative_ttl = app.config.get('GEOCODE_CACHE_NEGATIVE_TTL_HOURS', self.negative_ttl / 3600) * 3600
+            self._entries.clear()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        """
+        Cache key for an address: case, accents, punctuation and spacing are ignored,
+        so "Sandton City", " sandton  city " and "Sandton-City" share one entry
+        """
+        text = address
+        if not text.isascii():
+            text = unicodedata.normalize("NFKD", text)
+            text = "".join(char for char in text if not unicodedata.combining(char))
+        text = _PUNCTUATION.sub(" ", text.lower())
+        return _WHITESPACE.sub(" ", text).strip()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Open the persistent tier on first use (called with the lock held)"""
+        if self._connection is None and self.path:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                "address_key TEXT PRIMARY KEY, lat REAL, lng REAL, found INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            # Expired entries are kept for one more TTL as a fallback while Nominatim is unavailable
+            connection.execute("DELETE FROM geocode_cache WHERE expires_at < ?", (time.time() - self.ttl,))
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get(self, address: str, allow_stale: bool = False) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """
+        Look up an address
+
+        Args:
+            address: Address to look up
+            allow_stale: Also return expired entries still held in memory or on disk
+                (used as a fallback while Nominatim is unavailable)
+
+        Returns:
+            (hit, coordinates). On a hit, coordinates is None when the address is
+            cached as not found.
+        """
+        key = self.normalize(address)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] > now or allow_stale):
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                if entry[1] <= now:
+                    self.stale_hits += 1
+                if entry[0] is None:
+                    self.negative_hits += 1
+                return True, entry[0]
+
+            row = None
+            try:
+                connection = self._db()
+                if connection is not None:
+                    row = connection.execute(
+                        "SELECT lat, lng, found, expires_at FROM geocode_cache WHERE address_key = ? AND expires_at > ?",
+                        (key, float("-inf") if allow_stale else now)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Geocode cache read failed: {e}")
+
+            if row is None:
+                self.misses += 1
+                return False, None
+
+            coordinates = (row[0], row[1]) if row[2] else None
+            self._remember(key, coordinates, row[3])
+            self.disk_hits += 1
+            if row[3] <= now:
+                self.stale_hits += 1
+            if coordinates is None:
+                self.negative_hits += 1
+            return True, coordinates
+
+    def put(self, address: str, coordinates: Optional[Tuple[float, float]]):
+        """Cache a geocoding result; pass None for an address that was not found"""
+        key = self.normalize(address)
+        now = time.time()
+        expires_at = now + (self.ttl if coordinates is not None else self.negative_ttl)
+        lat, lng = coordinates if coordinates is not None else (None, None)
+        with self._lock:
+            self._remember(key, coordinates, expires_at)
+            self.stores += 1
+            try:
+                connection = self._db()
+                if connection is not None:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO geocode_cache (address_key, lat, lng, found, created_at, expires_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, lat, lng, int(coordinates is not None), now, expires_at)
+                    )
+                    connection.commit()
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Geocode cache write failed: {e}")
+
+    def _remember(self, key: str, coordinates: Optional[Tuple[float, float]], expires_at: float):
+        """Store an entry in the in-process LRU (called with the lock held)"""
+        self._entries[key] = (coordinates, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._entries.clear()
+            try:
+                connection = self._db()
+                if connection is not None:
+                    connection.execute("DELETE FROM geocode_cache")
+                    connection.commit()
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Geocode cache clear failed: {e}")
+
+    def stats(self) -> Dict:
+        """Cache counters for monitoring"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "path": self.path,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "errors": self.errors,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared by every ETAService in the process
+geocode_cache = GeocodeCache()
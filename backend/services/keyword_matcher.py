@@ -0,0 +1,166 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class KeywordMatcher:
+    """
+    Multi-pattern keyword matcher built on an Aho-Corasick automaton.
+
+    All keywords are compiled once into a single automaton so that one pass
+    over the text finds every keyword that occurs in it, instead of running a
+    separate `keyword in text` scan per keyword. A hit is reported for every
+    keyword that is a substring of the text, which is exactly the semantics of
+    the `in` checks it replaces.
+
+    Aliases (e.g. translations) are compiled into the same automaton. An alias
+    found at the start of a word reports the hits its canonical phrase would
+    produce, so extra languages add states to the automaton but no extra passes
+    over the text.
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]], aliases: Dict[str, str] = None):
+        """
+        Compile the automaton
+
+        Args:
+            categories: Mapping of category name to the keywords in that category.
+                A keyword may appear in more than one category.
+            aliases: Optional mapping of alias phrase to the canonical text it stands for
+        """
+        # Each pattern is stored once; a pattern knows every category it belongs to
+        self._patterns: List[str] = []
+        self._pattern_categories: List[Tuple[str, ...]] = []
+        pattern_ids: Dict[str, int] = {}
+        categories_by_pattern: Dict[str, List[str]] = {}
+
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                if not keyword:
+                    continue
+                if keyword not in pattern_ids:
+                    pattern_ids[keyword] = len(self._patterns)
+                    self._patterns.append(keyword)
+                    categories_by_pattern[keyword] = []
+                if category not in categories_by_pattern[keyword]:
+                    categories_by_pattern[keyword].append(category)
+
+        for keyword in self._patterns:
+            self._pattern_categories.append(tuple(categories_by_pattern[keyword]))
+
+        # Each alias gets its own id after the keyword ids; a hit on it is
+        # expanded to every keyword contained in its canonical text
+        self._aliases: List[str] = []
+        self._alias_canonicals: Dict[str, str] = {}
+        self._alias_expansions: List[Set[int]] = []
+        entries = [(keyword, pattern_id) for keyword, pattern_id in pattern_ids.items()]
+        for alias, canonical in (aliases or {}).items():
+            if not alias or alias in pattern_ids or alias in self._alias_canonicals:
+                continue
+            entries.append((alias, len(self._patterns) + len(self._aliases)))
+            self._aliases.append(alias)
+            self._alias_canonicals[alias] = canonical
+            self._alias_expansions.append({pattern_id for keyword, pattern_id in pattern_ids.items() if keyword in canonical})
+
+        self._build(entries)
+
+    def _build(self, entries: List[Tuple[str, int]]):
+        """Build the transition and output tables from (phrase, id) entries"""
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Set[int]] = [set()]
+
+        # Trie of all phrases
+        for phrase, entry_id in entries:
+            state = 0
+            for char in phrase:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(entry_id)
+
+        # Breadth-first pass to compute failure links, merge outputs and fold
+        # the failure transitions into a full transition table, so matching
+        # never has to walk failure links at runtime
+        fail = [0] * len(goto)
+        transitions: List[Dict[str, int]] = [dict() for _ in goto]
+        transitions[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            if state:
+                merged = dict(transitions[fail[state]])
+                merged.update(goto[state])
+                transitions[state] = merged
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fail[next_state] = transitions[fail[state]].get(char, 0)
+                outputs[next_state] |= outputs[fail[next_state]]
+
+        self._transitions = transitions
+        self._outputs = [tuple(sorted(output)) for output in outputs]
+
+    @property
+    def patterns(self) -> Tuple[str, ...]:
+        """Every keyword compiled into the automaton"""
+        return tuple(self._patterns)
+
+    @property
+    def aliases(self) -> Dict[str, str]:
+        """Every alias compiled into the automaton, with the canonical text it stands for"""
+        return dict(self._alias_canonicals)
+
+    def find_pattern_ids(self, text: str) -> Set[int]:
+        """Return the ids of all patterns occurring in the text, in one pass"""
+        transitions = self._transitions
+        outputs = self._outputs
+        found: Set[int] = set()
+
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+
+        keyword_count = len(self._patterns)
+        alias_ids = [entry_id for entry_id in found if entry_id >= keyword_count] if self._aliases else None
+        if alias_ids:
+            # Aliases are foreign words, so they only count at the start of a word:
+            # Afrikaans "erge" (severe) must not fire inside "emergency"
+            for alias_id in alias_ids:
+                found.discard(alias_id)
+                index = alias_id - keyword_count
+                if self._starts_word(text, self._aliases[index]):
+                    found |= self._alias_expansions[index]
+
+        return found
+
+    @staticmethod
+    def _starts_word(text: str, phrase: str) -> bool:
+        """Whether phrase occurs in text at the start of a word"""
+        start = text.find(phrase)
+        while start != -1:
+            if start == 0 or not text[start - 1].isalnum():
+                return True
+            start = text.find(phrase, start + 1)
+        return False
+
+    def match(self, text: str) -> Dict[str, Set[str]]:
+        """
+        Find every keyword in the text
+
+        Args:
+            text: Text to scan (callers are expected to normalize case)
+
+        Returns:
+            Dict mapping each category with at least one hit to the set of keywords found
+        """
+        hits: Dict[str, Set[str]] = {}
+        for pattern_id in self.find_pattern_ids(text):
+            keyword = self._patterns[pattern_id]
+            for category in self._pattern_categories[pattern_id]:
+                hits.setdefault(category, set()).add(keyword)
+        return hits
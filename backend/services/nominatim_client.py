@@ -0,0 +1,337 @@
+import time
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.geocode_cache import GeocodeCache
+from services.circuit_breaker import CircuitBreaker
+
+DEFAULT_NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+# Upper bounds (ms) of the upstream latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (50, 100, 200, 400, 800, 1600, 3200, 6400, 12800)
+
+
+class AddressNotFound(ValueError):
+    """Raised when the geocoder has no match for an address"""
+
+
+class GeocoderUnavailable(requests.RequestException):
+    """Raised without waiting for Nominatim: the circuit breaker is open or the latency budget ran out"""
+
+    def __init__(self, message: str, pending: Optional[Future] = None):
+        """
+        Args:
+            message: Why the lookup was abandoned
+            pending: The upstream request still running, if any; its result arrives later
+        """
+        super().__init__(message)
+        self.pending = pending
+
+
+class LatencyHistogram:
+    """Counts of upstream call durations in fixed buckets"""
+
+    def __init__(self, bounds_ms: Tuple[int, ...] = LATENCY_BUCKETS_MS):
+        self.bounds_ms = bounds_ms
+        self.counts: List[int] = [0] * (len(bounds_ms) + 1)
+        self.total_ms = 0.0
+
+    def record(self, elapsed_ms: float):
+        self.counts[bisect_left(self.bounds_ms, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+
+    def to_dict(self) -> Dict:
+        bounds = list(self.bounds_ms) + [None]
+        count = sum(self.counts)
+        return {
+            "buckets": [{"le_ms": bound, "count": n} for bound, n in zip(bounds, self.counts)],
+            "count": count,
+            "mean_ms": round(self.total_ms / count, 1) if count else 0.0
+        }
+
+
+class NominatimClient:
+    """
+    Shared client for the Nominatim search API.
+
+    Requests go through one keep-alive `requests.Session`, so lookups after the
+    first reuse the TCP/TLS connection. A token bucket holds the process to
+    Nominatim's usage policy (1 request per second by default): requests over the
+    rate wait their turn instead of being refused. Concurrent lookups of the same
+    normalized address are coalesced, so only the first caller queries Nominatim
+    and the others share its result.
+
+    Requests run on a small thread pool. A caller waits at most its timeout
+    (`latency_budget` seconds by default) in total, queueing for a rate-limit
+    token included. A request that misses it keeps running, and its result is
+    still delivered to the Future attached to the error. Failed requests, and
+    requests that took longer than their callers were prepared to wait, count
+    against a circuit breaker. While the breaker is open, lookups fail at once
+    without calling Nominatim.
+    """
+
+    def __init__(self, url: str = DEFAULT_NOMINATIM_URL, user_agent: str = "HospitalIntakeSystem/1.0",
+                 rate: float = 1.0, burst: int = 1, timeout: float = 10, pool_size: int = 4,
+                 latency_budget: float = 0.8, breaker: Optional[CircuitBreaker] = None):
+        """
+        Args:
+            url: Nominatim search endpoint
+            user_agent: User-Agent header (required by Nominatim)
+            rate: Requests per second allowed upstream
+            burst: Requests that may be sent back to back after an idle period
+            timeout: Seconds before the HTTP request itself is abandoned
+            pool_size: Keep-alive connections kept open (and requests run at once)
+            latency_budget: Seconds a caller waits for a lookup unless it passes its own timeout
+            breaker: Circuit breaker guarding Nominatim (a default one if None)
+        """
+        self.url = url
+        self.user_agent = user_agent
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.latency_budget = latency_budget
+        self.breaker = breaker or CircuitBreaker()
+        self.histogram = LatencyHistogram()
+        self._session: Optional[requests.Session] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.not_found = 0
+        self.errors = 0
+        self.slow = 0
+        self.budget_exceeded = 0
+
+    def init_app(self, app):
+        """Apply Nominatim settings from the Flask app config"""
+        with self._lock:
+            self.url = app.config.get('NOMINATIM_URL', self.url)
+            self.user_agent = app.config.get('NOMINATIM_USER_AGENT', self.user_agent)
+            self.rate = app.config.get('NOMINATIM_RATE_LIMIT', self.rate)
+            self.burst = app.config.get('NOMINATIM_BURST', self.burst)
+            self.timeout = app.config.get('NOMINATIM_TIMEOUT', self.timeout)
+            self.pool_size = app.config.get('NOMINATIM_POOL_SIZE', self.pool_size)
+            self.latency_budget = app.config.get('GEOCODE_LATENCY_BUDGET_MS', self.latency_budget * 1000) / 1000
+            self.breaker.failure_threshold = app.config.get('GEOCODE_BREAKER_FAILURES', self.breaker.failure_threshold)
+            self.breaker.reset_timeout = app.config.get('GEOCODE_BREAKER_RESET_SECONDS', self.breaker.reset_timeout)
+            self.breaker.reset()
+            self._tokens = float(self.burst)
+            self._refilled_at = time.monotonic()
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _get_session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["User-Agent"] = self.user_agent
+                self._session = session
+            return self._session
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="nominatim")
+            return self._executor
+
+    def _acquire(self):
+        """
+        Take one token from the bucket, sleeping until it is available
+
+        The token is reserved under the lock (the balance may go negative), so
+        waiting callers are released in arrival order, one per 1/rate seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self.throttled += 1
+                self.throttle_seconds += wait
+        if wait:
+            time.sleep(wait)
+
+    def search(self, address: str, timeout: Optional[float] = None) -> Tuple[float, float]:
+        """
+        Geocode an address within a time limit, sharing the upstream call with
+        concurrent lookups of the same address
+
+        Args:
+            address: Text address to geocode
+            timeout: Longest total wait in seconds, queueing for the rate limit
+                included (defaults to the latency budget)
+
+        Returns:
+            Tuple of (latitude, longitude)
+
+        Raises:
+            AddressNotFound: If Nominatim has no match for the address
+            GeocoderUnavailable: If the breaker is open or the time limit ran out
+            ValueError: If the response cannot be parsed
+            requests.RequestException: If API request fails
+        """
+        timeout = self.latency_budget if timeout is None else timeout
+        future = self.submit(address, timeout)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.budget_exceeded += 1
+            raise GeocoderUnavailable("Geocoding exceeded its latency budget", pending=future)
+
+    def submit(self, address: str, timeout: Optional[float] = None) -> Future:
+        """
+        Start a lookup (or join the one already running for this address)
+
+        Args:
+            address: Text address to geocode
+            timeout: How long the caller will wait (defaults to the latency budget);
+                a request slower than every caller's wait counts against the breaker
+
+        Raises:
+            GeocoderUnavailable: If the circuit breaker is open
+        """
+        key = GeocodeCache.normalize(address)
+        wait_limit = self.latency_budget if timeout is None else timeout
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                future.wait_limit = max(future.wait_limit, wait_limit)
+                return future
+
+        if not self.breaker.allow():
+            raise GeocoderUnavailable("Geocoding circuit breaker is open")
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                future.wait_limit = max(future.wait_limit, wait_limit)
+                return future
+            future = Future()
+            future.wait_limit = wait_limit
+            self._in_flight[key] = future
+        self._pool().submit(self._run, key, address, future)
+        return future
+
+    def _run(self, key: str, address: str, future: Future):
+        try:
+            future.set_result(self._request(address, future))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _request(self, address: str, future: Optional[Future] = None) -> Tuple[float, float]:
+        """
+        One rate-limited call to the search API
+
+        Args:
+            future: The lookup this request answers, carrying how long its callers wait
+        """
+        params = {
+            'q': address,
+            'format': 'json',
+            'limit': 1,
+            'addressdetails': 1
+        }
+        session = self._get_session()
+        self._acquire()
+        with self._lock:
+            self.requests += 1
+
+        started = time.perf_counter()
+        try:
+            response = session.get(self.url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._record(started, True, future)
+            with self._lock:
+                self.errors += 1
+            raise requests.RequestException(f"Geocoding API request failed: {str(e)}")
+        # Nominatim being down or throttling us counts against the breaker; "not found" does not
+        self._record(started, response.status_code >= 500 or response.status_code == 429, future)
+
+        try:
+            response.raise_for_status()
+            data = response.json()
+
+            if not data:
+                with self._lock:
+                    self.not_found += 1
+                raise AddressNotFound("Invalid geocoding response: Address not found")
+
+            location = data[0]
+            return float(location['lat']), float(location['lon'])
+
+        except AddressNotFound:
+            raise
+        except requests.RequestException as e:
+            with self._lock:
+                self.errors += 1
+            raise requests.RequestException(f"Geocoding API request failed: {str(e)}")
+        except (KeyError, ValueError, TypeError, IndexError) as e:
+            with self._lock:
+                self.errors += 1
+            raise ValueError(f"Invalid geocoding response: {str(e)}")
+
+    def _record(self, started: float, failed: bool, future: Optional[Future] = None):
+        """
+        Record an upstream call in the histogram and the circuit breaker
+
+        A call slower than the longest wait of its callers counts as a failure too,
+        since every caller has given up on it.
+        """
+        elapsed = time.perf_counter() - started
+        slow = elapsed > (future.wait_limit if future is not None else self.latency_budget)
+        with self._lock:
+            self.histogram.record(elapsed * 1000)
+            if slow:
+                self.slow += 1
+        if failed or slow:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stats(self) -> Dict:
+        """Client counters for monitoring"""
+        with self._lock:
+            return {
+                "url": self.url,
+                "rate_limit": self.rate,
+                "burst": self.burst,
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "throttled": self.throttled,
+                "throttle_seconds": round(self.throttle_seconds, 3),
+                "not_found": self.not_found,
+                "errors": self.errors,
+                "latency_budget_ms": round(self.latency_budget * 1000),
+                "slow": self.slow,
+                "budget_exceeded": self.budget_exceeded,
+                "latency": self.histogram.to_dict(),
+                "circuit_breaker": self.breaker.stats()
+            }
+
+
+# Shared by every ETAService in the process
+nominatim_client = NominatimClient()
@@ -0,0 +1,341 @@
+import math
+import time
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, NamedTuple, Optional, Set
+
+from models import db, PatientIntake
+from services.eta_service import ETAService
+from services.eta_engine import ETAEngine, write_positions
+from services.road_router import haversine_km
+
+# Closing speeds below this (km/h) are treated as standing still
+MIN_CLOSING_SPEED_KMH = 3.0
+
+
+class Fix(NamedTuple):
+    lat: float
+    lng: float
+    at: float  # Unix time
+    speed_kmh: Optional[float]
+    heading: Optional[float]  # Degrees clockwise from north
+
+
+class _Track:
+    """In-memory state of one patient on their way"""
+
+    __slots__ = ("facility", "car_location", "fixes", "eta_minutes", "dirty", "saved_fix", "saved_eta", "last_ping")
+
+    def __init__(self, facility, car_location: Optional[str], buffer_size: int):
+        self.facility = facility
+        self.car_location = car_location
+        self.fixes: Deque[Fix] = deque(maxlen=buffer_size)
+        self.eta_minutes: Optional[int] = None
+        self.dirty = False
+        self.saved_fix: Optional[Fix] = None
+        self.saved_eta: Optional[int] = None
+        self.last_ping = 0.0
+
+
+def _bearing(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Initial bearing from point 1 to point 2 in degrees clockwise from north"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dlng = math.radians(lng2 - lng1)
+    y = math.sin(dlng) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlng)
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+class PositionTracker:
+    """
+    Live GPS positions of patients on their way, with ETAs kept up to date.
+
+    Each ping goes into a bounded ring buffer for that patient and the ETA is
+    updated in memory straight away. The model ETA from the current position
+    (grid, road graph or straight line, see ETAService.calculate_eta) is blended
+    with the ETA implied by how fast the car is actually closing in on its
+    facility. That closing speed comes from the reported speed and heading, or
+    from the previous fix. The result is smoothed against the previous ETA so a
+    single noisy fix does not make it jump.
+
+    Nothing is written per ping. A background thread flushes every
+    `flush_interval` seconds, keeping only the latest fix of each patient and
+    skipping patients who moved less than `min_distance_m` with an unchanged
+    ETA. All rows go out in one batched update.
+
+    While a patient is tracked, the tracker is the only writer of their
+    position and ETA in this process: batch position reports for them come in
+    as pings (`apply_fixes`) and bulk recomputation skips them (`tracked_ids`).
+    Across worker processes, every position write carries the time of its fix
+    (`position_at`) and is skipped where the row already holds a newer one, so
+    a flush never puts an older position back.
+    """
+
+    def __init__(self, buffer_size: int = 20, flush_interval: float = 5.0, min_distance_m: float = 50.0,
+                 idle_timeout: float = 30 * 60, smoothing: float = 0.5):
+        """
+        Args:
+            buffer_size: Fixes kept per patient
+            flush_interval: Seconds between database flushes
+            min_distance_m: Smallest move worth persisting when the ETA has not changed
+            idle_timeout: Seconds without pings after which a patient is no longer tracked
+            smoothing: Weight of the newest estimate against the previous ETA (0-1)
+        """
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.min_distance_m = min_distance_m
+        self.idle_timeout = idle_timeout
+        self.smoothing = smoothing
+        self._app = None
+        self._tracks: Dict[int, _Track] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stop_registered = False
+        self.pings = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_stale = 0
+        self.pings_skipped = 0
+
+    def init_app(self, app):
+        """Apply tracker settings from the Flask app config"""
+        with self._lock:
+            self._app = app
+            self.buffer_size = app.config.get('POSITION_BUFFER_SIZE', self.buffer_size)
+            self.flush_interval = app.config.get('POSITION_FLUSH_INTERVAL', self.flush_interval)
+            self.min_distance_m = app.config.get('POSITION_MIN_DISTANCE_M', self.min_distance_m)
+            self.idle_timeout = app.config.get('POSITION_IDLE_TIMEOUT_MINUTES', self.idle_timeout / 60) * 60
+            self._tracks.clear()
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._stop.clear()
+                self._flusher = threading.Thread(target=self._run, name="position-flush", daemon=True)
+                self._flusher.start()
+                if not self._stop_registered:
+                    atexit.register(self.stop)
+                    self._stop_registered = True
+
+    def stop(self):
+        """Stop the flush thread after a final flush"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 5)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def ping(self, intake_id: int, lat: float, lng: float, at: Optional[float] = None,
+             speed_kmh: Optional[float] = None, heading: Optional[float] = None) -> Optional[Dict]:
+        """
+        Record a position fix and update the patient's ETA in memory
+
+        Must be called inside a Flask app context.
+
+        Returns:
+            {"id", "eta_minutes", "facility_code", "buffered"}, or None for an unknown patient
+        """
+        now = time.time()
+        at = now if at is None else at
+        eta_service = ETAService()
+
+        with self._lock:
+            track = self._tracks.get(intake_id)
+        if track is None:
+            track = self._load_track(intake_id, eta_service)
+            if track is None:
+                return None
+
+        fix = Fix(lat, lng, at, speed_kmh, heading)
+        estimate = self._estimate(eta_service, track, fix)
+
+        with self._lock:
+            previous = track.fixes[-1] if track.fixes else None
+            if previous is not None and fix.at <= previous.at:
+                # Out-of-order or repeated fix: keep the newer one
+                self.pings_skipped += 1
+                return self._summary(intake_id, track)
+            track.fixes.append(fix)
+            if track.eta_minutes is None:
+                track.eta_minutes = estimate
+            else:
+                blended = self.smoothing * estimate + (1 - self.smoothing) * track.eta_minutes
+                track.eta_minutes = max(1, min(int(round(blended)), 480))
+            track.dirty = True
+            track.last_ping = now
+            self.pings += 1
+            summary = self._summary(intake_id, track)
+
+        self._ensure_flusher()
+        return summary
+
+    def apply_fixes(self, fixes: List[Dict]) -> List[Dict]:
+        """
+        Apply a batch of position reports (POST /intake/positions)
+
+        Fixes of tracked patients are taken as pings. All other patients are
+        updated by ETAEngine in one vectorized pass and written straight away.
+        Must be called inside a Flask app context.
+
+        Args:
+            fixes: Validated dicts with 'id', 'lat' and 'lng'
+
+        Returns:
+            One {"id", "eta_minutes"} dict per fix, in input order; eta_minutes is
+            None for an unknown patient id
+        """
+        tracked = self.tracked_ids()
+        direct = iter(ETAEngine().apply_position_fixes([fix for fix in fixes if fix["id"] not in tracked]))
+        results = []
+        for fix in fixes:
+            if fix["id"] not in tracked:
+                results.append(next(direct))
+                continue
+            summary = self.ping(fix["id"], fix["lat"], fix["lng"])
+            results.append({"id": fix["id"], "eta_minutes": summary["eta_minutes"] if summary else None})
+        return results
+
+    def tracked_ids(self) -> Set[int]:
+        """Ids of the patients whose position and ETA the tracker currently owns"""
+        with self._lock:
+            return set(self._tracks)
+
+    def _load_track(self, intake_id: int, eta_service: ETAService) -> Optional[_Track]:
+        row = PatientIntake.query.with_entities(
+            PatientIntake.facility_code, PatientIntake.car_location
+        ).filter_by(id=intake_id).first()
+        if row is None:
+            return None
+        facility = eta_service.facilities.get(row[0]) if eta_service.facilities else None
+        with self._lock:
+            # Another request may have loaded it meanwhile
+            return self._tracks.setdefault(intake_id, _Track(facility, row[1], self.buffer_size))
+
+    def _estimate(self, eta_service: ETAService, track: _Track, fix: Fix) -> int:
+        """ETA from one new fix: the model ETA, blended with the observed closing speed when moving"""
+        model = eta_service.calculate_eta(fix.lat, fix.lng, track.facility)
+        dest_lat, dest_lng = ((track.facility.lat, track.facility.lng) if track.facility
+                              else (eta_service.hospital_lat, eta_service.hospital_lng))
+        remaining_km = haversine_km(fix.lat, fix.lng, dest_lat, dest_lng)
+
+        closing_kmh = None
+        if fix.speed_kmh is not None and fix.heading is not None:
+            # Component of the velocity pointing at the facility
+            offset = math.radians(fix.heading - _bearing(fix.lat, fix.lng, dest_lat, dest_lng))
+            closing_kmh = fix.speed_kmh * math.cos(offset)
+        else:
+            with self._lock:
+                previous = track.fixes[-1] if track.fixes else None
+            if previous is not None and fix.at > previous.at:
+                before_km = haversine_km(previous.lat, previous.lng, dest_lat, dest_lng)
+                closing_kmh = (before_km - remaining_km) / ((fix.at - previous.at) / 3600)
+
+        if closing_kmh is None or closing_kmh < MIN_CLOSING_SPEED_KMH:
+            return model
+        observed = remaining_km / closing_kmh * 60
+        return max(1, min(int(round((model + observed) / 2)), 480))
+
+    @staticmethod
+    def _summary(intake_id: int, track: _Track) -> Dict:
+        return {
+            "id": intake_id,
+            "eta_minutes": track.eta_minutes,
+            "facility_code": track.facility.code if track.facility else None,
+            "buffered": len(track.fixes)
+        }
+
+    def recent(self, intake_id: int) -> Optional[List[Dict]]:
+        """Buffered fixes of a patient, oldest first (None if not tracked)"""
+        with self._lock:
+            track = self._tracks.get(intake_id)
+            if track is None:
+                return None
+            return [{
+                "lat": fix.lat,
+                "lng": fix.lng,
+                "at": datetime.utcfromtimestamp(fix.at).isoformat(),
+                "speed_kmh": fix.speed_kmh,
+                "heading": fix.heading
+            } for fix in track.fixes]
+
+    def flush(self) -> int:
+        """
+        Persist the latest position and ETA of every patient that changed enough
+
+        Returns:
+            Number of rows written; rows already holding a newer fix (from another
+            worker process) are left alone
+        """
+        now = time.time()
+        mappings = []
+        saved = []
+        with self._lock:
+            for intake_id, track in list(self._tracks.items()):
+                if not track.dirty:
+                    if now - track.last_ping > self.idle_timeout:
+                        del self._tracks[intake_id]
+                    continue
+                track.dirty = False
+                fix = track.fixes[-1]
+                moved_m = (haversine_km(fix.lat, fix.lng, track.saved_fix.lat, track.saved_fix.lng) * 1000
+                           if track.saved_fix else math.inf)
+                if moved_m < self.min_distance_m and track.eta_minutes == track.saved_eta:
+                    continue
+                mappings.append({
+                    "id": intake_id,
+                    "car_location": ETAEngine._with_position(track.car_location, fix.lat, fix.lng),
+                    "car_lat": fix.lat,
+                    "car_lng": fix.lng,
+                    "position_at": datetime.utcfromtimestamp(fix.at),
+                    "eta_minutes": track.eta_minutes
+                })
+                saved.append((track, fix, track.eta_minutes))
+
+        if not mappings or self._app is None:
+            return 0
+        with self._app.app_context():
+            try:
+                written = write_positions(mappings)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Position flush failed: {e}")
+                with self._lock:
+                    for track, _, _ in saved:
+                        track.dirty = True
+                return 0
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            for track, fix, eta_minutes in saved:
+                track.saved_fix = fix
+                track.saved_eta = eta_minutes
+            self.flushes += 1
+            self.rows_written += written
+            self.rows_stale += len(mappings) - written
+        return written
+
+    def stats(self) -> Dict:
+        """Tracker counters for monitoring"""
+        with self._lock:
+            return {
+                "tracked": len(self._tracks),
+                "pending": sum(1 for track in self._tracks.values() if track.dirty),
+                "pings": self.pings,
+                "pings_skipped": self.pings_skipped,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "rows_stale": self.rows_stale,
+                "flush_interval": self.flush_interval
+            }
+
+
+# Shared by every request in the process
+position_tracker = PositionTracker()
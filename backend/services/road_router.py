@@ -0,0 +1,363 @@
+import os
+import math
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_GRAPH_PATH = os.path.join(BASE_DIR, "data", "road_graph.npz")
+
+EARTH_RADIUS_KM = 6371
+
+# Default speed (km/h) per OSM highway type when a way has no usable maxspeed tag
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60,
+    "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 40,
+    "secondary": 50, "secondary_link": 35,
+    "tertiary": 40, "tertiary_link": 30,
+    "unclassified": 30, "residential": 30, "living_street": 10,
+    "road": 30, "service": 15, "track": 10
+}
+
+# Size (degrees) of the grid cells used to snap coordinates to the nearest graph node
+SNAP_CELL_DEGREES = 0.01
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class RoadRouter:
+    """
+    Offline shortest-time routing over a local OSM road graph.
+
+    The graph is built by `build_road_graph.py` and stored as compressed NumPy
+    arrays: node coordinates and a CSR adjacency (indptr, indices, travel
+    seconds). It is loaded once. Point-to-point queries run A* with a
+    straight-line-at-top-speed heuristic.
+
+    Patients are always driving to one of a few facilities, so the router also
+    keeps, per destination, the travel time from every node (one reverse Dijkstra
+    run, see `warm`). Once a destination has such a tree, a query is a grid
+    lookup for the nearest node plus an array index, for one car or for thousands
+    (`travel_times`).
+
+    Coordinates further than `max_snap_km` from any road, and pairs without a
+    route, return None so the caller can fall back to its straight-line estimate.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_GRAPH_PATH, max_snap_km: float = 2.0,
+                 access_speed_kmh: float = 20.0, tree_cache_size: int = 32):
+        """
+        Args:
+            path: .npz graph written by build_road_graph.py (None disables routing)
+            max_snap_km: Furthest a point may be from the nearest road node
+            access_speed_kmh: Speed for the straight legs between a point and its road node
+            tree_cache_size: Destinations whose full travel-time tree is kept in memory
+        """
+        self.path = path
+        self.max_snap_km = max_snap_km
+        self.access_speed_kmh = access_speed_kmh
+        self.tree_cache_size = tree_cache_size
+        self._graph: Optional[Dict] = None
+        self._load_error: Optional[str] = None
+        self._trees: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.astar_queries = 0
+        self.tree_queries = 0
+        self.unroutable = 0
+
+    def init_app(self, app):
+        """Apply routing settings from the Flask app config (the graph is loaded on first use)"""
+        with self._lock:
+            self.path = app.config.get('ROAD_GRAPH_PATH', self.path)
+            self.max_snap_km = app.config.get('ROAD_GRAPH_MAX_SNAP_KM', self.max_snap_km)
+            self.access_speed_kmh = app.config.get('ROAD_GRAPH_ACCESS_SPEED_KMH', self.access_speed_kmh)
+            self.tree_cache_size = app.config.get('ROAD_GRAPH_TREE_CACHE_SIZE', self.tree_cache_size)
+            self._graph = None
+            self._load_error = None
+            self._trees.clear()
+
+    @property
+    def available(self) -> bool:
+        """Whether a road graph is loaded (loading it now if needed)"""
+        return self._get_graph() is not None
+
+    def _get_graph(self) -> Optional[Dict]:
+        if self._graph is not None or self._load_error is not None or not self.path:
+            return self._graph
+        with self._lock:
+            if self._graph is None and self._load_error is None:
+                if not os.path.exists(self.path):
+                    self._load_error = f"{self.path} not found"
+                else:
+                    try:
+                        self._graph = self._load(self.path)
+                    except (OSError, KeyError, ValueError) as e:
+                        self._load_error = str(e)
+                        print(f"Road graph not loaded from {self.path}: {e}")
+        return self._graph
+
+    @staticmethod
+    def _load(path: str) -> Dict:
+        with np.load(path) as data:
+            lat = data["node_lat"].astype(np.float64)
+            lng = data["node_lng"].astype(np.float64)
+            indptr = data["indptr"].astype(np.int64)
+            indices = data["indices"].astype(np.int64)
+            seconds = data["travel_seconds"].astype(np.float64)
+            max_speed_kmh = float(data["max_speed_kmh"]) if "max_speed_kmh" in data else 130.0
+
+        n = len(lat)
+        # Reverse adjacency (edges into each node) for the one-to-all trees
+        sources = np.repeat(np.arange(n), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        reverse_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=n), out=reverse_indptr[1:])
+
+        # Snapping grid: nodes sorted by cell, with the start of each cell found by binary search
+        cells = SnapGrid(lat, lng)
+        return {
+            "n": n,
+            "lat": lat, "lng": lng,
+            "lat_radians": np.radians(lat).tolist(), "lng_radians": np.radians(lng).tolist(),
+            "cos_lat": np.cos(np.radians(lat)).tolist(),
+            "indptr": indptr.tolist(), "indices": indices.tolist(), "seconds": seconds.tolist(),
+            "reverse_indptr": reverse_indptr.tolist(),
+            "reverse_indices": sources[order].tolist(),
+            "reverse_seconds": seconds[order].tolist(),
+            "max_speed_kmh": max_speed_kmh,
+            "grid": cells,
+            "edges": len(indices)
+        }
+
+    def _snap(self, graph: Dict, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """Nearest node and the seconds to cover the straight leg to it"""
+        found = graph["grid"].nearest(lat, lng, self.max_snap_km)
+        if found is None:
+            return None
+        node, distance_km = found
+        return node, distance_km / self.access_speed_kmh * 3600
+
+    def travel_time(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Optional[float]:
+        """
+        Shortest driving time between two points
+
+        Returns:
+            Seconds, or None if either point is off the graph or no route exists
+        """
+        graph = self._get_graph()
+        if graph is None:
+            return None
+        origin = self._snap(graph, origin_lat, origin_lng)
+        dest = self._snap(graph, dest_lat, dest_lng)
+        if origin is None or dest is None:
+            self.unroutable += 1
+            return None
+
+        with self._lock:
+            tree = self._trees.get(dest[0])
+            if tree is not None:
+                self._trees.move_to_end(dest[0])
+        if tree is not None:
+            self.tree_queries += 1
+            seconds = float(tree[origin[0]])
+        else:
+            self.astar_queries += 1
+            seconds = self._astar(graph, origin[0], dest[0])
+        if seconds is None or math.isinf(seconds):
+            self.unroutable += 1
+            return None
+        return origin[1] + seconds + dest[1]
+
+    def travel_times(self, origin_lats: Sequence[float], origin_lngs: Sequence[float],
+                     dest_lats, dest_lngs) -> np.ndarray:
+        """
+        Vectorized travel_time using the destination trees (built on first use)
+
+        Args:
+            origin_lats, origin_lngs: Arrays of origins
+            dest_lats, dest_lngs: Destination coordinates, scalars or arrays
+
+        Returns:
+            Array of seconds, NaN where there is no route
+        """
+        origin_lats = np.asarray(origin_lats, dtype=np.float64)
+        origin_lngs = np.asarray(origin_lngs, dtype=np.float64)
+        result = np.full(len(origin_lats), np.nan)
+        graph = self._get_graph()
+        if graph is None or not len(origin_lats):
+            return result
+
+        origin_nodes, origin_seconds = graph["grid"].nearest_many(origin_lats, origin_lngs, self.max_snap_km)
+        origin_seconds = origin_seconds / self.access_speed_kmh * 3600
+        dest_lats = np.broadcast_to(np.asarray(dest_lats, dtype=np.float64), origin_lats.shape)
+        dest_lngs = np.broadcast_to(np.asarray(dest_lngs, dtype=np.float64), origin_lats.shape)
+
+        destinations = np.unique(np.stack([dest_lats, dest_lngs], axis=1), axis=0)
+        for dest_lat, dest_lng in destinations:
+            dest = self._snap(graph, dest_lat, dest_lng)
+            if dest is None:
+                continue
+            tree = self._tree(graph, dest[0])
+            rows = np.flatnonzero((dest_lats == dest_lat) & (dest_lngs == dest_lng) & (origin_nodes >= 0))
+            result[rows] = tree[origin_nodes[rows]] + origin_seconds[rows] + dest[1]
+        self.tree_queries += len(origin_lats)
+        result[np.isinf(result)] = np.nan
+        return result
+
+    def warm(self, destinations: List[Tuple[float, float]]):
+        """Build the travel-time trees of the given destinations (e.g. every facility)"""
+        graph = self._get_graph()
+        if graph is None:
+            return
+        for lat, lng in destinations:
+            dest = self._snap(graph, lat, lng)
+            if dest is not None:
+                self._tree(graph, dest[0])
+
+    def _tree(self, graph: Dict, dest: int) -> np.ndarray:
+        """Seconds from every node to dest (cached)"""
+        with self._lock:
+            tree = self._trees.get(dest)
+            if tree is not None:
+                self._trees.move_to_end(dest)
+                return tree
+        tree = self._reverse_dijkstra(graph, dest)
+        with self._lock:
+            self._trees[dest] = tree
+            while len(self._trees) > self.tree_cache_size:
+                self._trees.popitem(last=False)
+        return tree
+
+    @staticmethod
+    def _reverse_dijkstra(graph: Dict, dest: int) -> np.ndarray:
+        indptr, indices, seconds = graph["reverse_indptr"], graph["reverse_indices"], graph["reverse_seconds"]
+        best = [math.inf] * graph["n"]
+        best[dest] = 0.0
+        heap = [(0.0, dest)]
+        while heap:
+            time_so_far, node = heapq.heappop(heap)
+            if time_so_far > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = time_so_far + seconds[edge]
+                if candidate < best[neighbour]:
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return np.asarray(best, dtype=np.float64)
+
+    @staticmethod
+    def _astar(graph: Dict, origin: int, dest: int) -> Optional[float]:
+        indptr, indices, seconds = graph["indptr"], graph["indices"], graph["seconds"]
+        lat, lng, cos_lat = graph["lat_radians"], graph["lng_radians"], graph["cos_lat"]
+        dest_lat, dest_lng = lat[dest], lng[dest]
+        cos_dest = cos_lat[dest]
+        # Straight line at the top speed of the graph never overestimates the time left
+        seconds_factor = 2 * EARTH_RADIUS_KM / graph["max_speed_kmh"] * 3600
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        estimates: Dict[int, float] = {}
+
+        best = {origin: 0.0}
+        heap = [(0.0, 0.0, origin)]
+        while heap:
+            _, time_so_far, node = heapq.heappop(heap)
+            if node == dest:
+                return time_so_far
+            if time_so_far > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                candidate = time_so_far + seconds[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    estimate = estimates.get(neighbour)
+                    if estimate is None:
+                        a = (sin((dest_lat - lat[neighbour]) / 2) ** 2
+                             + cos_lat[neighbour] * cos_dest * sin((dest_lng - lng[neighbour]) / 2) ** 2)
+                        estimate = estimates[neighbour] = seconds_factor * asin(sqrt(min(1.0, a)))
+                    heapq.heappush(heap, (candidate + estimate, candidate, neighbour))
+        return None
+
+    def stats(self) -> Dict:
+        """Graph size and query counters for monitoring"""
+        graph = self._get_graph()
+        return {
+            "path": self.path,
+            "loaded": graph is not None,
+            "load_error": self._load_error,
+            "nodes": graph["n"] if graph else 0,
+            "edges": graph["edges"] if graph else 0,
+            "cached_destinations": len(self._trees),
+            "astar_queries": self.astar_queries,
+            "tree_queries": self.tree_queries,
+            "unroutable": self.unroutable
+        }
+
+
+class SnapGrid:
+    """Uniform lat/lng grid over the graph nodes for nearest-node lookups"""
+
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, cell: float = SNAP_CELL_DEGREES):
+        self.cell = cell
+        self.lat = lat
+        self.lng = lng
+        keys = self._keys(lat, lng)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+
+    def _keys(self, lat, lng) -> np.ndarray:
+        rows = np.floor((np.asarray(lat) + 90) / self.cell).astype(np.int64)
+        cols = np.floor((np.asarray(lng) + 180) / self.cell).astype(np.int64)
+        return rows * 100000 + cols
+
+    def _candidates(self, lat: float, lng: float, rings: int) -> np.ndarray:
+        row = int(math.floor((lat + 90) / self.cell))
+        col = int(math.floor((lng + 180) / self.cell))
+        keys = [(row + dr) * 100000 + col + dc
+                for dr in range(-rings, rings + 1) for dc in range(-rings, rings + 1)]
+        starts = np.searchsorted(self.sorted_keys, keys, side="left")
+        ends = np.searchsorted(self.sorted_keys, keys, side="right")
+        chunks = [self.order[s:e] for s, e in zip(starts, ends) if e > s]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def nearest(self, lat: float, lng: float, max_km: float) -> Optional[Tuple[int, float]]:
+        """Nearest node within max_km, with its distance in km"""
+        # A cell is at least this wide, so everything within rings * km_per_cell has been searched
+        km_per_cell = 111.32 * self.cell * max(0.1, math.cos(math.radians(lat)))
+        max_rings = max(1, int(math.ceil(max_km / km_per_cell)))
+        for rings in range(1, max_rings + 1):
+            candidates = self._candidates(lat, lng, rings)
+            if not len(candidates):
+                continue
+            phi = np.radians(self.lat[candidates])
+            a = (np.sin((phi - math.radians(lat)) / 2) ** 2
+                 + np.cos(phi) * math.cos(math.radians(lat)) * np.sin((np.radians(self.lng[candidates]) - math.radians(lng)) / 2) ** 2)
+            distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+            best = int(np.argmin(distances))
+            if distances[best] <= rings * km_per_cell or rings == max_rings:
+                if distances[best] > max_km:
+                    return None
+                return int(candidates[best]), float(distances[best])
+        return None
+
+    def nearest_many(self, lats: np.ndarray, lngs: np.ndarray, max_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """nearest for many points: node ids (-1 when off the graph) and distances in km"""
+        nodes = np.full(len(lats), -1, dtype=np.int64)
+        distances = np.zeros(len(lats))
+        for i, (lat, lng) in enumerate(zip(lats.tolist(), lngs.tolist())):
+            found = self.nearest(lat, lng, max_km)
+            if found is not None:
+                nodes[i], distances[i] = found
+        return nodes, distances
+
+
+# Shared by every ETAService in the process
+road_router = RoadRouter()
@@ -0,0 +1,165 @@
+import json
+import queue
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from services.emergency_classifier import EmergencyClassifier, TriageResult
+from services.triage_ruleset import RulesetStore
+
+
+class ShadowEvaluator:
+    """
+    Scores live intakes with a candidate triage ruleset next to the production one.
+
+    Intakes are handed over through a bounded queue to background worker threads,
+    so shadow scoring never runs on the request path. When the queue is full the
+    shadow job is dropped and counted; the intake itself is never delayed.
+    Every disagreement in color code is appended to a JSON-lines log, and counts
+    per severity transition (e.g. "G->Y") are kept for monitoring.
+    """
+
+    def __init__(self, ruleset_path: str = None, queue_size: int = 1000, workers: int = 1,
+                 log_path: str = None, check_interval: float = 5.0):
+        """
+        Args:
+            ruleset_path: Candidate ruleset file; shadow evaluation is off without one
+            queue_size: Maximum intakes waiting for shadow scoring
+            workers: Background scoring threads
+            log_path: JSON-lines file disagreements are appended to
+            check_interval: Seconds between checks for a changed candidate file
+        """
+        self.queue_size = queue_size
+        self.workers = workers
+        self.log_path = log_path
+        self._store: Optional[RulesetStore] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._configure(ruleset_path, check_interval)
+
+        self.submitted = 0
+        self.dropped = 0
+        self.compared = 0
+        self.disagreements = 0
+        self.errors = 0
+        self.transitions: Counter = Counter()
+
+    def _configure(self, ruleset_path: Optional[str], check_interval: float):
+        self._store = RulesetStore(ruleset_path, check_interval=check_interval) if ruleset_path else None
+
+    def init_app(self, app):
+        """Apply shadow evaluation settings from the Flask app config"""
+        with self._lock:
+            self.queue_size = app.config.get('TRIAGE_SHADOW_QUEUE_SIZE', self.queue_size)
+            self.workers = app.config.get('TRIAGE_SHADOW_WORKERS', self.workers)
+            self.log_path = app.config.get('TRIAGE_SHADOW_LOG_PATH', self.log_path)
+            if not self._threads:
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            self._configure(
+                app.config.get('TRIAGE_SHADOW_RULESET_PATH'),
+                app.config.get('TRIAGE_RULESET_CHECK_INTERVAL', 5.0)
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def submit(self, intake_id: int, symptoms: str, age: int, risk_conditions: List[str],
+               pregnancy_week: int, trimester: str, production: TriageResult) -> bool:
+        """
+        Queue one committed intake for shadow scoring without waiting
+
+        Returns:
+            True if queued, False if shadow evaluation is off or the queue is full
+        """
+        if self._store is None:
+            return False
+        self._start_workers()
+
+        job = (intake_id, symptoms, age, list(risk_conditions or []), pregnancy_week, trimester, production)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _start_workers(self):
+        """Start the worker threads on first use"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(max(1, self.workers)):
+                thread = threading.Thread(target=self._work, name=f"shadow-triage-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._evaluate(*job)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Shadow triage failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _evaluate(self, intake_id, symptoms, age, risk_conditions, pregnancy_week, trimester, production):
+        """Score one intake with the candidate ruleset and record any disagreement"""
+        classifier = EmergencyClassifier(ruleset=self._store.current(), cache=None)
+        shadow = classifier.assess(symptoms, age, risk_conditions, pregnancy_week, trimester)
+
+        disagreement = shadow.color_code != production.color_code
+        with self._lock:
+            self.compared += 1
+            self.transitions[f"{production.color_code}->{shadow.color_code}"] += 1
+            if not disagreement:
+                return
+            self.disagreements += 1
+            if self.log_path:
+                record = {
+                    "at": datetime.utcnow().isoformat(timespec="seconds"),
+                    "id": intake_id,
+                    "ticket": production.ticket_number,
+                    "from": production.color_code,
+                    "to": shadow.color_code,
+                    "score": production.score,
+                    "shadow_score": shadow.score,
+                    "version": production.ruleset_version,
+                    "shadow_version": shadow.ruleset_version
+                }
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def stats(self) -> Dict:
+        """Shadow evaluation counters for monitoring"""
+        store = self._store
+        with self._lock:
+            return {
+                "enabled": store is not None,
+                "candidate": store.status() if store else None,
+                "queue_size": self.queue_size,
+                "queued": self._queue.qsize(),
+                "workers": len(self._threads),
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "compared": self.compared,
+                "disagreements": self.disagreements,
+                "agreement_rate": round(1 - self.disagreements / self.compared, 4) if self.compared else None,
+                "errors": self.errors,
+                "transitions": dict(sorted(self.transitions.items())),
+                "log_path": self.log_path
+            }
+
+
+# Shared by every request in the process
+shadow_evaluator = ShadowEvaluator()
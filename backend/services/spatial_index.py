@@ -0,0 +1,160 @@
+import math
+import threading
+from typing import Dict, List, Tuple
+
+from sqlalchemy import column, inspect, table, text
+
+from models import db, PatientIntake
+
+RTREE_TABLE = "patient_intake_rtree"
+
+# Kilometres per degree of latitude (and of longitude at the equator)
+KM_PER_DEGREE = 111.195
+
+# R*Tree over the car positions of patient_intake, kept in sync by triggers.
+# Each position is stored as a degenerate box (min == max).
+RTREE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    f"""CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_insert AFTER INSERT ON patient_intake
+    WHEN NEW.car_lat IS NOT NULL AND NEW.car_lng IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO {RTREE_TABLE} VALUES (NEW.id, NEW.car_lat, NEW.car_lat, NEW.car_lng, NEW.car_lng);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_update AFTER UPDATE OF car_lat, car_lng ON patient_intake
+    BEGIN
+        DELETE FROM {RTREE_TABLE} WHERE id = OLD.id;
+        INSERT INTO {RTREE_TABLE}
+            SELECT NEW.id, NEW.car_lat, NEW.car_lat, NEW.car_lng, NEW.car_lng
+            WHERE NEW.car_lat IS NOT NULL AND NEW.car_lng IS NOT NULL;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_delete AFTER DELETE ON patient_intake
+    BEGIN
+        DELETE FROM {RTREE_TABLE} WHERE id = OLD.id;
+    END"""
+]
+
+# Adds positions the R*Tree is missing, e.g. rows written before it existed
+RTREE_SYNC_STATEMENT = f"""INSERT INTO {RTREE_TABLE}
+    SELECT id, car_lat, car_lat, car_lng, car_lng FROM patient_intake
+    WHERE car_lat IS NOT NULL AND car_lng IS NOT NULL AND id NOT IN (SELECT id FROM {RTREE_TABLE})"""
+
+_rtree = table(RTREE_TABLE, column("id"), column("min_lat"), column("max_lat"), column("min_lng"), column("max_lng"))
+
+
+def radius_bounds(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lng, max_lat, max_lng) of the box around a circle"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+class SpatialIndex:
+    """
+    Bounding-box and radius queries over patients' car positions.
+
+    Positions are stored in the car_lat/car_lng columns of patient_intake. On
+    SQLite they are also indexed in an R*Tree virtual table that triggers keep
+    in sync, so a box query is answered from the index instead of a table scan.
+    Other databases, or SQLite builds without the R*Tree module, filter on the
+    columns directly. A radius query takes the box around the circle and keeps
+    rows within the radius using an equirectangular distance, which is exact to
+    well under 1% at city scale and needs no trigonometry in SQL.
+    """
+
+    def __init__(self):
+        self.rtree = False
+        self.error = None
+        self._lock = threading.Lock()
+        self.box_queries = 0
+        self.radius_queries = 0
+
+    def install(self) -> bool:
+        """
+        Create the R*Tree and its triggers if needed and index positions it is missing
+
+        Must be called inside a Flask app context, after the tables exist.
+
+        Returns:
+            Whether queries use the R*Tree
+        """
+        engine = db.engine
+        self.rtree = False
+        if engine.dialect.name != "sqlite":
+            return False
+        columns = {c["name"] for c in inspect(engine).get_columns(PatientIntake.__tablename__)}
+        if not {"car_lat", "car_lng"} <= columns:
+            self.error = "car_lat/car_lng columns missing, run backfill_coordinates.py"
+            print(f"Spatial index not installed: {self.error}")
+            return False
+        try:
+            with engine.begin() as connection:
+                for statement in RTREE_STATEMENTS:
+                    connection.execute(text(statement))
+                connection.execute(text(RTREE_SYNC_STATEMENT))
+        except Exception as e:
+            self.error = str(e)
+            print(f"Spatial index not installed: {e}")
+            return False
+        self.rtree = True
+        self.error = None
+        return True
+
+    def within_box(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        """
+        Patients whose car position lies inside a lat/lng box
+
+        Returns:
+            A PatientIntake query, to be filtered and ordered further by the caller
+        """
+        with self._lock:
+            self.box_queries += 1
+        return self._box_query(min_lat, min_lng, max_lat, max_lng)
+
+    def within_radius(self, lat: float, lng: float, radius_km: float):
+        """
+        Patients whose car position is within radius_km of a point
+
+        Returns:
+            A PatientIntake query, to be filtered and ordered further by the caller
+        """
+        with self._lock:
+            self.radius_queries += 1
+        scale = math.cos(math.radians(lat))
+        dy = PatientIntake.car_lat - lat
+        dx = (PatientIntake.car_lng - lng) * scale
+        return self._box_query(*radius_bounds(lat, lng, radius_km)).filter(
+            dx * dx + dy * dy <= (radius_km / KM_PER_DEGREE) ** 2
+        )
+
+    def _box_query(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        query = PatientIntake.query
+        if self.rtree:
+            query = query.join(_rtree, _rtree.c.id == PatientIntake.id).filter(
+                _rtree.c.max_lat >= min_lat, _rtree.c.min_lat <= max_lat,
+                _rtree.c.max_lng >= min_lng, _rtree.c.min_lng <= max_lng
+            )
+        # The R*Tree stores 32-bit floats rounded outwards, so the exact bounds are checked as well
+        return query.filter(
+            PatientIntake.car_lat.between(min_lat, max_lat),
+            PatientIntake.car_lng.between(min_lng, max_lng)
+        )
+
+    @staticmethod
+    def distances_km(lat: float, lng: float, points: List[Tuple[float, float]]) -> List[float]:
+        """Equirectangular distances from a point, matching within_radius"""
+        scale = math.cos(math.radians(lat))
+        return [math.hypot((p_lng - lng) * scale, p_lat - lat) * KM_PER_DEGREE for p_lat, p_lng in points]
+
+    def stats(self) -> Dict:
+        """Index state and query counters for monitoring"""
+        with self._lock:
+            return {
+                "rtree": self.rtree,
+                "error": self.error,
+                "box_queries": self.box_queries,
+                "radius_queries": self.radius_queries
+            }
+
+
+# Shared by every request in the process
+spatial_index = SpatialIndex()
@@ -0,0 +1,84 @@
+import threading
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+
+from models import db, TicketSequence
+
+
+class TicketAllocator:
+    """
+    Collision-free ticket numbers from a per-prefix, per-day sequence.
+
+    Numbers are handed out from an in-memory block. When a block runs out, the next
+    block is reserved from the `ticket_sequence` table in one short transaction, so
+    several worker processes can share a sequence without ever issuing the same
+    number and without a database query per ticket. Sequences restart at 1 each day.
+    """
+
+    def __init__(self, block_size: int = 20, retention_days: int = 7):
+        """
+        Args:
+            block_size: Numbers reserved per database round trip
+            retention_days: Sequence rows older than this are pruned
+        """
+        self.block_size = block_size
+        self.retention_days = retention_days
+        # prefix -> [day, next number, end of block (exclusive)]
+        self._blocks: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Apply allocator settings from the Flask app config"""
+        self.block_size = app.config.get('TICKET_BLOCK_SIZE', self.block_size)
+        with self._lock:
+            self._blocks.clear()
+
+    def allocate(self, prefix: str) -> str:
+        """
+        Issue the next ticket number for a prefix, e.g. "R007"
+
+        Must be called inside a Flask app context.
+        """
+        today = date.today()
+        with self._lock:
+            block = self._blocks.get(prefix)
+            if block is None or block[0] != today or block[1] >= block[2]:
+                start = self._reserve_block(prefix, today)
+                block = [today, start, start + self.block_size]
+                self._blocks[prefix] = block
+            number = block[1]
+            block[1] += 1
+        return f"{prefix}{number:03d}"
+
+    def _reserve_block(self, prefix: str, day: date) -> int:
+        """Reserve the next block of numbers in the sequence table and return its first number"""
+        table = TicketSequence.__table__
+        for _ in range(3):
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(
+                        update(table)
+                        .where(table.c.prefix == prefix, table.c.day == day)
+                        .values(next_value=table.c.next_value + self.block_size)
+                    )
+                    if result.rowcount:
+                        next_value = conn.execute(
+                            select(table.c.next_value).where(table.c.prefix == prefix, table.c.day == day)
+                        ).scalar_one()
+                        return next_value - self.block_size
+
+                    # First ticket of the day for this prefix
+                    conn.execute(table.insert().values(prefix=prefix, day=day, next_value=1 + self.block_size))
+                    conn.execute(delete(table).where(table.c.day < day - timedelta(days=self.retention_days)))
+                    return 1
+            except IntegrityError:
+                # Another process created today's row first; reserve from it instead
+                continue
+        raise RuntimeError(f"Could not reserve ticket numbers for prefix {prefix}")
+
+
+# Shared by every request in the process
+ticket_allocator = TicketAllocator()
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Mapping, Optional
+
+# Band limits of the shipped ruleset (rulesets/triage_ruleset.json), used when none are given
+DEFAULT_LIMITS = {'teen_age_below': 18, 'advanced_age_above': 35, 'early_week_below': 12, 'late_week_above': 36}
+
+
+class TriageCache:
+    """
+    Bounded LRU cache of triage assessments
+
+    Many intakes repeat the same short symptom strings ("routine visit", "checkup",
+    "Pregnancy care registration"), so the scoring and analysis for a given set of
+    inputs is computed once and reused. Entries are tied to the keyword vocabulary
+    they were computed with: as soon as a lookup arrives with a different vocabulary
+    the cache is emptied, so a changed keyword list can never serve a stale result.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_symptoms_length: int = 200):
+        """
+        Args:
+            maxsize: Maximum number of cached assessments
+            max_symptoms_length: Longer symptom texts are not cached, since free-text
+                descriptions rarely repeat and would only crowd out useful entries
+        """
+        self.maxsize = maxsize
+        self.max_symptoms_length = max_symptoms_length
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._vocabulary: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        """Apply cache settings from the Flask app config"""
+        self.maxsize = app.config.get('TRIAGE_CACHE_SIZE', self.maxsize)
+        self.max_symptoms_length = app.config.get('TRIAGE_CACHE_MAX_SYMPTOMS_LENGTH', self.max_symptoms_length)
+        self.clear()
+
+    def make_key(self, symptoms_lower: str, age: int, risk_conditions, pregnancy_week: int = None, trimester: str = None,
+                 limits: Mapping[str, int] = None) -> Optional[Hashable]:
+        """
+        Build the cache key for one set of classifier inputs
+
+        Age and pregnancy week are reduced to the bands the scoring rules distinguish,
+        so e.g. every 25 year old at week 20 shares an entry.
+
+        Args:
+            limits: Age and week band limits of the ruleset scoring these inputs
+                (TriageRuleset.limits); the built-in defaults if None
+
+        Returns:
+            The key, or None when the inputs should not be cached
+        """
+        if self.maxsize <= 0 or len(symptoms_lower) > self.max_symptoms_length:
+            return None
+
+        limits = DEFAULT_LIMITS if limits is None else limits
+        if age < limits['teen_age_below']:
+            age_band = 'teen'
+        elif age > limits['advanced_age_above']:
+            age_band = 'advanced'
+        else:
+            age_band = 'standard'
+
+        if not pregnancy_week:
+            week_band = None
+        elif pregnancy_week < limits['early_week_below']:
+            week_band = 'early'
+        elif pregnancy_week > limits['late_week_above']:
+            week_band = 'late'
+        else:
+            week_band = 'mid'
+
+        return (
+            symptoms_lower.strip(),
+            age_band,
+            frozenset(condition.lower() for condition in risk_conditions),
+            week_band,
+            trimester.lower() if trimester else None
+        )
+
+    def get(self, vocabulary: Hashable, key: Hashable):
+        """Return the cached assessment for the key, or None on a miss"""
+        with self._lock:
+            if vocabulary != self._vocabulary:
+                # Keyword lists changed: drop everything computed with the old ones
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._vocabulary = vocabulary
+
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, vocabulary: Hashable, key: Hashable, value):
+        """Store an assessment, evicting the least recently used entry when full"""
+        with self._lock:
+            if vocabulary != self._vocabulary:
+                return
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._vocabulary = None
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Shared by every EmergencyClassifier in the process
+triage_cache = TriageCache()
@@ -0,0 +1,237 @@
+import os
+import json
+import glob
+import time
+import threading
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from services.keyword_matcher import KeywordMatcher
+from services.fuzzy_index import SymSpellIndex
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_RULESET_PATH = os.path.join(BASE_DIR, "rulesets", "triage_ruleset.json")
+
+
+def synonym_files(ruleset_path: str) -> List[str]:
+    """Per-language synonym files in the `synonyms` directory next to a ruleset file"""
+    return sorted(glob.glob(os.path.join(os.path.dirname(ruleset_path), "synonyms", "*.json")))
+
+
+class TriageRuleset:
+    """
+    Immutable, compiled triage ruleset: keyword lists, keyword matchers and score table.
+
+    A ruleset is compiled once when it is loaded and then shared read-only by every
+    classifier, so building a classifier per request costs nothing.
+    """
+
+    def __init__(self, data: Dict, source: str = None, synonyms: List[Dict] = None):
+        """
+        Compile a ruleset from its parsed file contents
+
+        Args:
+            data: Parsed ruleset document (see rulesets/triage_ruleset.json)
+            source: Where the ruleset was loaded from, for reporting
+            synonyms: Parsed synonym documents (see rulesets/synonyms/), each mapping
+                canonical phrases of this ruleset to local-language phrases
+
+        Raises:
+            ValueError: If the document is missing required sections
+        """
+        try:
+            self.version = str(data["version"])
+            keywords = data["keywords"]
+            self.critical_keywords: Tuple[str, ...] = tuple(keywords["critical"])
+            self.urgent_keywords: Tuple[str, ...] = tuple(keywords["urgent"])
+            self.light_keywords: Tuple[str, ...] = tuple(keywords["light"])
+            self.risk_factors: Tuple[str, ...] = tuple(data["risk_factors"])
+            self.severity_modifiers: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+                name: tuple(modifier["phrases"]) for name, modifier in data["severity_modifiers"].items()
+            })
+            self.modifier_points: Mapping[str, int] = MappingProxyType({
+                name: int(modifier["points"]) for name, modifier in data["severity_modifiers"].items()
+            })
+            self.analysis_indicators: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+                name: tuple(phrases) for name, phrases in data.get("analysis_indicators", {}).items()
+            })
+            self.points: Mapping[str, int] = MappingProxyType({
+                name: int(value) for name, value in data["points"].items()
+            })
+            self.limits: Mapping[str, int] = MappingProxyType({
+                name: int(value) for name, value in data["limits"].items()
+            })
+            self.critical_threshold = int(data["thresholds"]["critical"])
+            self.urgent_threshold = int(data["thresholds"]["urgent"])
+            self.max_score = int(data.get("max_score", 10))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"Invalid triage ruleset: {str(e)}")
+
+        missing = [name for name in ('critical', 'urgent', 'light', 'risk_factor', 'teen_age', 'advanced_age',
+                                     'early_week', 'late_week', 'first_trimester', 'third_trimester')
+                   if name not in self.points]
+        missing += [name for name in ('teen_age_below', 'advanced_age_above', 'early_week_below', 'late_week_above')
+                    if name not in self.limits]
+        if missing:
+            raise ValueError(f"Invalid triage ruleset: missing {', '.join(missing)}")
+
+        self.source = source
+        self.all_keywords: Tuple[str, ...] = self.critical_keywords + self.urgent_keywords + self.light_keywords
+
+        # Compile every symptom-side phrase into one matcher and the risk factors into another
+        categories = {
+            'critical': self.critical_keywords,
+            'urgent': self.urgent_keywords,
+            'light': self.light_keywords
+        }
+        for name, phrases in self.severity_modifiers.items():
+            categories[f"modifier:{name}"] = phrases
+        for name, phrases in self.analysis_indicators.items():
+            categories[f"indicator:{name}"] = phrases
+        canonical_phrases = {phrase for phrases in categories.values() for phrase in phrases}
+        aliases, self.languages = self._compile_synonyms(synonyms or [], canonical_phrases)
+        self.symptom_matcher = KeywordMatcher(categories, aliases)
+        self.risk_matcher = KeywordMatcher({'risk': self.risk_factors})
+
+        # Typo correction towards the words of the symptom-side phrases and their translations
+        self.fuzzy_index = SymSpellIndex.from_phrases(self.symptom_matcher.patterns + tuple(aliases))
+
+    @staticmethod
+    def _compile_synonyms(synonyms: List[Dict], canonical_phrases) -> Tuple[Dict[str, str], Tuple[str, ...]]:
+        """
+        Flatten synonym documents into one alias -> canonical phrase table
+
+        Raises:
+            ValueError: If a document is malformed or maps onto an unknown phrase
+        """
+        aliases: Dict[str, str] = {}
+        languages = []
+        for document in synonyms:
+            try:
+                language = str(document["language"])
+                table = document["synonyms"]
+                for canonical, phrases in table.items():
+                    if canonical not in canonical_phrases:
+                        raise ValueError(f"{language}: '{canonical}' is not a phrase of this ruleset")
+                    for phrase in phrases:
+                        alias = " ".join(phrase.lower().split())
+                        if alias:
+                            aliases.setdefault(alias, canonical)
+            except (KeyError, TypeError, AttributeError) as e:
+                raise ValueError(f"Invalid synonym table: {str(e)}")
+            languages.append(language)
+        return aliases, tuple(languages)
+
+    @classmethod
+    def load(cls, path: str) -> 'TriageRuleset':
+        """
+        Load and compile a ruleset file together with its synonym files
+
+        Raises:
+            ValueError: If a file cannot be read or is not valid
+        """
+        documents = []
+        for file_path in [path] + synonym_files(path):
+            try:
+                with open(file_path, encoding="utf-8") as f:
+                    documents.append(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                raise ValueError(f"Could not read triage ruleset {file_path}: {str(e)}")
+        return cls(documents[0], source=path, synonyms=documents[1:])
+
+
+class RulesetStore:
+    """
+    Holds the active compiled ruleset and hot-swaps it when the file changes.
+
+    The modification times of the ruleset file and its synonym files are checked
+    at most once per `check_interval` seconds. A changed file is compiled off to the side and only then swapped in
+    with a single reference assignment, so requests always see either the old or
+    the new ruleset, never a half-built one. A file that fails to load leaves the
+    previous ruleset active.
+    """
+
+    def __init__(self, path: str = DEFAULT_RULESET_PATH, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._ruleset: Optional[TriageRuleset] = None
+        self._fingerprint: Optional[Tuple] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[datetime] = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def init_app(self, app):
+        """Apply ruleset settings from the Flask app config and load the ruleset"""
+        with self._lock:
+            self.path = app.config.get('TRIAGE_RULESET_PATH', self.path)
+            self.check_interval = app.config.get('TRIAGE_RULESET_CHECK_INTERVAL', self.check_interval)
+            self._ruleset = None
+            self._fingerprint = None
+            self._next_check = 0.0
+        self.current()
+
+    def current(self) -> TriageRuleset:
+        """
+        Return the active ruleset, reloading it first if the file has changed
+
+        Raises:
+            ValueError: If no ruleset has ever been loaded successfully
+        """
+        ruleset = self._ruleset
+        if ruleset is not None and time.monotonic() < self._next_check:
+            return ruleset
+
+        with self._lock:
+            if self._ruleset is None or time.monotonic() >= self._next_check:
+                self._next_check = time.monotonic() + self.check_interval
+                self._reload_if_changed()
+            if self._ruleset is None:
+                raise ValueError(self.last_error or "No triage ruleset loaded")
+            return self._ruleset
+
+    def _reload_if_changed(self):
+        """Compile and swap in the ruleset if its file or any synonym file changed"""
+        try:
+            fingerprint = tuple((path, os.path.getmtime(path)) for path in [self.path] + synonym_files(self.path))
+        except OSError as e:
+            self.last_error = f"Could not stat triage ruleset {self.path}: {str(e)}"
+            return
+
+        if self._ruleset is not None and fingerprint == self._fingerprint:
+            return
+
+        try:
+            ruleset = TriageRuleset.load(self.path)
+        except ValueError as e:
+            # Remember the broken files' mtimes so they are not re-parsed on every check
+            self._fingerprint = fingerprint
+            self.last_error = str(e)
+            print(f"Keeping previous triage ruleset: {e}")
+            return
+
+        if self._ruleset is not None:
+            self.reloads += 1
+        self._ruleset = ruleset
+        self._fingerprint = fingerprint
+        self.loaded_at = datetime.utcnow()
+        self.last_error = None
+
+    def status(self) -> Dict:
+        """Active ruleset details for monitoring"""
+        ruleset = self._ruleset
+        return {
+            "path": self.path,
+            "version": ruleset.version if ruleset else None,
+            "languages": list(ruleset.languages) if ruleset else [],
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "reloads": self.reloads,
+            "check_interval": self.check_interval,
+            "last_error": self.last_error
+        }
+
+
+# Active ruleset shared by every EmergencyClassifier in the process
+ruleset_store = RulesetStore()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the circuit breaker in front of Nominatim: it opens after repeated
+failures, lets one trial call through once the reset timeout has passed, and
+closes or reopens depending on that trial.
+
+Run with: python -m pytest test_circuit_breaker.py  (or python test_circuit_breaker.py)
+"""
+
+import time
+
+from services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def test_breaker_opens_after_threshold_and_recovers_through_half_open():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+    time.sleep(0.15)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()["times_opened"] == 2
+
+    # A success in between resets the count of consecutive failures
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+if __name__ == "__main__":
+    print("Circuit breaker tests")
+    for test in (test_breaker_opens_after_threshold_and_recovers_through_half_open, test_failed_trial_reopens_breaker):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Tests for background ETA enrichment against a stub Nominatim server.
+
+The stub answers on localhost: addresses containing "unknown" are not found,
+addresses containing "slow" are answered after SLOW_SECONDS, and everything
+else resolves at once to a point near the hospital.
+
+Run with: python -m pytest test_eta_enrichment.py  (or python test_eta_enrichment.py)
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from flask import Flask
+
+from config import Config
+from models import db, PatientIntake
+from routes.intake import intake_bp
+from services.geocode_cache import geocode_cache
+from services.gazetteer import gazetteer
+from services.nominatim_client import GeocoderUnavailable, nominatim_client
+from services.facility_registry import facility_registry
+from services.eta_enrichment import eta_enricher, ETA_PENDING, ETA_CALCULATED, ETA_FAILED
+
+SLOW_SECONDS = 0.3
+
+
+class StubNominatim(BaseHTTPRequestHandler):
+    """Minimal Nominatim search endpoint"""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        if "slow" in query.lower():
+            time.sleep(SLOW_SECONDS)
+        body = [] if "unknown" in query.lower() else [{"lat": "-26.1500", "lon": "28.0500"}]
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNominatim)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_app(server, **config):
+    """Flask app on a temporary database with the geocoding services pointed at the stub"""
+    directory = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(directory, 'enrichment.db')}"
+    app.config["GEOCODE_CACHE_PATH"] = os.path.join(directory, "geocode_cache.db")
+    app.config["NOMINATIM_URL"] = f"http://127.0.0.1:{server.server_port}/search"
+    app.config.update(config)
+    db.init_app(app)
+    app.register_blueprint(intake_bp)
+    for service in (geocode_cache, gazetteer, nominatim_client, facility_registry, eta_enricher):
+        service.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def add_pending(app, addresses):
+    """Store one pending intake per address and return their ids"""
+    with app.app_context():
+        patients = [PatientIntake(
+            name=f"Patient {i}", age=30, contact="0820000000", symptoms="pain", arrival_mode="car",
+            car_location=json.dumps({"address": address}), eta_status=ETA_PENDING
+        ) for i, address in enumerate(addresses)]
+        db.session.add_all(patients)
+        db.session.commit()
+        return [patient.id for patient in patients]
+
+
+def enrich_all(app, addresses, timeout=30):
+    """Queue every address through the enricher and wait until all are done"""
+    ids = add_pending(app, addresses)
+    done_before = eta_enricher.completed + eta_enricher.failed
+    for intake_id, address in zip(ids, addresses):
+        eta_enricher.submit(intake_id, {"address": address})
+    deadline = time.monotonic() + timeout
+    while eta_enricher.completed + eta_enricher.failed < done_before + len(ids):
+        assert time.monotonic() < deadline, "enrichment did not finish"
+        time.sleep(0.02)
+    with app.app_context():
+        rows = PatientIntake.query.filter(PatientIntake.id.in_(ids)).order_by(PatientIntake.id).all()
+        return [(row.eta_status, row.eta_minutes, row.facility_code, row.car_lat, row.car_lng) for row in rows]
+
+
+def test_unknown_address_is_stored_as_failed_without_eta():
+    """An address the geocoder cannot find is failed, not the default estimate marked calculated"""
+    server = start_stub()
+    try:
+        app = create_app(server, NOMINATIM_RATE_LIMIT=100, NOMINATIM_BURST=10)
+        found, missing = enrich_all(app, ["12 Stub Street, Testville", "9 Unknown Road, Nowhere"])
+    finally:
+        server.shutdown()
+
+    assert found[0] == ETA_CALCULATED
+    assert found[1] is not None and found[3] is not None
+    assert missing == (ETA_FAILED, None, None, None, None)
+
+
+def test_address_cached_as_not_found_is_failed_at_intake():
+    """Intake answers a known-bad address offline with no ETA, never the city-wide guess"""
+    server = start_stub()
+    try:
+        app = create_app(server)
+        geocode_cache.put("9 Unknown Road, Nowhere", None)
+        submitted_before = eta_enricher.submitted
+        client = app.test_client()
+        intake = {"name": "Thandi", "age": 28, "contact": "0820000000", "symptoms": "routine checkup",
+                  "arrival_mode": "car", "car_location": {"address": "9 Unknown Road, Nowhere"}}
+        single = client.post("/intake", json=intake)
+        batch = client.post("/intake/batch", json={"intakes": [intake]})
+    finally:
+        server.shutdown()
+
+    assert single.status_code == 201 and batch.status_code == 201
+    assert single.get_json()["eta_status"] == ETA_FAILED
+    assert "eta_minutes" not in single.get_json()
+    assert eta_enricher.submitted == submitted_before
+    with app.app_context():
+        rows = PatientIntake.query.all()
+        assert len(rows) == 2
+        for row in rows:
+            assert (row.eta_status, row.eta_minutes, row.facility_code, row.car_lat) == (ETA_FAILED, None, None, None)
+
+
+def test_throttled_burst_is_not_cut_short_by_latency_budget():
+    """
+    A burst queued behind the rate limit is geocoded in full by the background workers
+
+    At 5 requests per second the sixth address waits a second for its token, far
+    beyond the 100 ms budget; the enricher waits with the HTTP timeout instead.
+    """
+    server = start_stub()
+    try:
+        app = create_app(server, NOMINATIM_RATE_LIMIT=5, NOMINATIM_BURST=1, GEOCODE_LATENCY_BUDGET_MS=100)
+        exceeded_before = nominatim_client.budget_exceeded
+        rows = enrich_all(app, [f"{n} Stub Street, Testville" for n in range(1, 7)])
+    finally:
+        server.shutdown()
+
+    assert nominatim_client.budget_exceeded == exceeded_before
+    assert nominatim_client.throttled >= 5
+    for status, eta_minutes, facility_code, car_lat, car_lng in rows:
+        assert status == ETA_CALCULATED
+        assert eta_minutes is not None and facility_code is not None
+        assert (car_lat, car_lng) == (-26.15, 28.05)
+
+
+def test_latency_budget_bounds_the_total_wait():
+    """Queueing for a rate-limit token counts against the budget, and so does a slow answer"""
+    server = start_stub()
+    try:
+        create_app(server, NOMINATIM_RATE_LIMIT=1, NOMINATIM_BURST=1, GEOCODE_LATENCY_BUDGET_MS=100)
+        assert nominatim_client.search("1 Stub Street, Testville") == (-26.15, 28.05)
+        # The next token is a second away
+        started = time.monotonic()
+        try:
+            nominatim_client.search("2 Stub Street, Testville")
+            raise AssertionError("the budget was not applied")
+        except GeocoderUnavailable as e:
+            assert time.monotonic() - started < 0.5
+            # The answer still arrives for the cache
+            assert e.pending.result(timeout=5) == (-26.15, 28.05)
+
+        create_app(server, NOMINATIM_RATE_LIMIT=100, NOMINATIM_BURST=10, GEOCODE_LATENCY_BUDGET_MS=100)
+        try:
+            nominatim_client.search("1 Slow Lane, Testville")
+            raise AssertionError("the budget was not applied")
+        except GeocoderUnavailable as e:
+            assert e.pending is not None
+            assert e.pending.result(timeout=5) == (-26.15, 28.05)
+    finally:
+        server.shutdown()
+
+
+def test_slow_answer_within_callers_timeout_does_not_trip_breaker():
+    """A background lookup that waits longer than the request budget judges slowness by its own timeout"""
+    server = start_stub()
+    try:
+        create_app(server, NOMINATIM_RATE_LIMIT=100, NOMINATIM_BURST=10, GEOCODE_LATENCY_BUDGET_MS=100,
+                   GEOCODE_BREAKER_FAILURES=1)
+        slow_before = nominatim_client.slow
+        assert nominatim_client.search("1 Slow Lane, Testville", timeout=5) == (-26.15, 28.05)
+    finally:
+        server.shutdown()
+
+    assert nominatim_client.slow == slow_before
+    assert nominatim_client.breaker.state == "closed"
+
+
+def test_open_breaker_keeps_intake_pending_and_retries():
+    """An address queued while the breaker is open is retried, not failed for good"""
+    server = start_stub()
+    try:
+        app = create_app(server, NOMINATIM_RATE_LIMIT=100, NOMINATIM_BURST=10, GEOCODE_BREAKER_FAILURES=1,
+                         GEOCODE_BREAKER_RESET_SECONDS=0.5, ETA_RETRY_BASE_SECONDS=0.1)
+        nominatim_client.breaker.record_failure()
+        retried_before = eta_enricher.retried
+        intake_id = add_pending(app, ["7 Retry Road, Testville"])[0]
+        done_before = eta_enricher.completed + eta_enricher.failed
+        eta_enricher.submit(intake_id, {"address": "7 Retry Road, Testville"})
+
+        deadline = time.monotonic() + 5
+        while eta_enricher.retried == retried_before:
+            assert time.monotonic() < deadline, "no retry was scheduled"
+            time.sleep(0.01)
+        with app.app_context():
+            assert db.session.get(PatientIntake, intake_id).eta_status == ETA_PENDING
+
+        while eta_enricher.completed + eta_enricher.failed == done_before:
+            assert time.monotonic() < deadline, "the retry did not finish"
+            time.sleep(0.02)
+        with app.app_context():
+            row = db.session.get(PatientIntake, intake_id)
+            assert (row.eta_status, row.car_lat, row.car_lng) == (ETA_CALCULATED, -26.15, 28.05)
+            assert row.eta_minutes is not None
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    print("ETA enrichment tests")
+    for test in (test_unknown_address_is_stored_as_failed_without_eta,
+                 test_address_cached_as_not_found_is_failed_at_intake,
+                 test_throttled_burst_is_not_cut_short_by_latency_budget,
+                 test_latency_budget_bounds_the_total_wait,
+                 test_slow_answer_within_callers_timeout_does_not_trip_breaker,
+                 test_open_breaker_keeps_intake_pending_and_retries):
+        test()
+        print(f"✅ {test.__name__}")
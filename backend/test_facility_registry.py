@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the facility registry's KD-tree: the k nearest facilities must match
+a brute-force great-circle search, including across the antimeridian.
+
+Run with: python -m pytest test_facility_registry.py  (or python test_facility_registry.py)
+"""
+
+import math
+import random
+
+from services.facility_registry import EARTH_RADIUS_KM, Facility, FacilityRegistry
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def brute_force(facilities, lat, lng, k):
+    distances = sorted((haversine_km(lat, lng, f.lat, f.lng), f.code) for f in facilities)
+    return distances[:k]
+
+
+def random_facilities(rng, count, lat_range, lng_range):
+    return [Facility(f"F{i:03d}", f"Facility {i}", rng.uniform(*lat_range), rng.uniform(*lng_range))
+            for i in range(count)]
+
+
+def assert_matches_brute_force(registry, facilities, lat, lng, k):
+    found = registry.nearest(lat, lng, k)
+    expected = brute_force(facilities, lat, lng, k)
+    assert [f.code for f, _ in found] == [code for _, code in expected]
+    for (_, distance), (expected_distance, _) in zip(found, expected):
+        assert math.isclose(distance, expected_distance, rel_tol=1e-6, abs_tol=1e-6)
+
+
+def test_nearest_k_matches_brute_force():
+    rng = random.Random(7)
+    # Facilities around Gauteng, queried from inside and outside their spread
+    facilities = random_facilities(rng, 200, (-26.8, -25.4), (27.4, 28.8))
+    registry = FacilityRegistry(path=None)
+    registry.load(facilities)
+    for _ in range(100):
+        lat, lng = rng.uniform(-27.5, -24.5), rng.uniform(26.5, 29.5)
+        for k in (1, 3, 10):
+            assert_matches_brute_force(registry, facilities, lat, lng, k)
+
+
+def test_nearest_across_the_antimeridian():
+    rng = random.Random(11)
+    facilities = (random_facilities(rng, 30, (-20.0, -15.0), (177.0, 180.0))
+                  + random_facilities(rng, 30, (-20.0, -15.0), (-180.0, -177.0)))
+    registry = FacilityRegistry(path=None)
+    registry.load(facilities)
+    for lng in (179.9, -179.9, 180.0):
+        assert_matches_brute_force(registry, facilities, -17.5, lng, 5)
+
+
+def test_k_larger_than_registry_and_empty_registry():
+    facilities = [Facility("A", "A", -26.0, 28.0), Facility("B", "B", -26.5, 28.5)]
+    registry = FacilityRegistry(path=None)
+    registry.load(facilities)
+    assert [f.code for f, _ in registry.nearest(-26.1, 28.1, k=5)] == ["A", "B"]
+    assert registry.nearest(-26.1, 28.1, k=0) == []
+
+    registry.load([])
+    assert registry.nearest(-26.1, 28.1) == []
+    assert registry.default is None
+
+
+if __name__ == "__main__":
+    print("Facility registry tests")
+    for test in (test_nearest_k_matches_brute_force, test_nearest_across_the_antimeridian,
+                 test_k_larger_than_registry_and_empty_registry):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline gazetteer: addresses it knows are placed without the
+network, and addresses with any part it does not know are left to Nominatim
+instead of being matched to a similar-looking local place.
+
+Run with: python -m pytest test_gazetteer.py  (or python test_gazetteer.py)
+"""
+
+from services.gazetteer import Gazetteer
+
+gazetteer = Gazetteer()
+
+
+def place_name(address):
+    place = gazetteer.lookup(address)
+    return place.name if place is not None else None
+
+
+def test_known_addresses_are_placed():
+    assert place_name("12 Vilakazi St, Orlando West, Soweto") == "Orlando West"
+    assert place_name("Chris Hani Baragwanath Hospital, Soweto") == "Chris Hani Baragwanath Hospital"
+    assert place_name("Diepkloof, Soweto, 1864, South Africa") == "Diepkloof"
+    assert place_name("Flat 4, Hillbrow") == "Hillbrow"
+    assert place_name("Alex") == "Alexandra"
+
+
+def test_prefixes_and_typos_of_whole_parts():
+    assert place_name("Sandton ci") == "Sandton City"
+    assert place_name("Kempton") == "Kempton Park"
+    assert place_name("Tembsia") == "Tembisa"
+    assert place_name("Helen Josph Hospital") == "Helen Joseph Hospital"
+
+
+def test_places_elsewhere_are_left_to_nominatim():
+    before = gazetteer.stats()["misses"]
+    # Similar-looking names: a shared "fontein" is not a typo
+    assert place_name("Bloemfontein") is None
+    # A known name inside a street, with a town the gazetteer does not cover
+    assert place_name("Alexandra Road, Pietermaritzburg") is None
+    # A known part next to an unknown town
+    assert place_name("Orange Farm, Bloemfontein") is None
+    assert gazetteer.stats()["misses"] == before + 3
+
+
+def test_single_words_inside_a_part_do_not_match():
+    assert place_name("Hospital") is None
+    assert place_name("Soweto Hospital road") is None
+
+
+if __name__ == "__main__":
+    print("Gazetteer tests")
+    for test in (test_known_addresses_are_placed, test_prefixes_and_typos_of_whole_parts,
+                 test_places_elsewhere_are_left_to_nominatim, test_single_words_inside_a_part_do_not_match):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the two-tier geocode cache: normalized keys, the persistent SQLite
+tier, cached "not found" results, LRU eviction and stale entries.
+
+Run with: python -m pytest test_geocode_cache.py  (or python test_geocode_cache.py)
+"""
+
+import os
+import time
+import tempfile
+
+from services.geocode_cache import GeocodeCache
+
+
+def test_normalized_addresses_share_an_entry():
+    cache = GeocodeCache(path=None)
+    cache.put("Sandton City, Johannesburg", (-26.108, 28.052))
+    for address in (" sandton  city johannesburg ", "SANDTON-CITY, Johannesburg"):
+        assert cache.get(address) == (True, (-26.108, 28.052))
+    assert cache.get("Rosebank, Johannesburg") == (False, None)
+    assert cache.stats()["memory_hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart_and_caches_not_found():
+    path = os.path.join(tempfile.mkdtemp(), "geocode_cache.db")
+    cache = GeocodeCache(path=path)
+    cache.put("12 Main Road, Soweto", (-26.25, 27.85))
+    cache.put("9 Unknown Road", None)
+
+    restarted = GeocodeCache(path=path)
+    assert restarted.get("12 main road soweto") == (True, (-26.25, 27.85))
+    assert restarted.get("9 Unknown Road") == (True, None)
+    assert restarted.stats()["disk_hits"] == 2 and restarted.stats()["negative_hits"] == 1
+
+
+def test_lru_evicts_oldest_and_expired_entries_are_stale():
+    cache = GeocodeCache(path=None, maxsize=2, ttl=0.05)
+    cache.put("A", (1.0, 1.0))
+    cache.put("B", (2.0, 2.0))
+    cache.get("A")
+    cache.put("C", (3.0, 3.0))
+    assert cache.get("B") == (False, None)
+    assert cache.get("A")[0] and cache.get("C")[0]
+
+    time.sleep(0.1)
+    assert cache.get("A") == (False, None)
+    assert cache.get("A", allow_stale=True) == (True, (1.0, 1.0))
+    assert cache.stats()["stale_hits"] == 1
+
+
+if __name__ == "__main__":
+    print("Geocode cache tests")
+    for test in (test_normalized_addresses_share_an_entry, test_disk_tier_survives_restart_and_caches_not_found,
+                 test_lru_evicts_oldest_and_expired_entries_are_stale):
+        test()
+        print(f"✅ {test.__name__}")
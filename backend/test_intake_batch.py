@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for batch intake: `EmergencyClassifier.triage_batch` must score every
+patient exactly like `triage`, and `POST /intake/batch` must validate the whole
+batch before saving any of it.
+
+Run with: python -m pytest test_intake_batch.py  (or python test_intake_batch.py)
+"""
+
+import os
+import tempfile
+import itertools
+
+from flask import Flask
+
+from config import Config
+from models import db, PatientIntake
+from routes.intake import intake_bp, MAX_BATCH_SIZE
+from services.emergency_classifier import EmergencyClassifier
+
+SYMPTOMS = ["routine checkup", "mild nausea", "severe vaginal bleeding", "headache and blurred vision",
+            "heavy bleeding and severe abdominal pain", "baby not moving", "convulsions", "preeclampsia"]
+RISKS = [[], ["Multiple pregnancy"], ["Chronic medication", "Previous pregnancy complications"]]
+PREGNANCIES = [(None, None), (8, "First"), (24, "Second"), (38, "Third")]
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'batch.db')}"
+    db.init_app(app)
+    app.register_blueprint(intake_bp)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def patients():
+    """Every combination of symptoms, age band, risk conditions and pregnancy stage"""
+    return [{"symptoms": symptoms, "age": age, "risk_conditions": risks,
+             "pregnancy_week": week, "trimester": trimester}
+            for symptoms, age, risks, (week, trimester)
+            in itertools.product(SYMPTOMS, (16, 28, 41), RISKS, PREGNANCIES)]
+
+
+def intake(name, symptoms="routine checkup", **fields):
+    return dict({"name": name, "age": 28, "contact": "0820000000", "symptoms": symptoms, "arrival_mode": "taxi"},
+                **fields)
+
+
+def outcome(result):
+    return (result.severity, result.color_code, result.score, result.explanation, result.to_analysis())
+
+
+def test_batch_scores_match_single_triage():
+    classifier = EmergencyClassifier(cache=None)
+    batch = patients()
+    results = classifier.triage_batch(batch)
+    assert len(results) == len(batch)
+    for patient, result in zip(batch, results):
+        assert outcome(result) == outcome(classifier.triage(**patient)), patient
+    assert {result.color_code for result in results} == {"R", "Y", "G"}
+
+
+def test_endpoint_stores_each_intake_with_its_own_id():
+    app = create_app()
+    items = [intake(f"Patient {i}", symptoms, chronic="Yes" if i % 2 else "No", pregnancy_week=30, trimester="Third")
+             for i, symptoms in enumerate(SYMPTOMS)]
+    response = app.test_client().post("/intake/batch", json={"intakes": items})
+    assert response.status_code == 201
+    created = response.get_json()["intakes"]
+    assert [entry["index"] for entry in created] == list(range(len(items)))
+
+    classifier = EmergencyClassifier(cache=None)
+    with app.app_context():
+        for item, entry in zip(items, created):
+            row = db.session.get(PatientIntake, entry["id"])
+            assert row.name == item["name"]
+            assert (row.ticket_number, row.color_code) == (entry["ticket_number"], entry["color_code"])
+            expected = classifier.assess(item["symptoms"], 28, ["Chronic medication"] if item["chronic"] == "Yes" else [],
+                                         30, "Third")
+            assert (row.severity_level, row.color_code) == (expected.severity, expected.color_code)
+        assert len({entry["id"] for entry in created}) == len(items)
+
+
+def test_invalid_intake_rejects_the_whole_batch():
+    app = create_app()
+    items = [intake("Valid"), {"name": "No age", "contact": "0820000000", "symptoms": "pain", "arrival_mode": "taxi"},
+             intake("Bad week", pregnancy_week="late"), "not an object"]
+    response = app.test_client().post("/intake/batch", json={"intakes": items})
+    assert response.status_code == 400
+    assert [error["index"] for error in response.get_json()["errors"]] == [1, 2, 3]
+    with app.app_context():
+        assert PatientIntake.query.count() == 0
+
+
+def test_batch_size_is_limited():
+    app = create_app()
+    client = app.test_client()
+    response = client.post("/intake/batch", json={"intakes": [intake(f"P{i}") for i in range(MAX_BATCH_SIZE + 1)]})
+    assert response.status_code == 400
+    assert client.post("/intake/batch", json={"intakes": []}).status_code == 400
+    with app.app_context():
+        assert PatientIntake.query.count() == 0
+
+
+if __name__ == "__main__":
+    print("Batch intake tests")
+    for test in (test_batch_scores_match_single_triage, test_endpoint_stores_each_intake_with_its_own_id,
+                 test_invalid_intake_rejects_the_whole_batch, test_batch_size_is_limited):
+        test()
+        print(f"✅ {test.__name__}")
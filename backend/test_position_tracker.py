@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized ETA engine and the live position tracker.
+
+The tracker is the only writer of a tracked patient's position and ETA in its
+process: batch position reports for them are taken as pings and bulk
+recomputation skips them. Across processes, every position write carries its
+fix time, so a flush can never put an older position back.
+
+Run with: python -m pytest test_position_tracker.py  (or python test_position_tracker.py)
+"""
+
+import os
+import json
+import time
+import atexit
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from config import Config
+from models import db, PatientIntake
+from routes.intake import intake_bp
+from routes.dashboard import dashboard_bp
+from services.eta_service import ETAService
+from services.eta_engine import ETAEngine
+from services.facility_registry import facility_registry
+from services.position_tracker import PositionTracker, position_tracker
+
+# Patients start about 10 km north of the main hospital
+START = (-26.11, 28.05)
+
+
+def create_app():
+    """Flask app on a temporary database; the tracker only flushes when a test says so"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'positions.db')}"
+    app.config["POSITION_FLUSH_INTERVAL"] = 3600
+    db.init_app(app)
+    app.register_blueprint(intake_bp)
+    app.register_blueprint(dashboard_bp)
+    facility_registry.init_app(app)
+    position_tracker.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def add_patients(app, count):
+    """Store patients en route with a GPS location and ETA, routed to MAIN; returns their ids"""
+    with app.app_context():
+        patients = [PatientIntake(
+            name=f"Patient {i}", age=30, contact="0820000000", symptoms="pain", arrival_mode="car",
+            car_location=json.dumps({"lat": START[0], "lng": START[1]}), car_lat=START[0], car_lng=START[1],
+            eta_minutes=99, eta_status="calculated", facility_code="MAIN"
+        ) for i in range(count)]
+        db.session.add_all(patients)
+        db.session.commit()
+        return [patient.id for patient in patients]
+
+
+def set_position(app, intake_id, lat, lng, eta_minutes, position_at):
+    """Write a position as another worker process would"""
+    with app.app_context():
+        PatientIntake.query.filter_by(id=intake_id).update(
+            {"car_lat": lat, "car_lng": lng, "eta_minutes": eta_minutes, "position_at": position_at})
+        db.session.commit()
+
+
+def stored(app, intake_id):
+    with app.app_context():
+        row = db.session.get(PatientIntake, intake_id)
+        return row.car_lat, row.car_lng, row.eta_minutes
+
+
+def test_engine_matches_scalar_eta():
+    """Position reports get the same ETA as calculate_eta for each point; unknown ids get None"""
+    app = create_app()
+    ids = add_patients(app, 3)
+    fixes = [{"id": ids[0], "lat": -26.15, "lng": 28.03},
+             {"id": ids[1], "lat": -26.30, "lng": 28.10},
+             {"id": 999999, "lat": -26.20, "lng": 28.00},
+             {"id": ids[2], "lat": -26.21, "lng": 28.05}]
+    with app.app_context():
+        results = ETAEngine().apply_position_fixes(fixes)
+        service = ETAService()
+        main = facility_registry.get("MAIN")
+        expected = [service.calculate_eta(fix["lat"], fix["lng"], main) for fix in fixes]
+
+    assert [result["id"] for result in results] == [fix["id"] for fix in fixes]
+    assert results[2]["eta_minutes"] is None
+    for fix, result, eta_minutes in zip(fixes, results, expected):
+        if fix["id"] in ids:
+            assert result["eta_minutes"] == eta_minutes
+            assert stored(app, fix["id"]) == (fix["lat"], fix["lng"], eta_minutes)
+
+
+def test_recompute_writes_only_changed_etas_and_skips_given_ids():
+    app = create_app()
+    ids = add_patients(app, 3)
+    with app.app_context():
+        first = ETAEngine().recompute_en_route(6, skip_ids=[ids[2]])
+        second = ETAEngine().recompute_en_route(6, skip_ids=[ids[2]])
+
+    assert first == {"en_route": 2, "updated": 2, "skipped": 1}
+    assert second == {"en_route": 2, "updated": 0, "skipped": 1}
+    assert stored(app, ids[2])[2] == 99
+    assert stored(app, ids[0])[2] != 99
+
+
+def test_pings_are_written_in_one_batched_flush():
+    app = create_app()
+    ids = add_patients(app, 2)
+    now = time.time()
+    with app.app_context():
+        for step in range(5):
+            for intake_id in ids:
+                summary = position_tracker.ping(intake_id, START[0] - 0.005 * step, START[1], at=now - 50 + step * 10)
+
+    # Nothing is written per ping, then one flush writes the latest fix of each patient
+    assert stored(app, ids[0]) == (START[0], START[1], 99)
+    rows_before = position_tracker.rows_written
+    assert position_tracker.flush() == 2
+    assert position_tracker.rows_written == rows_before + 2
+    assert stored(app, ids[1]) == (START[0] - 0.02, START[1], summary["eta_minutes"])
+
+    # Without new pings there is nothing to write
+    assert position_tracker.flush() == 0
+
+
+def test_position_report_for_tracked_patient_is_not_overwritten_by_flush():
+    """A newer batch report must survive the tracker's next flush"""
+    app = create_app()
+    intake_id = add_patients(app, 1)[0]
+    client = app.test_client()
+    with app.app_context():
+        position_tracker.ping(intake_id, -26.12, 28.05, at=time.time() - 30)
+
+    response = client.post("/intake/positions", json={"positions": [{"id": intake_id, "lat": -26.17, "lng": 28.05}]})
+    assert response.status_code == 200
+    eta_minutes = response.get_json()["positions"][0]["eta_minutes"]
+    assert eta_minutes is not None
+
+    position_tracker.flush()
+    assert stored(app, intake_id) == (-26.17, 28.05, eta_minutes)
+    assert position_tracker.recent(intake_id)[-1]["lat"] == -26.17
+
+
+def test_recompute_leaves_tracked_patients_to_the_tracker():
+    app = create_app()
+    tracked, untracked = add_patients(app, 2)
+    with app.app_context():
+        summary = position_tracker.ping(tracked, -26.14, 28.05)
+    position_tracker.flush()
+
+    response = app.test_client().post("/dashboard/etas/recompute")
+    assert response.status_code == 200
+    assert response.get_json()["skipped"] == 1
+    assert stored(app, tracked)[2] == summary["eta_minutes"]
+    assert stored(app, untracked)[2] != 99
+
+
+def test_flush_never_writes_over_a_newer_fix_from_another_process():
+    app = create_app()
+    intake_id = add_patients(app, 1)[0]
+    with app.app_context():
+        position_tracker.ping(intake_id, -26.12, 28.05, at=time.time() - 60)
+    set_position(app, intake_id, -26.18, 28.05, 7, datetime.utcnow() - timedelta(seconds=10))
+
+    stale_before = position_tracker.rows_stale
+    assert position_tracker.flush() == 0
+    assert position_tracker.rows_stale == stale_before + 1
+    assert stored(app, intake_id) == (-26.18, 28.05, 7)
+
+    # A newer ping from this process does replace it
+    with app.app_context():
+        summary = position_tracker.ping(intake_id, -26.19, 28.05)
+    assert position_tracker.flush() == 1
+    assert stored(app, intake_id) == (-26.19, 28.05, summary["eta_minutes"])
+
+
+def test_engine_writes_skip_rows_changed_by_another_process():
+    app = create_app()
+    reported, recomputed = add_patients(app, 2)
+    # Another process stored a fix for the first patient that is newer than this report
+    set_position(app, reported, -26.18, 28.05, 7, datetime.utcnow() + timedelta(minutes=1))
+    with app.app_context():
+        ETAEngine().apply_position_fixes([{"id": reported, "lat": -26.13, "lng": 28.05}])
+    assert stored(app, reported) == (-26.18, 28.05, 7)
+
+    # The second patient's position changed after the recompute read it
+    with app.app_context():
+        written = ETAEngine()._write_etas([{"id": recomputed, "position_at": None, "eta_minutes": 1}])
+    assert written == 1
+    set_position(app, recomputed, -26.18, 28.05, 7, datetime.utcnow())
+    with app.app_context():
+        written = ETAEngine()._write_etas([{"id": recomputed, "position_at": None, "eta_minutes": 1}])
+    assert written == 0
+    assert stored(app, recomputed)[2] == 7
+
+
+def test_stop_is_registered_once(monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, "register", registered.append)
+    tracker = PositionTracker(flush_interval=0.01)
+    for _ in range(3):
+        tracker._ensure_flusher()
+        tracker.stop()
+    assert registered == [tracker.stop]
+
+
+if __name__ == "__main__":
+    print("ETA engine and position tracker tests")
+    for test in (test_engine_matches_scalar_eta, test_recompute_writes_only_changed_etas_and_skips_given_ids,
+                 test_pings_are_written_in_one_batched_flush,
+                 test_position_report_for_tracked_patient_is_not_overwritten_by_flush,
+                 test_recompute_leaves_tracked_patients_to_the_tracker,
+                 test_flush_never_writes_over_a_newer_fix_from_another_process,
+                 test_engine_writes_skip_rows_changed_by_another_process):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression tests for the dashboard and intake endpoints.
+
+Every endpoint below is called against a throwaway SQLite database, each SELECT it
+issues is recorded, and EXPLAIN QUERY PLAN must show no full scan of
+patient_intake or mood_entries. Queries that have to read every row are
+listed in ALLOWED_SCANS with the reason.
+
+Run with: python -m pytest test_query_plans.py  (or python test_query_plans.py)
+"""
+
+import os
+import re
+import json
+import tempfile
+from datetime import datetime, timedelta, date
+
+from flask import Flask
+from sqlalchemy import event
+
+from config import Config
+from models import db, PatientIntake, MoodEntry
+from routes.intake import intake_bp
+from routes.dashboard import dashboard_bp
+from services.spatial_index import spatial_index
+from services.eta_engine import ETAEngine
+from services.eta_enrichment import eta_enricher
+
+# Tables that must never be scanned in full outside ALLOWED_SCANS
+INDEXED_TABLES = {"patient_intake", "mood_entries"}
+
+# (pattern matched against the whitespace-normalised SQL, reason)
+ALLOWED_SCANS = [
+    (r"^SELECT count\(\*\) AS count_1 FROM \(SELECT .* FROM patient_intake( ORDER BY .*)?\) AS anon_1$",
+     "total patient count"),
+    (r"^SELECT [^()]* FROM patient_intake$", "GET /intake lists every patient"),
+    (r"^SELECT count\(\*\) AS total, sum\(CASE WHEN", "dashboard counts: every count in one pass (services/dashboard_stats.py)"),
+    (r"WHERE patient_intake\.pregnancy_complications IS NOT NULL$", "complication types are tallied from every row that has one"),
+    (r"FROM patient_intake ORDER BY CASE WHEN", "severity sort over all patients"),
+]
+
+DASHBOARD_ENDPOINTS = [
+    "/dashboard/stats",
+    "/dashboard/summary",
+    "/dashboard/pregnancy-analytics",
+    "/dashboard/patients",
+    "/dashboard/patients?sort_order=asc",
+    "/dashboard/patients?severity=critical",
+    "/dashboard/patients?severity=urgent&sort_by=severity",
+    "/dashboard/patients?sort_by=severity",
+    "/dashboard/patients?facility=MAIN",
+    "/dashboard/patients/1",
+    "/dashboard/updates",
+    "/dashboard/updates?since=2024-01-01T00:00:00",
+    "/dashboard/map?min_lat=-26.3&min_lng=27.9&max_lat=-26.1&max_lng=28.1",
+    "/dashboard/map?lat=-26.2&lng=28.0&radius_km=5",
+]
+
+INTAKE_ENDPOINTS = [
+    "/intake",
+    "/intake/1",
+    "/mood-tracker",
+    "/mood-tracker?patient_id=1",
+    "/mood-tracker?start_date=2024-01-01&end_date=2024-12-31",
+    "/mood-tracker/stats",
+    "/mood-tracker/stats?patient_id=1",
+]
+
+_app = None
+
+
+def create_app():
+    """Flask app with the dashboard and intake routes on a seeded temporary database"""
+    global _app
+    if _app is not None:
+        return _app
+
+    path = os.path.join(tempfile.mkdtemp(), "plans.db")
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    app.register_blueprint(intake_bp)
+    app.register_blueprint(dashboard_bp)
+
+    with app.app_context():
+        db.create_all()
+        spatial_index.install()
+        now = datetime.utcnow()
+        colors = ["R", "Y", "G"]
+        trimesters = ["First", "Second", "Third"]
+        for i in range(300):
+            db.session.add(PatientIntake(
+                name=f"Patient {i}", age=16 + i % 30, contact="0820000000", symptoms="pain",
+                arrival_mode="car", car_location=json.dumps({"lat": -26.2 + i * 0.001, "lng": 28.0}),
+                car_lat=-26.2 + i * 0.001, car_lng=28.0, eta_minutes=10 + i % 40, eta_status="calculated",
+                facility_code="MAIN", pregnancy_week=1 + i % 40, trimester=trimesters[i % 3],
+                color_code=colors[i % 3], severity_level="Light", created_at=now - timedelta(hours=i)
+            ))
+            db.session.add(MoodEntry(patient_id=1 + i % 10, date=date.today() - timedelta(days=i), mood="good"))
+        db.session.commit()
+
+    _app = app
+    return app
+
+
+def full_scans(app, statements):
+    """
+    EXPLAIN QUERY PLAN each recorded statement
+
+    Returns:
+        (sql, plan detail) for every full scan of an indexed table not in ALLOWED_SCANS
+    """
+    scans = []
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for statement, parameters in statements:
+                sql = " ".join(statement.split())
+                if any(re.search(pattern, sql) for pattern, _ in ALLOWED_SCANS):
+                    continue
+                # Walking an index in ORDER BY order stops after LIMIT rows, so that is not a full scan
+                ordered_walk = " LIMIT " in sql
+                for row in cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall():
+                    words = row[-1].split()
+                    if words[:1] != ["SCAN"] or len(words) < 2 or words[1] not in INDEXED_TABLES:
+                        continue
+                    if ordered_walk and "USING INDEX" in row[-1]:
+                        continue
+                    scans.append((sql, row[-1]))
+        finally:
+            connection.close()
+    return scans
+
+
+def record_selects(app, run):
+    """Call run() and return every SELECT it sent to the database as (statement, parameters)"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def check_endpoints(endpoints):
+    app = create_app()
+    client = app.test_client()
+
+    def run():
+        for url in endpoints:
+            response = client.get(url)
+            assert response.status_code == 200, f"{url} returned {response.status_code}: {response.get_data(as_text=True)}"
+
+    statements = record_selects(app, run)
+    assert statements, "no queries were recorded"
+    scans = full_scans(app, statements)
+    for sql, detail in scans:
+        print(f"❌ {detail}\n   {sql}")
+    assert not scans, f"{len(scans)} queries fall back to a full table scan"
+
+
+def test_dashboard_queries_use_indexes():
+    """Every dashboard query is answered from an index"""
+    check_endpoints(DASHBOARD_ENDPOINTS)
+
+
+def test_intake_queries_use_indexes():
+    """Every intake and mood-tracker read is answered from an index"""
+    check_endpoints(INTAKE_ENDPOINTS)
+
+
+def test_background_queries_use_indexes():
+    """Bulk ETA recomputation and resuming pending ETAs use indexes"""
+    app = create_app()
+
+    def run():
+        with app.app_context():
+            ETAEngine().recompute_en_route(6)
+            eta_enricher.resume_pending()
+
+    scans = full_scans(app, record_selects(app, run))
+    for sql, detail in scans:
+        print(f"❌ {detail}\n   {sql}")
+    assert not scans, f"{len(scans)} queries fall back to a full table scan"
+
+
+if __name__ == "__main__":
+    print("Query plan regression tests")
+    for test in (test_dashboard_queries_use_indexes, test_intake_queries_use_indexes, test_background_queries_use_indexes):
+        test()
+        print(f"✅ {test.__name__}")
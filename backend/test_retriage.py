@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the resumable re-triage job (retriage.py).
+
+A small run is interrupted after its second committed chunk and then resumed:
+the resumed run must only score the rows after the checkpoint. Resuming with a
+different ruleset version must be refused.
+
+Run with: python -m pytest test_retriage.py  (or python test_retriage.py)
+"""
+
+import os
+import json
+import tempfile
+
+from flask import Flask
+
+import retriage
+from config import Config
+from models import db, PatientIntake
+from services.triage_ruleset import DEFAULT_RULESET_PATH
+
+ROWS = 25
+CHUNK_SIZE = 5
+
+
+class Interrupted(Exception):
+    """Stands in for the job being killed"""
+
+
+def create_app(directory):
+    """Flask app on a temporary database of ROWS intakes, all stored as Green"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(directory, 'retriage.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for i in range(ROWS):
+            db.session.add(PatientIntake(
+                name=f"Patient {i}", age=25, contact="0820000000", arrival_mode="car",
+                symptoms="severe vaginal bleeding" if i % 2 else "routine checkup",
+                ticket_number=f"G{i:03d}", severity_level="Light", color_code="G"
+            ))
+        db.session.commit()
+    return app
+
+
+def stored_colors(app):
+    with app.app_context():
+        return dict(db.session.query(PatientIntake.id, PatientIntake.color_code).all())
+
+
+def test_interrupted_run_resumes_after_checkpoint(monkeypatch):
+    """An interrupted run picks up after the last committed chunk and finishes the rest"""
+    directory = tempfile.mkdtemp()
+    app = create_app(directory)
+    checkpoint = os.path.join(directory, "checkpoint.json")
+
+    save_checkpoint = retriage.save_checkpoint
+    saved = []
+
+    def save_then_interrupt(path, last_id, ruleset_version):
+        save_checkpoint(path, last_id, ruleset_version)
+        saved.append(last_id)
+        if len(saved) == 2:
+            raise Interrupted()
+
+    monkeypatch.setattr(retriage, "save_checkpoint", save_then_interrupt)
+    try:
+        retriage.retriage(app, DEFAULT_RULESET_PATH, chunk_size=CHUNK_SIZE, workers=1, checkpoint_path=checkpoint)
+        raise AssertionError("the run was not interrupted")
+    except Interrupted:
+        pass
+
+    assert retriage.load_checkpoint(checkpoint)[0] == 2 * CHUNK_SIZE
+    colors = stored_colors(app)
+    assert all(colors[i] == "Y" for i in range(2, 2 * CHUNK_SIZE + 1, 2))
+    assert all(colors[i] == "G" for i in range(2 * CHUNK_SIZE + 1, ROWS + 1))
+
+    monkeypatch.setattr(retriage, "save_checkpoint", save_checkpoint)
+    transitions = retriage.retriage(app, DEFAULT_RULESET_PATH, chunk_size=CHUNK_SIZE, workers=1,
+                                    checkpoint_path=checkpoint, resume=True)
+
+    # Only the rows after the checkpoint were scored again
+    assert sum(transitions.values()) == len(range(2 * CHUNK_SIZE + 2, ROWS + 1, 2))
+    colors = stored_colors(app)
+    assert all(colors[i] == ("Y" if i % 2 == 0 else "G") for i in range(1, ROWS + 1))
+    assert not os.path.exists(checkpoint)
+
+
+def test_resume_with_other_ruleset_version_is_refused():
+    """A checkpoint from another ruleset version is not resumed"""
+    directory = tempfile.mkdtemp()
+    app = create_app(directory)
+    checkpoint = os.path.join(directory, "checkpoint.json")
+    with open(checkpoint, "w") as f:
+        json.dump({"last_id": CHUNK_SIZE, "ruleset_version": "0-older"}, f)
+
+    try:
+        retriage.retriage(app, DEFAULT_RULESET_PATH, chunk_size=CHUNK_SIZE, workers=1,
+                          checkpoint_path=checkpoint, resume=True)
+        raise AssertionError("resumed with a different ruleset version")
+    except ValueError as e:
+        assert "0-older" in str(e)
+
+    # Nothing was written and the checkpoint is left for the operator
+    assert set(stored_colors(app).values()) == {"G"}
+    assert retriage.load_checkpoint(checkpoint) == (CHUNK_SIZE, "0-older")
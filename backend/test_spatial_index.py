@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the spatial index: box and radius queries through the R*Tree must
+return the same patients as a brute-force scan, and the triggers must keep the
+index in sync as positions change.
+
+Run with: python -m pytest test_spatial_index.py  (or python test_spatial_index.py)
+"""
+
+import os
+import random
+import tempfile
+
+from flask import Flask
+
+from config import Config
+from models import db, PatientIntake
+from services.spatial_index import SpatialIndex
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'spatial.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def add_positions(rng, count):
+    """Store patients at random positions around Johannesburg, some without a position"""
+    patients = []
+    for i in range(count):
+        position = (rng.uniform(-26.5, -25.8), rng.uniform(27.7, 28.4)) if i % 10 else (None, None)
+        patients.append(PatientIntake(name=f"Patient {i}", age=30, contact="0820000000", symptoms="pain",
+                                      arrival_mode="car", car_lat=position[0], car_lng=position[1]))
+    db.session.add_all(patients)
+    db.session.commit()
+    return {p.id: (p.car_lat, p.car_lng) for p in patients if p.car_lat is not None}
+
+
+def ids(query):
+    return sorted(row.id for row in query.all())
+
+
+def in_box(positions, min_lat, min_lng, max_lat, max_lng):
+    return sorted(i for i, (lat, lng) in positions.items()
+                  if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng)
+
+
+def in_radius(positions, lat, lng, radius_km):
+    items = list(positions.items())
+    distances = SpatialIndex.distances_km(lat, lng, [p for _, p in items])
+    return sorted(i for (i, _), d in zip(items, distances) if d <= radius_km)
+
+
+def test_queries_match_brute_force():
+    rng = random.Random(3)
+    app = create_app()
+    with app.app_context():
+        positions = add_positions(rng, 500)
+        index = SpatialIndex()
+        assert index.install()
+        for _ in range(30):
+            lat, lng = rng.uniform(-26.5, -25.8), rng.uniform(27.7, 28.4)
+            half = rng.uniform(0.01, 0.2)
+            box = (lat - half, lng - half, lat + half, lng + half)
+            assert ids(index.within_box(*box)) == in_box(positions, *box)
+            radius_km = rng.uniform(1, 25)
+            assert ids(index.within_radius(lat, lng, radius_km)) == in_radius(positions, lat, lng, radius_km)
+        assert index.stats()["box_queries"] == 30 and index.stats()["radius_queries"] == 30
+
+
+def test_index_follows_position_changes():
+    app = create_app()
+    with app.app_context():
+        # Rows written before the index exists are picked up on install
+        positions = add_positions(random.Random(5), 20)
+        index = SpatialIndex()
+        assert index.install()
+        moved, removed = list(positions)[:2]
+
+        db.session.get(PatientIntake, moved).car_lat = -25.0
+        db.session.delete(db.session.get(PatientIntake, removed))
+        db.session.commit()
+
+        assert ids(index.within_box(-25.1, 27.0, -24.9, 29.0)) == [moved]
+        everything = ids(index.within_box(-27.0, 27.0, -25.0, 29.0))
+        assert removed not in everything
+        assert len(everything) == len(positions) - 1
+
+
+if __name__ == "__main__":
+    print("Spatial index tests")
+    for test in (test_queries_match_brute_force, test_index_follows_position_changes):
+        test()
+        print(f"✅ {test.__name__}")
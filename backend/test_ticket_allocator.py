@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the ticket allocator: allocators sharing one database (as worker
+processes do) never issue the same ticket number, even from many threads.
+
+Run with: python -m pytest test_ticket_allocator.py  (or python test_ticket_allocator.py)
+"""
+
+import os
+import tempfile
+import threading
+
+from flask import Flask
+
+from config import Config
+from models import db
+from services.ticket_allocator import TicketAllocator
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tickets.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def test_sequences_are_per_prefix_and_continue_across_blocks():
+    app = create_app()
+    allocator = TicketAllocator(block_size=3)
+    with app.app_context():
+        reds = [allocator.allocate("R") for _ in range(5)]
+        yellow = allocator.allocate("Y")
+    assert reds == ["R001", "R002", "R003", "R004", "R005"]
+    assert yellow == "Y001"
+
+
+def test_allocators_sharing_a_database_never_collide():
+    app = create_app()
+    allocators = [TicketAllocator(block_size=4) for _ in range(3)]
+    issued = []
+    lock = threading.Lock()
+
+    def worker(allocator):
+        with app.app_context():
+            tickets = [allocator.allocate("G") for _ in range(25)]
+        with lock:
+            issued.extend(tickets)
+
+    threads = [threading.Thread(target=worker, args=(allocators[i % 3],)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(issued) == 150
+    assert len(set(issued)) == 150
+
+
+if __name__ == "__main__":
+    print("Ticket allocator tests")
+    for test in (test_sequences_are_per_prefix_and_continue_across_blocks,
+                 test_allocators_sharing_a_database_never_collide):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the triage assessment cache.
+
+A cached assessment must always equal the uncached one, also when the ruleset
+moves the age and pregnancy-week band limits.
+
+Run with: python -m pytest test_triage_cache.py  (or python test_triage_cache.py)
+"""
+
+import json
+
+from services.triage_ruleset import DEFAULT_RULESET_PATH, TriageRuleset
+from services.triage_cache import TriageCache
+from services.emergency_classifier import EmergencyClassifier
+
+
+def tuned_ruleset(**limits):
+    """The shipped ruleset with some band limits changed"""
+    with open(DEFAULT_RULESET_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    data["limits"].update(limits)
+    data["version"] = f"{data['version']}-tuned"
+    return TriageRuleset(data)
+
+
+def test_cache_hit_matches_uncached_score():
+    """Repeated inputs are served from the cache with the same result"""
+    cache = TriageCache()
+    classifier = EmergencyClassifier(ruleset=TriageRuleset.load(DEFAULT_RULESET_PATH), cache=cache)
+    first = classifier.assess("spotting", 25, pregnancy_week=20)
+    second = classifier.assess("spotting", 27, pregnancy_week=22)
+    assert second is first
+    assert cache.hits == 1
+
+
+def test_cache_key_follows_tuned_age_limits():
+    """A 19 year old is a teen under teen_age_below=20 and must not share a 25 year old's entry"""
+    ruleset = tuned_ruleset(teen_age_below=20)
+    cached = EmergencyClassifier(ruleset=ruleset, cache=TriageCache())
+    uncached = EmergencyClassifier(ruleset=ruleset, cache=None)
+
+    for age in (25, 19, 17, 40):
+        assert cached.assess("spotting", age).score == uncached.assess("spotting", age).score, age
+    assert cached.assess("spotting", 19).score == cached.assess("spotting", 25).score + ruleset.points["teen_age"]
+
+
+def test_cache_key_follows_tuned_week_limits():
+    """Week bands come from the ruleset limits too"""
+    ruleset = tuned_ruleset(early_week_below=16, late_week_above=30)
+    cached = EmergencyClassifier(ruleset=ruleset, cache=TriageCache())
+    uncached = EmergencyClassifier(ruleset=ruleset, cache=None)
+
+    for week in (20, 14, 32, 10, 38):
+        assert cached.assess("spotting", 25, pregnancy_week=week).score == \
+            uncached.assess("spotting", 25, pregnancy_week=week).score, week
+
+
+def test_cache_hit_keeps_each_callers_risk_conditions():
+    """Patients sharing a cache entry still store their own risk conditions"""
+    cache = TriageCache()
+    classifier = EmergencyClassifier(ruleset=TriageRuleset.load(DEFAULT_RULESET_PATH), cache=cache)
+    first = classifier.assess("spotting", 25, ["Diabetes", "Hypertension"], pregnancy_week=20)
+    second = classifier.assess("spotting", 25, ["hypertension", "diabetes"], pregnancy_week=20)
+    assert cache.hits == 1
+    assert second.score == first.score
+    assert first.to_analysis()["risk_conditions"] == ["Diabetes", "Hypertension"]
+    assert second.to_analysis()["risk_conditions"] == ["hypertension", "diabetes"]
+
+    ticketed = classifier.triage("spotting", 25, ["HYPERTENSION", "Diabetes"], pregnancy_week=20)
+    assert json.loads(ticketed.to_json())["risk_conditions"] == ["HYPERTENSION", "Diabetes"]
+    assert first.to_analysis()["risk_conditions"] == ["Diabetes", "Hypertension"]
+
+
+if __name__ == "__main__":
+    print("Triage cache tests")
+    for test in (test_cache_hit_matches_uncached_score, test_cache_key_follows_tuned_age_limits,
+                 test_cache_key_follows_tuned_week_limits, test_cache_hit_keeps_each_callers_risk_conditions):
+        test()
+        print(f"✅ {test.__name__}")